@@ -19,10 +19,14 @@ Enhanced Features:
 
 from __future__ import annotations
 
+import argparse
+import hashlib
+import importlib.util
 import json
 import logging
 import os
 import queue
+import re
 import shutil
 import sqlite3
 import subprocess
@@ -30,11 +34,17 @@ import sys
 import tempfile
 import threading
 import time
-from collections import deque
+import wave
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import ExitStack, contextmanager, suppress
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Deque
+from typing import Any
 
 import numpy as np
 
@@ -72,6 +82,22 @@ except ImportError:
     WhisperModel = None
     WHISPER_AVAILABLE = False
 
+# FLAC decoding for the replay audio backend (WAV needs only the stdlib)
+try:
+    import soundfile
+    SOUNDFILE_AVAILABLE = True
+except ImportError:
+    soundfile = None
+    SOUNDFILE_AVAILABLE = False
+
+# VAD deps (optional engine)
+try:
+    import webrtcvad
+    WEBRTCVAD_AVAILABLE = True
+except ImportError:
+    webrtcvad = None
+    WEBRTCVAD_AVAILABLE = False
+
 # Wake word deps
 try:
     import openwakeword
@@ -82,13 +108,18 @@ except ImportError:
     OWWModel = None
     OWW_AVAILABLE = False
 
-# Embedding deps for semantic search
+# Embedding deps for semantic search. sentence-transformers pulls in torch,
+# so it is only probed here and imported when that backend is selected.
+EMBEDDINGS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+
 try:
-    from sentence_transformers import SentenceTransformer
-    EMBEDDINGS_AVAILABLE = True
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNX_EMBEDDINGS_AVAILABLE = True
 except ImportError:
-    SentenceTransformer = None
-    EMBEDDINGS_AVAILABLE = False
+    ort = None
+    Tokenizer = None
+    ONNX_EMBEDDINGS_AVAILABLE = False
 
 # Keyboard interrupt support (Phase H P1.1)
 try:
@@ -114,7 +145,7 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def load_config() -> Dict[str, Any]:
+def load_config() -> dict[str, Any]:
     """Load YAML config from the canonical voice.yaml path."""
     if not CONFIG_PATH.exists():
         # Create default config if missing
@@ -188,7 +219,7 @@ def load_config() -> Dict[str, Any]:
     return cfg
 
 
-def ensure_logger(log_cfg: Dict[str, Any]) -> Tuple[logging.Logger, str]:
+def ensure_logger(log_cfg: dict[str, Any]) -> tuple[logging.Logger, str]:
     """Set up file + stdout logger."""
     ts = datetime.now().strftime("%Y%m%d")
     log_path = LOG_DIR / f"voice_loop-{ts}.log"
@@ -220,7 +251,7 @@ def now_iso() -> str:
     return datetime.now().isoformat(timespec="seconds")
 
 
-def log_event(logger: logging.Logger, kind: str, payload: Dict[str, Any]):
+def log_event(logger: logging.Logger, kind: str, payload: dict[str, Any]):
     try:
         logger.info("%s %s", kind, json.dumps(payload))
     except Exception:
@@ -231,10 +262,909 @@ def log_event(logger: logging.Logger, kind: str, payload: Dict[str, Any]):
 # Memory System with SQLite FTS5
 # =========================
 
+class SQLitePool:
+    """Long-lived SQLite connections: one shared writer plus per-thread readers.
+
+    Connections stay open for the life of the process so a turn never pays
+    connect/teardown cost. sqlite3's statement cache keeps the prepared
+    statements for the fixed MemoryStore queries warm.
+    """
+
+    def __init__(self, db_path: Path, logger: logging.Logger, cfg: dict[str, Any]):
+        self.db_path = db_path
+        self.logger = logger
+        self.mmap_size = int(cfg.get("sqlite_mmap_mb", 256)) * 1024 * 1024
+        self.cache_kib = int(cfg.get("sqlite_cache_mb", 32)) * 1024
+        self.statement_cache = int(cfg.get("sqlite_statement_cache", 256))
+        self.busy_timeout_ms = int(cfg.get("sqlite_busy_timeout_ms", 5000))
+
+        self.write_lock = threading.RLock()
+        self._writer: sqlite3.Connection | None = None
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the tuned pragmas applied."""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.statement_cache,
+            timeout=self.busy_timeout_ms / 1000.0,
+            uri=True,  # lets ATTACH open cold shards as read-only file: URIs
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_kib}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        return conn
+
+    @contextmanager
+    def write(self):
+        """Yield the shared writer connection; commit on success, roll back on error."""
+        with self.write_lock:
+            if self._closed:
+                raise RuntimeError("sqlite pool closed")
+            if self._writer is None:
+                self._writer = self._connect()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+
+    def reader(self) -> sqlite3.Connection:
+        """Return this thread's read connection, opening it on first use."""
+        if self._closed:
+            raise RuntimeError("sqlite pool closed")
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self):
+        """Close the writer and every reader opened by any thread."""
+        with self.write_lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._writer is not None:
+                with suppress(sqlite3.Error):
+                    self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._readers:
+                with suppress(sqlite3.Error):
+                    conn.close()
+            count = len(self._readers)
+            self._readers.clear()
+        self.logger.info("sqlite_pool_closed %s", json.dumps({"readers": count}))
+
+
+def sqlite_utc_now() -> str:
+    """UTC timestamp in SQLite CURRENT_TIMESTAMP format."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def normalize_sqlite_ts(value: Any) -> str | None:
+    """Any ISO-8601 timestamp as a stored UTC "%Y-%m-%d %H:%M:%S" string; None if unparseable.
+
+    Offsets (including a trailing Z) are converted to UTC; naive values are
+    taken to be UTC already, like CURRENT_TIMESTAMP.
+    """
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def sqlite_ts_to_epoch(ts: str) -> float:
+    """Epoch seconds for a stored timestamp, read as naive local time like the original recency math."""
+    return datetime.fromisoformat(ts).timestamp()
+
+
+EMBEDDING_FORMATS = ("float32", "float16", "int8")
+
+
+class EmbeddingCodec:
+    """Embedding storage format shared by the DB column, the sidecar and the matrix.
+
+    ``float32``/``float16`` store the unit-normalised vector; ``int8`` stores a
+    float32 per-vector scale followed by the quantized unit vector.
+    ``float32-raw`` is the legacy un-normalised format, read only for
+    migration. One encoded BLOB is exactly one record of ``record_dtype``.
+    """
+
+    def __init__(self, fmt: str = "float32"):
+        if fmt not in EMBEDDING_FORMATS + ("float32-raw",):
+            raise ValueError(f"unknown embedding format: {fmt}")
+        self.fmt = fmt
+        self.vec_dtype = {"float16": np.dtype("<f2"), "int8": np.dtype("i1")}.get(fmt, np.dtype("<f4"))
+        self.header_bytes = 4 if fmt == "int8" else 0
+
+    def dim_for(self, nbytes: int) -> int:
+        return (nbytes - self.header_bytes) // self.vec_dtype.itemsize
+
+    def record_dtype(self, dim: int) -> np.dtype:
+        if self.fmt == "int8":
+            return np.dtype([("scale", "<f4"), ("v", "i1", (dim,))])
+        return np.dtype([("v", self.vec_dtype, (dim,))])
+
+    def quantize(self, vec: np.ndarray) -> tuple[np.ndarray, float]:
+        """Unit-normalise and quantize; returns (stored vector, scale)."""
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        if self.fmt == "float32-raw":
+            return vec, 1.0
+        norm = float(np.linalg.norm(vec))
+        unit = vec / norm if norm > 0 else vec
+        if self.fmt == "int8":
+            peak = float(np.max(np.abs(unit))) if unit.size else 0.0
+            scale = peak / 127.0 if peak > 0 else 1.0
+            return np.round(unit / scale).astype(np.int8), scale
+        return unit.astype(self.vec_dtype), 1.0
+
+    def pack(self, stored: np.ndarray, scale: float) -> bytes:
+        if self.fmt == "int8":
+            return np.float32(scale).tobytes() + stored.tobytes()
+        return stored.tobytes()
+
+    def encode(self, vec: np.ndarray) -> bytes:
+        return self.pack(*self.quantize(vec))
+
+    def unpack(self, blob: bytes) -> tuple[np.ndarray, float]:
+        """Stored vector and scale from a BLOB, without dequantizing."""
+        if self.fmt == "int8":
+            scale = float(np.frombuffer(blob, dtype="<f4", count=1)[0])
+            return np.frombuffer(blob, dtype=np.int8, offset=4), scale
+        return np.frombuffer(blob, dtype=self.vec_dtype), 1.0
+
+    def decode(self, blob: bytes) -> np.ndarray:
+        """Float32 vector from a BLOB."""
+        stored, scale = self.unpack(blob)
+        return stored.astype(np.float32) * scale
+
+
+class EmbeddingSidecar:
+    """Append-only vector file next to memory.db, keyed by conversations.id.
+
+    Row ``id`` lives at slot ``id - 1`` as one codec record (the same bytes
+    as its BLOB); rows without an embedding are zero-filled holes. Records
+    are read back through ``np.memmap`` so a restart maps the file instead
+    of copying BLOBs out of SQLite.
+    """
+
+    def __init__(self, path: Path, codec: EmbeddingCodec):
+        self.path = path
+        self.meta_path = path.with_name(path.name + ".json")
+        self.codec = codec
+        self.dim: int | None = None
+        self._fh = None
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text())
+            # A sidecar written in another format is treated as empty (forces a rebuild)
+            if meta.get("format") == codec.fmt:
+                self.dim = meta.get("dim")
+
+    @property
+    def row_bytes(self) -> int:
+        return self.codec.record_dtype(self.dim or 0).itemsize
+
+    def rows(self) -> int:
+        """Number of slots currently in the file."""
+        if not self.dim or not self.path.exists():
+            return 0
+        return self.path.stat().st_size // self.row_bytes
+
+    def init(self, dim: int):
+        """Create an empty sidecar for ``dim``-wide vectors."""
+        self.close()
+        self.dim = dim
+        self.path.write_bytes(b"")
+        self.write_meta()
+
+    def write_meta(self):
+        self.meta_path.write_text(json.dumps({"dim": self.dim, "format": self.codec.fmt}))
+
+    def write(self, slot: int, record: bytes):
+        """Write one record at ``slot``; seeking past EOF leaves zero-filled holes."""
+        if self._fh is None:
+            # Long-lived handle reused across writes; released in close()
+            self._fh = open(self.path, "r+b")  # noqa: SIM115
+        self._fh.seek(slot * self.row_bytes)
+        self._fh.write(record)
+        self._fh.flush()
+
+    def view(self, rows: int) -> np.ndarray:
+        """Read-only structured memmap over the first ``rows`` slots."""
+        dtype = self.codec.record_dtype(self.dim or 0)
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", shape=(rows,))
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+class EmbeddingMatrix:
+    """Contiguous embedding matrix with parallel row-id, epoch, norm and scale arrays.
+
+    Rows are appended in place (amortised doubling) so semantic search scores
+    the whole history with a single mat-vec instead of a per-row Python loop.
+    Vectors are held in the codec's compact dtype and scored chunk-wise, so
+    float16/int8 storage keeps its RAM saving at query time. With a sidecar
+    the vectors are a memmap of the sidecar file instead, and position ``i``
+    holds row id ``i + 1`` (holes carry a NaN timestamp).
+    """
+
+    SCORE_CHUNK = 65536
+
+    def __init__(self, dim: int | None = None, capacity: int = 1024,
+                 sidecar: EmbeddingSidecar | None = None,
+                 codec: EmbeddingCodec | None = None):
+        self.lock = threading.Lock()
+        self.sidecar = sidecar
+        self.codec = codec or (sidecar.codec if sidecar else EmbeddingCodec())
+        self.dim = dim or (sidecar.dim if sidecar else None)
+        self.count = 0
+        self._capacity = max(16, capacity)
+        self.ids = np.empty(self._capacity, dtype=np.int64)
+        self.ts = np.empty(self._capacity, dtype=np.float64)
+        self.norms = np.empty(self._capacity, dtype=np.float32)
+        self.scales = np.empty(self._capacity, dtype=np.float32)
+        self.vecs: np.ndarray | None = None
+        if self.dim and sidecar is None:
+            self.vecs = np.empty((self._capacity, self.dim), dtype=self.codec.vec_dtype)
+
+    @staticmethod
+    def stored_norms(vecs: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        return np.linalg.norm(vecs.astype(np.float32), axis=1) * scales
+
+    def attach_sidecar(self, ts_by_id: dict[int, float]):
+        """Map the existing sidecar and fill ids, epochs, scales and norms for it."""
+        with self.lock:
+            rows = self.sidecar.rows()
+            self._grow(rows)
+            self.count = rows
+            self.ids[:rows] = np.arange(1, rows + 1)
+            self.ts[:rows] = np.nan
+            for row_id, ts in ts_by_id.items():
+                if row_id <= rows:
+                    self.ts[row_id - 1] = ts
+            records = self.sidecar.view(rows)
+            self.vecs = records["v"]
+            self.scales[:rows] = records["scale"] if self.codec.fmt == "int8" else 1.0
+            for start in range(0, rows, self.SCORE_CHUNK):
+                stop = min(rows, start + self.SCORE_CHUNK)
+                self.norms[start:stop] = self.stored_norms(self.vecs[start:stop], self.scales[start:stop])
+
+    def _grow(self, needed: int):
+        cap = self._capacity
+        while cap < needed:
+            cap *= 2
+        if cap == self._capacity:
+            return
+        for name in ("ids", "ts", "norms", "scales"):
+            old = getattr(self, name)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        if self.vecs is not None and self.sidecar is None:
+            new_vecs = np.empty((cap, self.dim), dtype=self.codec.vec_dtype)
+            new_vecs[:self.count] = self.vecs[:self.count]
+            self.vecs = new_vecs
+        self._capacity = cap
+
+    def append(self, row_id: int, vec: np.ndarray, ts: float) -> bool:
+        """Quantize and append one float vector; returns False if its dimension does not match."""
+        stored, scale = self.codec.quantize(vec)
+        return self.append_stored(row_id, stored, scale, ts)
+
+    def append_blob(self, row_id: int, blob: bytes, ts: float) -> bool:
+        """Append a vector straight from its stored BLOB."""
+        stored, scale = self.codec.unpack(blob)
+        return self.append_stored(row_id, stored, scale, ts)
+
+    def append_stored(self, row_id: int, stored: np.ndarray, scale: float, ts: float) -> bool:
+        with self.lock:
+            if self.sidecar is not None:
+                return self._append_sidecar(row_id, stored, scale, ts)
+            if self.dim is None:
+                self.dim = stored.shape[0]
+                self.vecs = np.empty((self._capacity, self.dim), dtype=self.codec.vec_dtype)
+            if stored.shape[0] != self.dim:
+                return False
+            self._grow(self.count + 1)
+            i = self.count
+            self.ids[i] = row_id
+            self.ts[i] = ts
+            self.vecs[i] = stored
+            self.scales[i] = scale
+            self.norms[i] = np.linalg.norm(stored.astype(np.float32)) * scale
+            self.count = i + 1
+            return True
+
+    def _append_sidecar(self, row_id: int, stored: np.ndarray, scale: float, ts: float) -> bool:
+        if self.dim is None:
+            self.sidecar.init(stored.shape[0])
+            self.dim = stored.shape[0]
+        if stored.shape[0] != self.dim or row_id <= self.count:
+            return False
+        pos = row_id - 1
+        self._grow(pos + 1)
+        # Rows without embeddings between the last slot and this one become holes
+        self.ids[self.count:pos] = np.arange(self.count + 1, pos + 1)
+        self.ts[self.count:pos] = np.nan
+        self.norms[self.count:pos] = 0.0
+        self.scales[self.count:pos] = 1.0
+        self.sidecar.write(pos, self.codec.pack(stored, scale))
+        self.ids[pos] = row_id
+        self.ts[pos] = ts
+        self.scales[pos] = scale
+        self.norms[pos] = np.linalg.norm(stored.astype(np.float32)) * scale
+        self.count = pos + 1
+        self.vecs = self.sidecar.view(self.count)["v"]
+        return True
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Views (ids, ts, vecs, norms, scales) of the filled prefix; safe while appends continue."""
+        with self.lock:
+            n = self.count
+            if n == 0 or self.vecs is None:
+                empty = np.empty(0, dtype=np.float32)
+                vecs = np.empty((0, self.dim or 0), dtype=self.codec.vec_dtype)
+                return np.empty(0, dtype=np.int64), empty, vecs, empty, empty
+            return self.ids[:n], self.ts[:n], self.vecs[:n], self.norms[:n], self.scales[:n]
+
+    def positions_for(self, row_ids: list[int]) -> np.ndarray:
+        """Matrix positions holding ``row_ids`` (ids are appended in ascending order)."""
+        ids = self.snapshot()[0]
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        wanted = np.unique(np.asarray(row_ids, dtype=np.int64))
+        pos = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+        return pos[ids[pos] == wanted]
+
+    def dot(self, vecs: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """``vecs @ query`` in float32, widening compact rows one chunk at a time."""
+        out = np.empty(len(vecs), dtype=np.float32)
+        for start in range(0, len(vecs), self.SCORE_CHUNK):
+            chunk = vecs[start:start + self.SCORE_CHUNK]
+            out[start:start + len(chunk)] = chunk.astype(np.float32, copy=False) @ query
+        return out
+
+    def score(self, query: np.ndarray, now: float,
+              positions: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Recency-boosted cosine score for every row (or only ``positions``); returns (ids, scores)."""
+        ids, ts, vecs, norms, scales = self.snapshot()
+        if positions is not None:
+            ids, ts, vecs, norms, scales = (
+                ids[positions], ts[positions], vecs[positions], norms[positions], scales[positions])
+        if len(ids) == 0:
+            return ids, np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        q_norm = float(np.linalg.norm(query))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = self.dot(vecs, query / q_norm) * (scales / norms)
+        age_hours = (now - ts) / 3600.0
+        recency_boost = np.maximum(0.0, 1.0 - age_hours / 720.0)  # Decay over 30 days
+        scores = similarity * (0.7 + 0.3 * recency_boost)
+        # Holes and deleted rows carry a NaN timestamp
+        scores[np.isnan(ts)] = -1.0
+        return ids, np.nan_to_num(scores, nan=-1.0).astype(np.float32)
+
+    def remove(self, row_ids: list[int]) -> int:
+        """Tombstone rows deleted from the DB; they stop scoring but keep their position."""
+        positions = self.positions_for(row_ids)
+        with self.lock:
+            self.ts[positions] = np.nan
+            self.norms[positions] = 0.0
+        return len(positions)
+
+
+class EmbeddingCache:
+    """LRU cache of text embeddings keyed by a hash of whitespace-normalised text."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> np.ndarray | None:
+        k = self.key(text)
+        with self.lock:
+            vec = self._entries.get(k)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(k)
+            self.hits += 1
+            return vec
+
+    def put(self, text: str, vec: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        vec.flags.writeable = False  # shared between callers
+        with self.lock:
+            self._entries[self.key(text)] = vec
+            self._entries.move_to_end(self.key(text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class FlatIndex:
+    """Exact search: every row of the embedding matrix is a candidate."""
+
+    kind = "flat"
+
+    def sync(self, matrix: EmbeddingMatrix):
+        pass
+
+    def candidates(self, query: np.ndarray, count: int) -> np.ndarray | None:
+        return None
+
+    def save(self):
+        pass
+
+    def load(self, matrix: EmbeddingMatrix) -> bool:
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        return {"kind": self.kind}
+
+
+class IVFFlatIndex:
+    """Inverted-file (IVF-flat) index over EmbeddingMatrix positions, pure NumPy.
+
+    Unit-normalised vectors are clustered with spherical k-means; a query
+    scores the ``nprobe`` nearest centroids and only the rows in those lists
+    (plus any rows appended since the last sync) are vector-scored. Until
+    ``train_min`` vectors exist the index returns None and search stays exact.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, path: Path, logger: logging.Logger, nlist: int = 0, nprobe: int = 8,
+                 train_min: int = 20000, kmeans_iters: int = 10):
+        self.path = path
+        self.logger = logger
+        self.nlist = nlist
+        self.nprobe = max(1, nprobe)
+        self.train_min = train_min
+        self.kmeans_iters = kmeans_iters
+        self.lock = threading.Lock()
+        self.centroids: np.ndarray | None = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self.lists: list[np.ndarray] = []
+        self.indexed = 0
+        self._matrix: EmbeddingMatrix | None = None
+        self._trainer: threading.Thread | None = None
+
+    # -- build --
+
+    @staticmethod
+    def _unit(vecs: np.ndarray, norms: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        """Float32 unit vectors from (possibly compact) stored rows."""
+        return vecs.astype(np.float32) * (scales / norms)[:, None]
+
+    @classmethod
+    def _nearest(cls, vecs: np.ndarray, norms: np.ndarray, scales: np.ndarray,
+                 centroids: np.ndarray) -> np.ndarray:
+        """Nearest-centroid list for each row; rows with zero norm (holes) get -1."""
+        out = np.full(len(vecs), -1, dtype=np.int32)
+        valid = norms > 0
+        if valid.any():
+            unit = cls._unit(vecs[valid], norms[valid], scales[valid])
+            out[valid] = np.argmax(unit @ centroids.T, axis=1)
+        return out
+
+    def _install(self, centroids: np.ndarray, assign: np.ndarray):
+        """Swap in centroids and rebuild inverted lists from a position -> list assignment."""
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(centroids))]
+        self.centroids = centroids
+        self.assign = assign
+        self.indexed = len(assign)
+
+    def sync(self, matrix: EmbeddingMatrix):
+        """Assign rows appended since the last sync; start training once enough exist."""
+        with self.lock:
+            self._matrix = matrix
+            if self.centroids is None:
+                if matrix.count >= self.train_min and self._trainer is None:
+                    self._trainer = threading.Thread(
+                        target=self._train, args=(matrix,), name="memory-ivf-train", daemon=True)
+                    self._trainer.start()
+                return
+            _, _, vecs, norms, scales = matrix.snapshot()
+            start = self.indexed
+            if start >= len(vecs):
+                return
+            new_assign = self._nearest(vecs[start:], norms[start:], scales[start:], self.centroids)
+            for lst in np.unique(new_assign[new_assign >= 0]):
+                added = start + np.flatnonzero(new_assign == lst)
+                self.lists[lst] = np.concatenate([self.lists[lst], added])
+            self.assign = np.concatenate([self.assign, new_assign])
+            self.indexed = len(self.assign)
+
+    def _train(self, matrix: EmbeddingMatrix):
+        t0 = time.time()
+        try:
+            _, _, vecs, norms, scales = matrix.snapshot()
+            n = len(vecs)
+            nlist = self.nlist or int(np.clip(np.sqrt(n), 16, 4096))
+            rng = np.random.default_rng(0)
+            valid = np.flatnonzero(norms > 0)
+            sample = rng.choice(valid, size=min(len(valid), 64 * nlist), replace=False)
+            x = self._unit(vecs[sample], norms[sample], scales[sample])
+            nlist = min(nlist, len(x))
+            centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+            for _ in range(self.kmeans_iters):
+                labels = np.argmax(x @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, x)
+                counts = np.bincount(labels, minlength=nlist)
+                empty = counts == 0
+                sums[empty] = x[rng.choice(len(x), size=int(empty.sum()))]
+                centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+
+            centroids = centroids.astype(np.float32)
+            assign = np.concatenate([
+                self._nearest(vecs[i:i + 65536], norms[i:i + 65536], scales[i:i + 65536], centroids)
+                for i in range(0, n, 65536)
+            ])
+            with self.lock:
+                self._install(centroids, assign)
+            self.sync(matrix)
+            self.save()
+            self.logger.info("ann_index_trained %s", json.dumps({
+                "kind": self.kind, "nlist": nlist, "rows": n, "ms": int((time.time() - t0) * 1000)
+            }))
+        except Exception:
+            self.logger.exception("ann_index_train_failed %s", json.dumps({"rows": matrix.count}))
+        finally:
+            # Cleared either way; after a failure the next sync starts a fresh attempt
+            with self.lock:
+                self._trainer = None
+
+    def wait_trained(self, timeout: float | None = None):
+        """Block until a background training run finishes (used by tests/tools)."""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+
+    # -- query --
+
+    def candidates(self, query: np.ndarray, count: int) -> np.ndarray | None:
+        """Matrix positions worth scoring for ``query``; None means score everything."""
+        with self.lock:
+            if self.centroids is None:
+                return None
+            q = np.asarray(query, dtype=np.float32).reshape(-1)
+            sims = self.centroids @ (q / (np.linalg.norm(q) or 1.0))
+            nprobe = min(self.nprobe, len(sims))
+            probe = np.argpartition(-sims, nprobe - 1)[:nprobe]
+            parts = [self.lists[i] for i in probe]
+            # Rows appended since the last sync are always scored
+            if count > self.indexed:
+                parts.append(np.arange(self.indexed, count, dtype=np.int64))
+            return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # -- persistence --
+
+    def save(self):
+        with self.lock:
+            if self.centroids is None:
+                return
+            tmp = self.path.with_name(self.path.name + ".tmp.npz")
+            ids = self._matrix.snapshot()[0][:self.indexed]
+            np.savez(tmp, centroids=self.centroids, assign=self.assign, ids=ids)
+            os.replace(tmp, self.path)
+
+    def load(self, matrix: EmbeddingMatrix) -> bool:
+        """Load a persisted index if it still matches the matrix, then sync the tail."""
+        if not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as data:
+                centroids, assign = data["centroids"], data["assign"]
+                saved_ids = data.get("ids")
+            ids = matrix.snapshot()[0]
+            # Positions shift when deleted rows are not reloaded; the saved ids must line up
+            if (centroids.shape[1] != matrix.dim or len(assign) > matrix.count
+                    or saved_ids is None or not np.array_equal(saved_ids, ids[:len(assign)])):
+                self.logger.warning("ann_index_stale %s", json.dumps({"path": str(self.path)}))
+                return False
+            with self.lock:
+                self._install(centroids, assign.astype(np.int32))
+            self.sync(matrix)
+            return True
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            self.logger.warning("ann_index_load_failed %s", json.dumps({"error": str(e)}))
+            return False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "trained": self.centroids is not None,
+            "nlist": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "indexed": self.indexed,
+        }
+
+
+class OnnxEmbedder:
+    """all-MiniLM-L6-v2 exported to ONNX (int8 dynamic quantization) on onnxruntime CPU.
+
+    Mirrors ``SentenceTransformer.encode``: WordPiece tokenization (HF
+    ``tokenizers``), mean pooling over the attention mask, L2 normalisation;
+    a ``str`` gives one vector and a list gives a 2-D array. Against the
+    float32 sentence-transformers model the int8 export stays within
+    cosine >= 0.99 per vector, so stored embeddings remain comparable and
+    keep the same ``embedding_model`` name.
+    """
+
+    def __init__(self, session: Any, tokenizer: Any, max_length: int = 256):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.input_names = {i.name for i in session.get_inputs()}
+        tokenizer.enable_truncation(max_length=max_length)
+        tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    @classmethod
+    def load(cls, model_dir: Path, model_file: str = "model_int8.onnx", threads: int = 2,
+             max_length: int = 256) -> OnnxEmbedder:
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(
+            str(model_dir / model_file), sess_options=opts, providers=["CPUExecutionProvider"])
+        tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        return cls(session, tokenizer, max_length=max_length)
+
+    def _run(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def encode(self, text, batch_size: int = 32, **kwargs) -> np.ndarray:
+        texts = [text] if isinstance(text, str) else list(text)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Length-sorted batches keep padding (and wasted compute) small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: list[np.ndarray | None] = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            for i, vec in zip(chunk, self._run([texts[i] for i in chunk])):
+                out[i] = vec
+        result = np.stack(out).astype(np.float32)
+        return result[0] if isinstance(text, str) else result
+
+
+class MemoryShards:
+    """Read-only monthly archives of ``conversations`` (``memory-YYYY-MM.db``).
+
+    Each shard carries its own ``conversations`` table and FTS index and is
+    ATTACHed (``mode=ro&immutable=1``) to a reader connection on demand, so
+    it is served straight from the page cache / mmap without locking.
+    Shards are discovered by globbing the directory: archiving a month is
+    writing a file, dropping one is deleting it.
+    """
+
+    PATTERN = "memory-*.db"
+
+    def __init__(self, directory: Path, logger: logging.Logger, mmap_mb: int = 256,
+                 max_attached: int = 8, matrix_cache: int = 2):
+        self.directory = directory
+        self.logger = logger
+        self.mmap_size = int(mmap_mb) * 1024 * 1024
+        self.max_attached = max(1, min(max_attached, 9))  # SQLite allows 10 attached DBs
+        self.matrix_cache = max(0, matrix_cache)
+        self.lock = threading.Lock()
+        # id(conn) -> {path: (alias, mtime_ns)} in attach order
+        self._attached: dict[int, OrderedDict[Path, tuple[str, int]]] = {}
+        self._matrices: OrderedDict[Path, tuple[int, EmbeddingMatrix]] = OrderedDict()
+        self._seq = 0
+
+    @staticmethod
+    def month_of(path: Path) -> str:
+        return path.stem[len("memory-"):]
+
+    def paths(self) -> list[Path]:
+        """Shard files, newest month first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob(self.PATTERN), reverse=True)
+
+    def attach(self, conn: sqlite3.Connection, path: Path) -> str:
+        """Schema alias for ``path`` on ``conn``, attaching (or re-attaching a replaced file) as needed."""
+        mtime = path.stat().st_mtime_ns
+        with self.lock:
+            attached = self._attached.setdefault(id(conn), OrderedDict())
+            entry = attached.get(path)
+            if entry and entry[1] == mtime:
+                attached.move_to_end(path)
+                return entry[0]
+            stale = [entry[0]] if entry else []
+            if entry:
+                del attached[path]
+            while len(attached) >= self.max_attached:
+                stale.append(attached.popitem(last=False)[1][0])
+            self._seq += 1
+            alias = f"shard_{self._seq}"
+            attached[path] = (alias, mtime)
+        for old in stale:
+            conn.execute(f"DETACH DATABASE {old}")
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (f"file:{path}?mode=ro&immutable=1",))
+        conn.execute(f"PRAGMA {alias}.mmap_size={self.mmap_size}")
+        return alias
+
+    def fts(self, conn: sqlite3.Connection, match: str, limit: int) -> list[tuple[int, str]]:
+        """BM25 matches from cold shards, newest month first, until ``limit`` are found."""
+        hits: list[tuple[int, str]] = []
+        for path in self.paths():
+            if len(hits) >= limit:
+                break
+            try:
+                alias = self.attach(conn, path)
+                hits.extend(conn.execute(f"""
+                    SELECT rowid, content FROM {alias}.conversations_fts
+                    WHERE conversations_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                """, (match, limit - len(hits))).fetchall())
+            except sqlite3.Error as e:
+                self.logger.warning("shard_query_failed %s", json.dumps({"path": str(path), "error": str(e)}))
+        return hits
+
+    def matrix(self, conn: sqlite3.Connection, path: Path, model: str) -> tuple[str, EmbeddingMatrix]:
+        """Alias and (cached) embedding matrix for one shard."""
+        alias = self.attach(conn, path)
+        mtime = path.stat().st_mtime_ns
+        with self.lock:
+            cached = self._matrices.get(path)
+            if cached and cached[0] == mtime:
+                self._matrices.move_to_end(path)
+                return alias, cached[1]
+        row = conn.execute(f"SELECT value FROM {alias}.shard_meta WHERE key = 'embedding_format'").fetchone()
+        matrix = EmbeddingMatrix(codec=EmbeddingCodec(row[0] if row else "float32"))
+        cursor = conn.execute(f"""
+            SELECT id, embedding, timestamp FROM {alias}.conversations
+            WHERE embedding IS NOT NULL AND embedding_model = ?
+            ORDER BY id
+        """, (model,))
+        for row_id, blob, ts in cursor:
+            matrix.append_blob(row_id, blob, sqlite_ts_to_epoch(ts))
+        if self.matrix_cache:
+            with self.lock:
+                self._matrices[path] = (mtime, matrix)
+                while len(self._matrices) > self.matrix_cache:
+                    self._matrices.popitem(last=False)
+        return alias, matrix
+
+    def semantic(self, conn: sqlite3.Connection, query: np.ndarray, model: str, threshold: float,
+                 limit: int) -> list[tuple[int, str, float]]:
+        """Vector hits above ``threshold`` from cold shards, newest month first, until ``limit``."""
+        hits: list[tuple[int, str, float]] = []
+        now = time.time()
+        for path in self.paths():
+            if len(hits) >= limit:
+                break
+            try:
+                alias, matrix = self.matrix(conn, path, model)
+                if matrix.count == 0 or matrix.dim != query.shape[0]:
+                    continue
+                ids, scores = matrix.score(query, now)
+                # Echo filtering mirrors the hot search
+                idx = np.flatnonzero((scores >= threshold) & (scores <= 0.95))
+                idx = idx[np.argsort(-scores[idx], kind="stable")][:limit - len(hits)]
+                if not len(idx):
+                    continue
+                wanted = [int(ids[i]) for i in idx]
+                placeholders = ",".join("?" * len(wanted))
+                contents = dict(conn.execute(
+                    f"SELECT id, content FROM {alias}.conversations WHERE id IN ({placeholders})", wanted))
+                hits.extend((int(ids[i]), contents[int(ids[i])], float(scores[i]))
+                            for i in idx if int(ids[i]) in contents)
+            except sqlite3.Error as e:
+                self.logger.warning("shard_query_failed %s", json.dumps({"path": str(path), "error": str(e)}))
+        return hits
+
+    def write_month(self, db_path: Path, month: str, embedding_format: str) -> tuple[Path, int, int]:
+        """Copy one month of ``db_path``'s conversations into its shard file.
+
+        The shard is rebuilt in a temp file (merging any existing shard for
+        that month), compacted, then swapped in atomically and made read-only.
+        Returns (path, rows copied, highest id copied).
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"memory-{month}.db"
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        if path.exists():
+            shutil.copyfile(path, tmp)
+        conn = sqlite3.connect(tmp, uri=True)
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("ATTACH DATABASE ? AS hot", (f"file:{db_path}?mode=ro",))
+            schema = conn.execute(
+                "SELECT sql FROM hot.sqlite_master WHERE type = 'table' AND name = 'conversations'").fetchone()[0]
+            conn.execute(schema.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+            conn.execute("CREATE TABLE IF NOT EXISTS shard_meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT OR REPLACE INTO shard_meta VALUES ('embedding_format', ?)", (embedding_format,))
+            # Explicit columns: an older shard may predate columns added to the hot table since
+            hot_cols = [r[1] for r in conn.execute("PRAGMA hot.table_info(conversations)")]
+            shard_cols = {r[1] for r in conn.execute("PRAGMA main.table_info(conversations)")}
+            cols = ", ".join(c for c in hot_cols if c in shard_cols)
+            max_id = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM hot.conversations WHERE substr(timestamp, 1, 7) = ?",
+                (month,)).fetchone()[0]
+            copied = conn.execute(f"""
+                INSERT OR IGNORE INTO conversations ({cols})
+                SELECT {cols} FROM hot.conversations WHERE substr(timestamp, 1, 7) = ? AND id <= ?
+            """, (month, max_id)).rowcount
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts
+                USING fts5(content, role, session_id, content=conversations, content_rowid=id)
+            """)
+            conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES('rebuild')")
+            conn.commit()
+            conn.execute("DETACH DATABASE hot")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        if path.exists():
+            path.chmod(0o644)
+        os.replace(tmp, path)
+        path.chmod(0o444)
+        return path, copied, max_id
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [{"month": self.month_of(p), "path": str(p), "bytes": p.stat().st_size} for p in self.paths()]
+
+
 class MemoryStore:
     """SQLite FTS5-based memory with embeddings support."""
 
-    def __init__(self, db_path: Path, logger: logging.Logger, cfg: Dict[str, Any]):
+    def __init__(self, db_path: Path, logger: logging.Logger, cfg: dict[str, Any],
+                 embedder: Any | None = None):
         self.db_path = db_path
         self.logger = logger
         self.cfg = cfg.get("memory", {})
@@ -242,227 +1172,1167 @@ class MemoryStore:
         self.max_history = self.cfg.get("max_history", 100)
         self.semantic_threshold = self.cfg.get("semantic_threshold", 0.65)
         self.semantic_search_limit = self.cfg.get("semantic_search_limit", 5)
-
-        # Embedding model for semantic search
-        self.embedder = None
-        if EMBEDDINGS_AVAILABLE and self.enabled:
-            model_name = self.cfg.get("embedding_model", "all-MiniLM-L6-v2")
-            try:
-                self.embedder = SentenceTransformer(model_name)
-                self.logger.info("embeddings_ready %s", json.dumps({"model": model_name, "semantic_threshold": self.semantic_threshold}))
-            except Exception as e:
-                self.logger.warning("embeddings_failed %s", json.dumps({"error": str(e)}))
+        self.pool: SQLitePool | None = None
+
+        # Write-behind persistence: add_turn enqueues, a writer thread batches
+        self.write_behind = self.cfg.get("write_behind", True)
+        self.write_batch_size = self.cfg.get("write_batch_size", 32)
+        self.flush_on_read = self.cfg.get("flush_on_read", True)
+        self._write_queue: queue.Queue = queue.Queue(maxsize=self.cfg.get("write_queue_size", 256))
+        self._writer_thread: threading.Thread | None = None
+
+        fmt = self.cfg.get("embedding_dtype", "float32")
+        if fmt not in EMBEDDING_FORMATS:
+            self.logger.warning("embedding_dtype_invalid %s", json.dumps({"value": fmt, "using": "float32"}))
+            fmt = "float32"
+        self.codec = EmbeddingCodec(fmt)
+
+        self.sidecar: EmbeddingSidecar | None = None
+        if self.cfg.get("embedding_sidecar", False):
+            self.sidecar = EmbeddingSidecar(self.db_path.with_suffix(".emb"), self.codec)
+        self.embeddings = EmbeddingMatrix(sidecar=self.sidecar, codec=self.codec)
+        self.index = self._make_index()
+        self.embedding_cache = EmbeddingCache(self.cfg.get("embedding_cache_size", 512))
+
+        # Hybrid retrieval (FTS5 BM25 + vectors, reciprocal-rank fusion)
+        self.hybrid_search = self.cfg.get("hybrid_search", True)
+        self.rrf_k = self.cfg.get("hybrid_rrf_k", 60)
+        self.hybrid_fts_limit = self.cfg.get("hybrid_fts_limit", 20)
+        self.hybrid_fts_min_coverage = self.cfg.get("hybrid_fts_min_coverage", 0.5)
+        self.prefilter_min_rows = self.cfg.get("hybrid_prefilter_min_rows", 200000)
+        self.prefilter_candidates = self.cfg.get("hybrid_prefilter_candidates", 2000)
+        self._search_pool: ThreadPoolExecutor | None = None
+
+        # Retention: background compaction yields while a voice turn is in flight
+        self.cleanup_enabled = self.cfg.get("cleanup_enabled", False)
+        self.cleanup_age_days = self.cfg.get("cleanup_age_days", 90)
+        self.max_sessions = self.cfg.get("max_sessions", 100)
+        self.cleanup_interval_s = self.cfg.get("cleanup_interval_s", 3600)
+        self.cleanup_batch_size = self.cfg.get("cleanup_batch_size", 200)
+        self.turn_active = threading.Event()
+        self._stop = threading.Event()
+        self._compactor_thread: threading.Thread | None = None
+
+        # Startup verification: "background" (quick_check now, full check later), "startup" or "off"
+        self.integrity_check = self.cfg.get("integrity_check", "background")
+        self.integrity_interval_h = self.cfg.get("integrity_check_interval_h", 168)
+        self._integrity_thread: threading.Thread | None = None
+
+        # Cold monthly shards; rows older than shard_hot_months are archived (0 = never)
+        self.shard_hot_months = self.cfg.get("shard_hot_months", 0)
+        self.shards = MemoryShards(
+            Path(self.cfg["shard_dir"]) if self.cfg.get("shard_dir") else self.db_path.parent / "memory_shards",
+            self.logger,
+            mmap_mb=self.cfg.get("sqlite_mmap_mb", 256),
+            max_attached=self.cfg.get("shard_max_attached", 8),
+            matrix_cache=self.cfg.get("shard_matrix_cache", 2),
+        )
+
+        # Insert-time dedupe against the most recent rows
+        self.dedupe_enabled = self.cfg.get("dedupe_enabled", True)
+        self.dedupe_window = self.cfg.get("dedupe_window", 500)
+        self.dedupe_similarity = self.cfg.get("dedupe_similarity", 0.97)
+
+        # Re-embedding/backfill job (rows with NULL or other-model vectors)
+        self.reembed_batch_size = self.cfg.get("reembed_batch_size", 256)
+        self.reembed_background = self.cfg.get("reembed_background", False)
+        self.reembed_pause_s = self.cfg.get("reembed_pause_s", 0.0)
+        self._reembed_thread: threading.Thread | None = None
+        # Legacy vectors of another dimension found by the schema migration
+        self._unlabelled_vectors = 0
+        # Held while corruption recovery swaps pool, matrix and index
+        self._swap_lock = threading.RLock()
+
+        # Embedding model for semantic search; rows record the model that produced them
+        self.embedding_model = self.cfg.get("embedding_model", "all-MiniLM-L6-v2")
+        self.embedder = embedder
+        if self.embedder is None and self.enabled:
+            self.embedder = self._load_embedder()
 
         if self.enabled:
             self._init_db()
 
+    def _load_embedder(self) -> Any | None:
+        """Build the embedder selected by memory.embedding_backend (sentence-transformers or onnx)."""
+        backend = self.cfg.get("embedding_backend", "sentence-transformers")
+        model_name = self.embedding_model
+        t0 = time.time()
+        try:
+            if backend == "onnx":
+                if not ONNX_EMBEDDINGS_AVAILABLE:
+                    self.logger.warning("embeddings_failed %s", json.dumps({
+                        "backend": backend, "error": "onnxruntime/tokenizers not installed"}))
+                    return None
+                model_dir = Path(self.cfg.get("embedding_onnx_dir") or MODELS_DIR / "embeddings" / f"{model_name}-onnx")
+                embedder = OnnxEmbedder.load(
+                    model_dir,
+                    model_file=self.cfg.get("embedding_onnx_file", "model_int8.onnx"),
+                    threads=self.cfg.get("embedding_threads", 2),
+                    max_length=self.cfg.get("embedding_max_length", 256),
+                )
+            elif EMBEDDINGS_AVAILABLE:
+                from sentence_transformers import SentenceTransformer
+                embedder = SentenceTransformer(model_name)
+            else:
+                return None
+            self.logger.info("embeddings_ready %s", json.dumps({
+                "model": model_name, "backend": backend, "semantic_threshold": self.semantic_threshold,
+                "load_ms": int((time.time() - t0) * 1000)
+            }))
+            return embedder
+        except (ImportError, OSError, RuntimeError, ValueError) as e:
+            self.logger.warning("embeddings_failed %s", json.dumps({"backend": backend, "error": str(e)}))
+            return None
+
     def _init_db(self):
         """Initialize SQLite with FTS5."""
         try:
             conn = sqlite3.connect(self.db_path)
 
-            # Check database integrity first
-            try:
-                cursor = conn.execute("PRAGMA integrity_check")
-                result = cursor.fetchone()
-                if result and result[0] != "ok":
-                    self.logger.warning("db_integrity_issue %s", json.dumps({"result": result[0]}))
-                    # Backup corrupted DB
-                    if self.db_path.exists():
-                        backup_path = self.db_path.with_suffix('.db.backup')
-                        shutil.copy2(self.db_path, backup_path)
-                        self.logger.info("db_backed_up %s", json.dumps({"path": str(backup_path)}))
-                        # Remove corrupted database and reinitialize
+            # Check database integrity first: quick_check at boot, the full
+            # integrity_check runs in the background unless configured otherwise
+            full = self.integrity_check == "startup"
+            if self.integrity_check != "off":
+                try:
+                    t0 = time.time()
+                    cursor = conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check")
+                    result = cursor.fetchone()
+                    self.logger.info("db_integrity_checked %s", json.dumps({
+                        "mode": "full" if full else "quick",
+                        "result": result[0] if result else None,
+                        "ms": int((time.time() - t0) * 1000)
+                    }))
+                    if result and result[0] != "ok":
                         conn.close()
-                        self.db_path.unlink(missing_ok=True)
-                        self.logger.warning("db_reinitializing %s", json.dumps({"reason": "corruption"}))
+                        self._backup_and_reset(result[0])
                         conn = sqlite3.connect(self.db_path)
-                        conn.execute("PRAGMA journal_mode=WAL")
-            except Exception as e:
-                self.logger.warning("db_integrity_check_failed %s", json.dumps({"error": str(e)}))
+                except (sqlite3.Error, OSError) as e:
+                    self.logger.warning("db_integrity_check_failed %s", json.dumps({"error": str(e)}))
 
             conn.execute("PRAGMA journal_mode=WAL")
+            conn.close()
 
-            # Conversations table
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    turn_num INTEGER NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    embedding BLOB,
-                    metadata TEXT
-                )
-            """)
+            self.pool = SQLitePool(self.db_path, self.logger, self.cfg)
+            with self.pool.write() as conn:
+                self._create_schema(conn)
+            if self.get_meta("import_in_progress"):
+                # A bulk import was interrupted with its triggers dropped
+                self._finish_import()
+            self._migrate_embeddings()
+
+            if self.embedder:
+                self._load_embeddings()
+
+            if self.write_behind:
+                self._writer_thread = threading.Thread(
+                    target=self._writer_loop, name="memory-writer", daemon=True)
+                self._writer_thread.start()
+
+            if (self.reembed_background or self._unlabelled_vectors) and self.embedder:
+                self._reembed_thread = threading.Thread(
+                    target=self.reembed, name="memory-reembed", daemon=True)
+                self._reembed_thread.start()
+
+            if self.integrity_check == "background":
+                self._integrity_thread = threading.Thread(
+                    target=self._integrity_loop, name="memory-integrity", daemon=True)
+                self._integrity_thread.start()
+
+            if (self.cleanup_enabled or self.shard_hot_months > 0) and self.cleanup_interval_s > 0:
+                self._compactor_thread = threading.Thread(
+                    target=self._compactor_loop, name="memory-compactor", daemon=True)
+                self._compactor_thread.start()
+
+            self.logger.info("memory_initialized %s", json.dumps({
+                "db": str(self.db_path), "write_behind": self.write_behind}))
+        except Exception as e:
+            self.logger.error("memory_init_failed %s", json.dumps({"error": str(e)}))
+            self.enabled = False
+
+    def _backup_and_reset(self, result: str):
+        """Back up a corrupted database and remove it so the schema is recreated empty."""
+        self.logger.warning("db_integrity_issue %s", json.dumps({"result": result}))
+        if self.db_path.exists():
+            backup_path = self.db_path.with_suffix('.db.backup')
+            shutil.copy2(self.db_path, backup_path)
+            self.logger.info("db_backed_up %s", json.dumps({"path": str(backup_path)}))
+        # Remove corrupted database (and its WAL) and reinitialize
+        for suffix in ("", "-wal", "-shm"):
+            Path(str(self.db_path) + suffix).unlink(missing_ok=True)
+        self.db_path.with_suffix(".ivf.npz").unlink(missing_ok=True)
+        self.logger.warning("db_reinitializing %s", json.dumps({"reason": "corruption"}))
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+
+    def _integrity_loop(self):
+        """Full integrity_check off the boot path, repeated every integrity_check_interval_h."""
+        interval_s = max(1.0, self.integrity_interval_h * 3600.0)
+        while not self._stop.is_set():
+            try:
+                checked_at = float(self.get_meta("integrity_checked_at") or 0)
+            except (TypeError, ValueError):
+                checked_at = 0.0
+            due_in = checked_at + interval_s - time.time()
+            if due_in > 0:
+                # Verified recently: don't rescan a large DB on every boot
+                self.logger.info("db_integrity_check_skipped %s", json.dumps({"due_in_s": int(due_in)}))
+                if self._stop.wait(due_in):
+                    return
+                continue
+            if not self._wait_idle():
+                return
+            self.verify_integrity()
+            if self._stop.wait(interval_s):
+                return
+
+    def verify_integrity(self) -> str | None:
+        """Run a full integrity_check on a private read-only connection and record the result.
+
+        Corruption goes through the same backup-and-reinit path as a failed
+        startup check, with the live pool and embedding state swapped out.
+        """
+        t0 = time.time()
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute("PRAGMA integrity_check").fetchall()
+            finally:
+                conn.close()
+            result = "ok" if rows and rows[0][0] == "ok" else "; ".join(r[0] for r in rows[:5])
+        except sqlite3.DatabaseError as e:
+            result = str(e)
+        except sqlite3.Error as e:
+            self.logger.warning("db_integrity_check_failed %s", json.dumps({"error": str(e)}))
+            return None
+
+        self.logger.info("db_integrity_checked %s", json.dumps({
+            "mode": "full", "result": result, "ms": int((time.time() - t0) * 1000)
+        }))
+        if result != "ok":
+            self._recover_from_corruption(result)
+        try:
+            with self.pool.write() as conn:
+                self._set_meta(conn, "integrity_checked_at", str(time.time()))
+                self._set_meta(conn, "integrity_result", result)
+        except (sqlite3.Error, RuntimeError) as e:
+            self.logger.warning("db_integrity_record_failed %s", json.dumps({"error": str(e)}))
+        return result
+
+    def _recover_from_corruption(self, result: str):
+        """Swap a corrupted live database for a fresh one (backup kept alongside)."""
+        self.flush()
+        old_pool = self.pool
+        with self._swap_lock, old_pool.write_lock:
+            old_pool.close()
+            self._backup_and_reset(result)
+            if self.sidecar:
+                self.sidecar.close()
+            self.embeddings = EmbeddingMatrix(sidecar=self.sidecar, codec=self.codec)
+            self.index = self._make_index()
+            pool = SQLitePool(self.db_path, self.logger, self.cfg)
+            with pool.write() as conn:
+                self._create_schema(conn)
+                self._set_meta(conn, "embedding_format", self.codec.fmt)
+            self.pool = pool
+
+    def _embedder_dim(self) -> int | None:
+        """Output dimension of the active embedder (None without one)."""
+        if self.embedder is None:
+            return None
+        getter = getattr(self.embedder, "get_sentence_embedding_dimension", None)
+        try:
+            if getter is not None:
+                return int(getter())
+            return int(np.asarray(self.embedder.encode("dimension probe")).size)
+        except (RuntimeError, ValueError, OSError) as e:
+            self.logger.warning("embedder_dim_probe_failed %s", json.dumps({"error": str(e)}))
+            return None
+
+    def _label_legacy_vectors(self, conn: sqlite3.Connection):
+        """Attribute vectors written before per-row model tracking.
 
-            # FTS5 for full-text search
+        Older releases only ever stored vectors from the configured model, so
+        rows whose BLOB length matches the active embedder's dimension are
+        labelled with it. Anything else stays NULL and is re-embedded in the
+        background (or labelled from its length when no embedder is loaded).
+        """
+        if conn.execute("SELECT 1 FROM conversations WHERE embedding IS NOT NULL LIMIT 1").fetchone() is None:
+            return
+        has_meta = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_meta'").fetchone()
+        fmt = None
+        if has_meta:
+            row = conn.execute("SELECT value FROM memory_meta WHERE key = 'embedding_format'").fetchone()
+            fmt = row[0] if row else None
+        codec = EmbeddingCodec(fmt or "float32-raw")
+        header, itemsize = codec.header_bytes, codec.vec_dtype.itemsize
+        dim = self._embedder_dim()
+        if dim is None:
             conn.execute("""
-                CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts
-                USING fts5(content, role, session_id, content=conversations, content_rowid=id)
-            """)
+                UPDATE conversations SET embedding_model = ?, embedding_dim = (length(embedding) - ?) / ?
+                WHERE embedding IS NOT NULL AND embedding_model IS NULL
+            """, (self.embedding_model, header, itemsize))
+        else:
+            conn.execute("""
+                UPDATE conversations SET embedding_model = ?, embedding_dim = ?
+                WHERE embedding IS NOT NULL AND embedding_model IS NULL AND length(embedding) = ?
+            """, (self.embedding_model, dim, header + dim * itemsize))
+        self._unlabelled_vectors = conn.execute(
+            "SELECT COUNT(*) FROM conversations WHERE embedding IS NOT NULL AND embedding_model IS NULL"
+        ).fetchone()[0]
+        if self._unlabelled_vectors:
+            self.logger.warning("memory_unlabelled_vectors %s", json.dumps({
+                "rows": self._unlabelled_vectors, "model": self.embedding_model, "dim": dim,
+                "action": "background reembed"
+            }))
 
-            # Triggers to keep FTS in sync
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Create tables, FTS index and triggers if missing."""
+        # Incremental auto-vacuum can only be switched on before the first table exists
+        fresh = conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+        if fresh:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self.logger.info("auto_vacuum_disabled %s", json.dumps({
+                "hint": "run VACUUM after PRAGMA auto_vacuum=INCREMENTAL to reclaim space from compaction"
+            }))
+
+        # Conversations table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                turn_num INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                embedding BLOB,
+                metadata TEXT
+            )
+        """)
+
+        # Which model produced each vector; rows from other models are never compared
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+        if "embedding_model" not in columns:
+            conn.execute("ALTER TABLE conversations ADD COLUMN embedding_model TEXT")
+            conn.execute("ALTER TABLE conversations ADD COLUMN embedding_dim INTEGER")
+            self._label_legacy_vectors(conn)
+        if "content_hash" not in columns:
+            conn.execute("ALTER TABLE conversations ADD COLUMN content_hash TEXT")
+            conn.execute("ALTER TABLE conversations ADD COLUMN ref_count INTEGER NOT NULL DEFAULT 1")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_hash ON conversations(content_hash)")
+
+        # Key/value store for schema and maintenance state
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+
+        # Per-session summary so resume and session info are single-row lookups
+        backfill = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessions'").fetchone() is None
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                first_ts DATETIME NOT NULL,
+                last_ts DATETIME NOT NULL,
+                turn_count INTEGER NOT NULL DEFAULT 0,
+                last_turn_num INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_ts ON sessions(last_ts)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_session_turn ON conversations(session_id, turn_num)")
+        if backfill:
             conn.execute("""
-                CREATE TRIGGER IF NOT EXISTS conversations_ai AFTER INSERT ON conversations BEGIN
-                    INSERT INTO conversations_fts(rowid, content, role, session_id)
-                    VALUES (new.id, new.content, new.role, new.session_id);
-                END
+                INSERT OR REPLACE INTO sessions (session_id, first_ts, last_ts, turn_count, last_turn_num)
+                SELECT session_id, MIN(timestamp), MAX(timestamp), COUNT(*), MAX(turn_num)
+                FROM conversations GROUP BY session_id
             """)
 
-            conn.commit()
-            conn.close()
-            self.logger.info("memory_initialized %s", json.dumps({"db": str(self.db_path)}))
-        except Exception as e:
-            self.logger.error("memory_init_failed %s", json.dumps({"error": str(e)}))
-            self.enabled = False
+        # Rolling LLM summary of turns that have left the prompt window
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_summaries (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                through_turn INTEGER NOT NULL DEFAULT 0,
+                model TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS sessions_ad_summaries AFTER DELETE ON sessions BEGIN
+                DELETE FROM session_summaries WHERE session_id = old.session_id;
+            END
+        """)
+
+        # FTS5 for full-text search
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts
+            USING fts5(content, role, session_id, content=conversations, content_rowid=id)
+        """)
+
+        # Triggers to keep FTS in sync
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS conversations_ai AFTER INSERT ON conversations BEGIN
+                INSERT INTO conversations_fts(rowid, content, role, session_id)
+                VALUES (new.id, new.content, new.role, new.session_id);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS conversations_ai_sessions AFTER INSERT ON conversations BEGIN
+                INSERT INTO sessions (session_id, first_ts, last_ts, turn_count, last_turn_num)
+                VALUES (new.session_id, new.timestamp, new.timestamp, 1, new.turn_num)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    first_ts = MIN(first_ts, excluded.first_ts),
+                    last_ts = MAX(last_ts, excluded.last_ts),
+                    turn_count = turn_count + 1,
+                    last_turn_num = MAX(last_turn_num, excluded.last_turn_num);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS conversations_ad AFTER DELETE ON conversations BEGIN
+                INSERT INTO conversations_fts(conversations_fts, rowid, content, role, session_id)
+                VALUES ('delete', old.id, old.content, old.role, old.session_id);
+            END
+        """)
+        # Deletes are rare (compaction) so the summary is recomputed from the session index
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS conversations_ad_sessions AFTER DELETE ON conversations BEGIN
+                UPDATE sessions SET
+                    turn_count = turn_count - 1,
+                    first_ts = COALESCE((SELECT MIN(timestamp) FROM conversations
+                                         WHERE session_id = old.session_id), first_ts),
+                    last_ts = COALESCE((SELECT MAX(timestamp) FROM conversations
+                                        WHERE session_id = old.session_id), last_ts),
+                    last_turn_num = COALESCE((SELECT MAX(turn_num) FROM conversations
+                                              WHERE session_id = old.session_id), last_turn_num)
+                WHERE session_id = old.session_id;
+                DELETE FROM sessions WHERE session_id = old.session_id AND turn_count <= 0;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS conversations_au AFTER UPDATE OF content, role, session_id
+            ON conversations BEGIN
+                INSERT INTO conversations_fts(conversations_fts, rowid, content, role, session_id)
+                VALUES ('delete', old.id, old.content, old.role, old.session_id);
+                INSERT INTO conversations_fts(rowid, content, role, session_id)
+                VALUES (new.id, new.content, new.role, new.session_id);
+            END
+        """)
+
+    def _make_index(self):
+        """Candidate index for semantic search, selected by memory.ann_index."""
+        kind = self.cfg.get("ann_index", "flat")
+        if kind == "ivf":
+            return IVFFlatIndex(
+                self.db_path.with_suffix(".ivf.npz"), self.logger,
+                nlist=self.cfg.get("ann_nlist", 0),
+                nprobe=self.cfg.get("ann_nprobe", 8),
+                train_min=self.cfg.get("ann_train_min", 20000),
+            )
+        return FlatIndex()
 
-    def add_turn(self, session_id: str, turn_num: int, role: str, content: str, metadata: Optional[Dict] = None):
-        """Add a conversation turn."""
-        if not self.enabled:
+    def _load_embeddings(self):
+        """Load stored embeddings (or map the sidecar), then the ANN index."""
+        if self.sidecar is not None:
+            self._attach_sidecar()
+        else:
+            self._load_embedding_rows()
+        if not self.index.load(self.embeddings):
+            self.index.sync(self.embeddings)
+        self.logger.info("ann_index_ready %s", json.dumps(self.index.stats()))
+
+    def _load_embedding_rows(self):
+        """Copy every stored embedding into the in-RAM matrix."""
+        t0 = time.time()
+        skipped = 0
+        cursor = self.pool.reader().execute("""
+            SELECT id, embedding, timestamp FROM conversations
+            WHERE embedding IS NOT NULL AND embedding_model = ?
+            ORDER BY id
+        """, (self.embedding_model,))
+        while True:
+            rows = cursor.fetchmany(4096)
+            if not rows:
+                break
+            for row_id, emb_bytes, ts in rows:
+                try:
+                    if not self.embeddings.append_blob(row_id, emb_bytes, sqlite_ts_to_epoch(ts)):
+                        skipped += 1
+                except (TypeError, ValueError):
+                    skipped += 1
+        self.logger.info("embeddings_loaded %s", json.dumps({
+            "rows": self.embeddings.count,
+            "dim": self.embeddings.dim,
+            "format": self.codec.fmt,
+            "skipped": skipped,
+            "ms": int((time.time() - t0) * 1000)
+        }))
+
+    def _attach_sidecar(self, verify: bool = True):
+        """Map the sidecar, rebuilding it first if it has drifted from the DB."""
+        t0 = time.time()
+        if verify:
+            check = self.verify_sidecar(full=False)
+            if not check["ok"]:
+                self.logger.warning("sidecar_inconsistent %s", json.dumps(check))
+                self.rebuild_sidecar()
+                return
+
+        cursor = self.pool.reader().execute(
+            "SELECT id, timestamp FROM conversations WHERE embedding IS NOT NULL AND embedding_model = ?",
+            (self.embedding_model,))
+        ts_by_id = {row_id: sqlite_ts_to_epoch(ts) for row_id, ts in cursor}
+        self.embeddings.attach_sidecar(ts_by_id)
+        self.logger.info("sidecar_attached %s", json.dumps({
+            "path": str(self.sidecar.path),
+            "rows": self.embeddings.count,
+            "dim": self.embeddings.dim,
+            "ms": int((time.time() - t0) * 1000)
+        }))
+
+    def verify_sidecar(self, full: bool = True) -> dict[str, Any]:
+        """Compare the sidecar against conversations.embedding.
+
+        The quick form checks dimension, slot count and the newest vector;
+        ``full`` compares every stored embedding byte for byte.
+        """
+        self._sync_reads()
+        conn = self.pool.reader()
+        max_id = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM conversations WHERE embedding IS NOT NULL AND embedding_model = ?",
+            (self.embedding_model,)).fetchone()[0]
+        result: dict[str, Any] = {"ok": True, "db_max_id": max_id, "checked": 0, "mismatched": 0}
+        if self.sidecar is None:
+            return {**result, "ok": False, "reason": "sidecar_disabled"}
+        rows = self.sidecar.rows()
+        result["sidecar_rows"] = rows
+        if max_id == 0:
+            return result
+        # Slots past max_id are allowed: compaction may have deleted the newest rows
+        if not self.sidecar.dim or rows < max_id:
+            return {**result, "ok": False, "reason": "row_count"}
+
+        view = self.sidecar.view(rows)
+        if full:
+            cursor = conn.execute(
+                "SELECT id, embedding FROM conversations WHERE embedding IS NOT NULL AND embedding_model = ? "
+                "ORDER BY id", (self.embedding_model,))
+        else:
+            cursor = conn.execute(
+                "SELECT id, embedding FROM conversations WHERE id = ?", (max_id,))
+        for row_id, emb_bytes in cursor:
+            result["checked"] += 1
+            if view[row_id - 1].tobytes() != emb_bytes:
+                result["mismatched"] += 1
+        if result["mismatched"]:
+            result.update(ok=False, reason="content")
+        return result
+
+    def rebuild_sidecar(self) -> int:
+        """Rewrite the sidecar from conversations.embedding and remap it."""
+        if self.sidecar is None:
+            return 0
+        t0 = time.time()
+        with self.embeddings.lock:
+            self.sidecar.close()
+        tmp_path = self.sidecar.path.with_name(self.sidecar.path.name + ".tmp")
+        dim = None
+        written = 0
+        cursor = self.pool.reader().execute(
+            "SELECT id, embedding FROM conversations WHERE embedding IS NOT NULL AND embedding_model = ? "
+            "ORDER BY id", (self.embedding_model,))
+        with open(tmp_path, "wb") as fh:
+            for row_id, emb_bytes in cursor:
+                if dim is None:
+                    dim = self.codec.dim_for(len(emb_bytes))
+                    row_bytes = self.codec.record_dtype(dim).itemsize
+                if len(emb_bytes) != row_bytes:
+                    continue
+                fh.seek((row_id - 1) * row_bytes)
+                fh.write(emb_bytes)
+                written += 1
+            if dim is not None:
+                fh.truncate(fh.tell())
+        os.replace(tmp_path, self.sidecar.path)
+        self.sidecar.dim = dim
+        if dim is not None:
+            self.sidecar.write_meta()
+
+        self.embeddings = EmbeddingMatrix(sidecar=self.sidecar, codec=self.codec)
+        if dim is not None:
+            self._attach_sidecar(verify=False)
+        self.logger.info("sidecar_rebuilt %s", json.dumps({
+            "rows": written, "dim": dim, "ms": int((time.time() - t0) * 1000)
+        }))
+        return written
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.pool.reader().execute("SELECT value FROM memory_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: str | None):
+        if value is None:
+            conn.execute("DELETE FROM memory_meta WHERE key = ?", (key,))
+        else:
+            conn.execute("INSERT OR REPLACE INTO memory_meta (key, value) VALUES (?, ?)", (key, value))
+
+    def set_meta(self, key: str, value: str | None):
+        with self.pool.write() as conn:
+            self._set_meta(conn, key, value)
+
+    def _migrate_embeddings(self, chunk: int = 2048):
+        """Re-encode stored BLOBs when memory.embedding_dtype changes.
+
+        Databases written before formats were recorded hold un-normalised
+        float32 (``float32-raw``). Progress is checkpointed with each chunk,
+        so an interrupted migration resumes where it stopped.
+        """
+        target = self.codec.fmt
+        current = self.get_meta("embedding_format")
+        if current is None:
+            has_rows = self.pool.reader().execute(
+                "SELECT 1 FROM conversations WHERE embedding IS NOT NULL LIMIT 1").fetchone()
+            if not has_rows:
+                self.set_meta("embedding_format", target)
+                return
+            current = "float32-raw"
+        if current == target:
             return
 
-        try:
-            conn = sqlite3.connect(self.db_path)
+        t0 = time.time()
+        state = json.loads(self.get_meta("embedding_migration") or "{}")
+        last_id = state.get("last_id", 0) if state.get("to") == target and state.get("from") == current else 0
+        source = EmbeddingCodec(current)
+        migrated = 0
+        while True:
+            rows = self.pool.reader().execute("""
+                SELECT id, embedding FROM conversations
+                WHERE embedding IS NOT NULL AND id > ?
+                ORDER BY id LIMIT ?
+            """, (last_id, chunk)).fetchall()
+            if not rows:
+                break
+            updates = [(self.codec.encode(source.decode(blob)), row_id) for row_id, blob in rows]
+            last_id = rows[-1][0]
+            with self.pool.write() as conn:
+                conn.executemany("UPDATE conversations SET embedding = ? WHERE id = ?", updates)
+                self._set_meta(conn, "embedding_migration",
+                               json.dumps({"from": current, "to": target, "last_id": last_id}))
+            migrated += len(rows)
+
+        with self.pool.write() as conn:
+            self._set_meta(conn, "embedding_format", target)
+            self._set_meta(conn, "embedding_migration", None)
+        # Cluster assignments were computed on the old vectors
+        self.db_path.with_suffix(".ivf.npz").unlink(missing_ok=True)
+        self.logger.info("embeddings_migrated %s", json.dumps({
+            "from": current, "to": target, "rows": migrated, "ms": int((time.time() - t0) * 1000)
+        }))
 
-            # Generate embedding if available
-            embedding = None
-            if self.embedder:
+    def close(self):
+        """Flush queued turns and release pooled connections (called once at shutdown)."""
+        self._stop.set()
+        for thread in (self._compactor_thread, self._integrity_thread, self._reembed_thread):
+            if thread is not None:
+                thread.join(timeout=30)
+        self._compactor_thread = self._integrity_thread = self._reembed_thread = None
+        if self._writer_thread is not None:
+            self._write_queue.put(None)
+            self._writer_thread.join(timeout=30)
+            self._writer_thread = None
+        if self._search_pool is not None:
+            self._search_pool.shutdown(wait=True)
+            self._search_pool = None
+        self.index.save()
+        if self.embedder:
+            self.logger.info("embedding_cache_stats %s", json.dumps(self.embedding_cache.stats()))
+        if self.sidecar:
+            self.sidecar.close()
+        if self.pool:
+            self.pool.close()
+
+    def add_turn(self, session_id: str, turn_num: int, role: str, content: str, metadata: dict | None = None):
+        """Add a conversation turn (queued for the writer thread when write-behind is on)."""
+        if not self.enabled:
+            return
+
+        turn = (session_id, turn_num, role, content, sqlite_utc_now(), json.dumps(metadata or {}))
+        if self._writer_thread is not None:
+            self._write_queue.put(turn)
+            return
+        self._persist_turns([turn])
+
+    def _writer_loop(self):
+        """Drain queued turns in batches: one encode call and one transaction per batch."""
+        while True:
+            turn = self._write_queue.get()
+            if turn is None:
+                self._write_queue.task_done()
+                return
+            batch = [turn]
+            stop = False
+            while len(batch) < self.write_batch_size:
                 try:
-                    embedding = self.embedder.encode(content).tobytes()
-                except Exception as e:
-                    self.logger.warning("embedding_failed %s", json.dumps({"error": str(e)}))
+                    nxt = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._persist_turns(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._write_queue.task_done()
+            if stop:
+                return
+
+    def _encode_batch(self, texts: list[str], use_cache: bool = True) -> list[np.ndarray | None]:
+        """Embed several texts through the LRU cache; misses go to the embedder in one call.
+
+        Bulk jobs pass ``use_cache=False`` so they don't evict live entries.
+        Failures degrade to NULL embeddings.
+        """
+        if not self.embedder or not texts:
+            return [None] * len(texts)
+        out: list[np.ndarray | None] = [self.embedding_cache.get(t) if use_cache else None for t in texts]
+        missing = [i for i, vec in enumerate(out) if vec is None]
+        if missing:
+            try:
+                vecs = np.asarray(self.embedder.encode([texts[i] for i in missing]), dtype=np.float32)
+                for j, i in enumerate(missing):
+                    out[i] = vecs[j].copy()
+                    if use_cache:
+                        self.embedding_cache.put(texts[i], out[i])
+            except (RuntimeError, ValueError, TypeError, OSError) as e:
+                self.logger.warning("embedding_failed %s", json.dumps({"error": str(e), "batch": len(missing)}))
+        return out
+
+    def _embedding_columns(self, vec: np.ndarray | None) -> tuple[bytes | None, str | None, int | None]:
+        """(embedding, embedding_model, embedding_dim) column values for one turn."""
+        if vec is None:
+            return None, None, None
+        return self.codec.encode(vec), self.embedding_model, int(np.asarray(vec).size)
+
+    @staticmethod
+    def content_hash(role: str, content: str) -> str:
+        """Dedupe key: role plus case- and whitespace-normalised text."""
+        return hashlib.sha1(f"{role}\x00{' '.join(content.lower().split())}".encode()).hexdigest()
+
+    def _near_duplicate(self, conn: sqlite3.Connection, role: str, vec: np.ndarray, min_id: int) -> int | None:
+        """Newest same-role row after ``min_id`` whose vector is within dedupe_similarity."""
+        ids, _, vecs, norms, scales = self.embeddings.snapshot()
+        start = int(np.searchsorted(ids, min_id, side="right"))
+        if start >= len(ids) or vec.shape[0] != vecs.shape[1]:
+            return None
+        q = vec / (np.linalg.norm(vec) or 1.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = self.embeddings.dot(vecs[start:], q) * scales[start:] / norms[start:]
+        hits = np.flatnonzero(np.nan_to_num(sims, nan=-1.0) >= self.dedupe_similarity)
+        for pos in hits[::-1][:3]:
+            row_id = int(ids[start + pos])
+            row = conn.execute("SELECT role FROM conversations WHERE id = ?", (row_id,)).fetchone()
+            if row and row[0] == role:
+                return row_id
+        return None
 
-            conn.execute("""
-                INSERT INTO conversations (session_id, turn_num, role, content, embedding, metadata)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (session_id, turn_num, role, content, embedding, json.dumps(metadata or {})))
+    def _dedupe(self, conn: sqlite3.Connection, turns: list[tuple[str, int, str, str, str, str]],
+                vecs: list[np.ndarray | None], hashes: list[str]) -> tuple[list[int], list[int], dict[int, int]]:
+        """Split a batch into (indices to embed, their ref counts, {existing id: repeats}).
+
+        Exact matches are found through content_hash, near-duplicates by
+        cosine similarity; both only look at the last dedupe_window rows.
+        """
+        keep: list[int] = []
+        refs: list[int] = []
+        bumps: dict[int, int] = {}
+        if not self.dedupe_enabled:
+            return list(range(len(turns))), [1] * len(turns), bumps
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM conversations").fetchone()[0]
+        min_id = max(0, max_id - self.dedupe_window)
+        pending: dict[str, int] = {}
+        for i, (turn, vec, h) in enumerate(zip(turns, vecs, hashes)):
+            if h not in pending and vec is not None and self.dedupe_similarity > 0:
+                # Near-duplicates of a row earlier in this same batch
+                for k, j in enumerate(keep):
+                    other = vecs[j]
+                    if (other is not None and turns[j][2] == turn[2] and other.shape == vec.shape
+                            and float(np.dot(other, vec)) >= self.dedupe_similarity
+                            * float(np.linalg.norm(other) * np.linalg.norm(vec))):
+                        pending[h] = k
+                        break
+            if h in pending:
+                refs[pending[h]] += 1
+                continue
+            row = conn.execute(
+                "SELECT id FROM conversations WHERE content_hash = ? AND id > ? ORDER BY id DESC LIMIT 1",
+                (h, min_id)).fetchone()
+            existing = row[0] if row else None
+            if existing is None and vec is not None and self.dedupe_similarity > 0:
+                existing = self._near_duplicate(conn, turn[2], vec, min_id)
+            if existing is not None:
+                bumps[existing] = bumps.get(existing, 0) + 1
+                continue
+            pending[h] = len(keep)
+            keep.append(i)
+            refs.append(1)
+        return keep, refs, bumps
+
+    def _persist_turns(self, turns: list[tuple[str, int, str, str, str, str]]):
+        """Embed and insert a batch of turns in a single transaction.
+
+        Every turn keeps its own row so session transcripts stay complete.
+        Duplicates of a recent row are stored without a vector and with
+        ref_count 0; the row they repeat gets its ref_count bumped instead.
+        """
+        try:
+            t0 = time.time()
+            vecs = self._encode_batch([t[3] for t in turns])
+            hashes = [self.content_hash(t[2], t[3]) for t in turns]
+            # The matrix append stays under the writer lock so _reload_embeddings
+            # never sees a committed row that is still about to be appended.
+            # Recovery swaps pool, matrix and index from another thread, so the
+            # batch holds the swap lock and binds the pool once.
+            with self._swap_lock:
+                pool = self.pool
+                with pool.write_lock:
+                    with pool.write() as conn:
+                        keep, refs, bumps = self._dedupe(conn, turns, vecs, hashes)
+                        kept = dict(zip(keep, refs))
+                        rows = [
+                            (turn[0], turn[1], turn[2], turn[3], turn[4],
+                             *self._embedding_columns(vecs[i] if i in kept else None),
+                             hashes[i], kept.get(i, 0), turn[5])
+                            for i, turn in enumerate(turns)
+                        ]
+                        conn.executemany("""
+                            INSERT INTO conversations (session_id, turn_num, role, content, timestamp,
+                                                       embedding, embedding_model, embedding_dim,
+                                                       content_hash, ref_count, metadata)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """, rows)
+                        # Single writer under lock: the batch occupies consecutive ids
+                        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                        if bumps:
+                            conn.executemany("UPDATE conversations SET ref_count = ref_count + ? WHERE id = ?",
+                                             [(count, row_id) for row_id, count in bumps.items()])
+
+                    first_id = last_id - len(turns) + 1
+                    for i, turn in enumerate(turns):
+                        if i in kept and vecs[i] is not None:
+                            self.embeddings.append(first_id + i, vecs[i], sqlite_ts_to_epoch(turn[4]))
+                        self.logger.debug("memory_turn_added %s", json.dumps({
+                            "session": turn[0], "turn": turn[1], "role": turn[2], "chars": len(turn[3])
+                        }))
+                    self.index.sync(self.embeddings)
+            if len(keep) < len(turns):
+                self.logger.debug("memory_turns_deduped %s", json.dumps({
+                    "turns": len(turns), "embedded": len(keep), "bumped_rows": len(bumps)
+                }))
+            if len(turns) > 1:
+                self.logger.debug("memory_batch_written %s", json.dumps({
+                    "turns": len(turns), "ms": int((time.time() - t0) * 1000)
+                }))
+        except Exception:
+            self.logger.exception("memory_add_failed %s", json.dumps({"turns": len(turns)}))
 
-            conn.commit()
-            conn.close()
+    def flush(self):
+        """Block until every queued turn has been written."""
+        if self._writer_thread is not None and self._writer_thread.is_alive():
+            self._write_queue.join()
 
-            self.logger.debug("memory_turn_added %s", json.dumps({
-                "session": session_id, "turn": turn_num, "role": role, "chars": len(content)
-            }))
-        except Exception as e:
-            self.logger.error("memory_add_failed %s", json.dumps({"error": str(e)}))
+    def _sync_reads(self):
+        """Make queued turns visible before a read (flush-on-read)."""
+        if self.flush_on_read and self._write_queue.unfinished_tasks:
+            self.flush()
 
-    def get_recent_turns(self, session_id: str, limit: int = 5) -> List[Tuple[str, str]]:
+    def get_recent_turns(self, session_id: str, limit: int = 5) -> list[tuple[str, str]]:
         """Get recent conversation turns."""
         if not self.enabled:
             return []
+        self._sync_reads()
 
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.pool.reader()
             cursor = conn.execute("""
                 SELECT role, content FROM conversations
                 WHERE session_id = ?
-                ORDER BY turn_num DESC
+                ORDER BY turn_num DESC, id DESC
                 LIMIT ?
             """, (session_id, limit))
 
             turns = [(row[0], row[1]) for row in cursor.fetchall()]
-            conn.close()
 
             return list(reversed(turns))
         except Exception as e:
             self.logger.error("memory_get_failed %s", json.dumps({"error": str(e)}))
             return []
 
-    def search_semantic(self, query: str, limit: int = 3) -> List[Tuple[str, float]]:
+    def search_semantic(self, query: str, limit: int = 3) -> list[tuple[str, float]]:
         """Semantic search using embeddings with threshold filtering."""
         if not self.enabled or not self.embedder:
             return []
+        self._sync_reads()
 
         try:
-            query_emb = self.embedder.encode(query)
-
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.execute("""
-                SELECT content, embedding, timestamp FROM conversations
-                WHERE embedding IS NOT NULL
-                ORDER BY id DESC
-                LIMIT 100
-            """)
+            ranked, _ = self._rank_semantic(query, limit)
+            return [(content, score) for _, content, score in ranked]
+        except (sqlite3.Error, RuntimeError, ValueError) as e:
+            self.logger.error("semantic_search_failed %s", json.dumps({"error": str(e)}))
+            return []
 
-            results = []
-            excluded = []
-
-            row_count = 0
-            for content, emb_bytes, ts in cursor:
-                row_count += 1
-                self.logger.debug("semantic_search_row %s", json.dumps({"row": row_count, "has_emb": emb_bytes is not None, "emb_len": len(emb_bytes) if emb_bytes else 0, "content_preview": content[:50]}))
-                if emb_bytes:
-                    try:
-                        emb = np.frombuffer(emb_bytes, dtype=np.float32)
-                        similarity = np.dot(query_emb, emb) / (np.linalg.norm(query_emb) * np.linalg.norm(emb))
-                        # Apply recency boost (newer = higher)
-                        # Calculate recency boost: newer memories get higher weight
-                        from datetime import datetime
-                        age_hours = (datetime.now() - datetime.fromisoformat(ts)).total_seconds() / 3600
-                        recency_boost = max(0.0, 1.0 - (age_hours / 720))  # Decay over 30 days
-                        score = float(similarity * (0.7 + 0.3 * recency_boost))
-
-                        # Filter out query echoes (>0.95 similarity)
-                        if score > 0.95:
-                            self.logger.debug("semantic_echo_filtered %s", json.dumps({"score": round(score, 4), "content": content[:60]}))
-                            continue
-                        if score >= self.semantic_threshold:
-                            results.append((content, score))
-                        elif score >= self.semantic_threshold - 0.05:
-                            # Track near-misses (within 0.05 of threshold)
-                            excluded.append((content[:60], score))
-                    except Exception as e:
-                        self.logger.error("semantic_search_row_failed %s", json.dumps({"row": row_count, "error": str(e), "type": type(e).__name__, "content": content[:50]}))
-                        continue
+    def _rank_semantic(self, query: str, limit: int, shortlist: list[int] | None = None
+                       ) -> tuple[list[tuple[int, str, float]], set[int]]:
+        """Score stored vectors against ``query``; returns ([(id, content, score)], echo ids).
 
-            self.logger.debug("semantic_search_complete %s", json.dumps({"rows_fetched": row_count, "results_count": len(results), "excluded_count": len(excluded)}))
-            conn.close()
+        ``shortlist`` restricts scoring to those row ids (FTS pre-filter);
+        otherwise the ANN index picks the candidates.
+        """
+        t0 = time.time()
+        query_emb = self._encode_batch([query])[0]
+        if query_emb is None:
+            return [], set()
+        if self.embeddings.dim is not None and query_emb.shape[0] != self.embeddings.dim:
+            self.logger.warning("semantic_dim_mismatch %s", json.dumps({
+                "query_dim": int(query_emb.shape[0]), "stored_dim": self.embeddings.dim}))
+            return [], set()
+        if shortlist is not None:
+            positions = self.embeddings.positions_for(shortlist)
+        else:
+            positions = self.index.candidates(query_emb, self.embeddings.count)
+        ids, scores = self.embeddings.score(query_emb, time.time(), positions)
+
+        # Filter out query echoes (>0.95 similarity)
+        echoes = scores > 0.95
+        above = (scores >= self.semantic_threshold) & ~echoes
+        near = (scores >= self.semantic_threshold - 0.05) & (scores < self.semantic_threshold)
+
+        above_idx = np.flatnonzero(above)
+        if len(above_idx) > limit:
+            part = np.argpartition(-scores[above_idx], limit - 1)[:limit]
+            above_idx = above_idx[part]
+        top_idx = above_idx[np.argsort(-scores[above_idx], kind="stable")]
+
+        near_idx = np.flatnonzero(near)
+        if len(near_idx) > 3:
+            near_idx = near_idx[np.argpartition(-scores[near_idx], 2)[:3]]
+
+        wanted = [int(ids[i]) for i in top_idx] + [int(ids[i]) for i in near_idx]
+        contents = self._fetch_contents(wanted)
+        top_results = [(int(ids[i]), contents[int(ids[i])], float(scores[i]))
+                       for i in top_idx if int(ids[i]) in contents]
+        shard_hits = 0
+        if shortlist is None and len(top_results) < limit:
+            cold = self.shards.semantic(self.pool.reader(), query_emb, self.embedding_model,
+                                        self.semantic_threshold, limit - len(top_results))
+            shard_hits = len(cold)
+            top_results.extend(cold)
+
+        # Log summary
+        self.logger.info("semantic_search %s", json.dumps({
+            "query_chars": len(query),
+            "index": "shortlist" if shortlist is not None else self.index.kind,
+            "rows_scored": len(ids),
+            "echoes_filtered": int(echoes.sum()),
+            "total_scored": int(above.sum() + near.sum()),
+            "above_threshold": int(above.sum()),
+            "returned": len(top_results),
+            "shard_hits": shard_hits,
+            "excluded_near_miss": int(near.sum()),
+            "threshold": self.semantic_threshold,
+            "ms": round((time.time() - t0) * 1000, 2),
+            "embedding_cache": self.embedding_cache.stats()
+        }))
 
-            # Sort by score and return top matches
-            results.sort(key=lambda x: x[1], reverse=True)
-            top_results = results[:limit]
+        # Log top results with scores
+        for i, (_, content, score) in enumerate(top_results):
+            self.logger.debug("semantic_hit %s", json.dumps({
+                "rank": i + 1,
+                "score": round(score, 4),
+                "content": content[:80]
+            }))
 
-            # Log summary
-            self.logger.info("semantic_search %s", json.dumps({
-                "query_chars": len(query),
-                "total_scored": len(results) + len(excluded),
-                "above_threshold": len(results),
-                "returned": len(top_results),
-                "excluded_near_miss": len(excluded),
-                "threshold": self.semantic_threshold
+        # Log excluded near-misses
+        for i in near_idx:
+            content = contents.get(int(ids[i]), "")
+            self.logger.debug("semantic_excluded %s", json.dumps({
+                "score": round(float(scores[i]), 4),
+                "threshold": self.semantic_threshold,
+                "delta": round(self.semantic_threshold - float(scores[i]), 4),
+                "content": content[:60]
             }))
 
-            # Log top results with scores
-            for i, (content, score) in enumerate(top_results):
-                self.logger.debug("semantic_hit %s", json.dumps({
-                    "rank": i + 1,
-                    "score": round(score, 4),
-                    "content": content[:80]
-                }))
+        return top_results, {int(i) for i in ids[echoes]}
 
-            # Log excluded near-misses
-            for content_preview, score in excluded[:3]:  # Limit to top 3 near-misses
-                self.logger.debug("semantic_excluded %s", json.dumps({
-                    "score": round(score, 4),
-                    "threshold": self.semantic_threshold,
-                    "delta": round(self.semantic_threshold - score, 4),
-                    "content": content_preview
-                }))
+    def _fetch_contents(self, row_ids: list[int]) -> dict[int, str]:
+        """Look up content for a handful of row ids."""
+        if not row_ids:
+            return {}
+        placeholders = ",".join("?" * len(row_ids))
+        cursor = self.pool.reader().execute(
+            f"SELECT id, content FROM conversations WHERE id IN ({placeholders})", row_ids)
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    # Common words that would make an OR query match nearly every row
+    FTS_STOPWORDS = frozenset(
+        ["a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "could", "did", "do", "does", "for", "from", "had", "has", "have", "how", "i", "if", "in", "is", "it", "its", "me", "my", "no", "not", "of", "on", "or", "our", "so", "than", "that", "the", "their", "them", "then", "there", "these", "they", "this", "to", "was", "we", "were", "what", "when", "where", "which", "who", "why", "will", "with", "would", "you", "your"]
+    )
+
+    @classmethod
+    def fts_terms(cls, text: str, max_terms: int = 12) -> list[str]:
+        """Distinct lower-cased content words of ``text``, in order."""
+        terms = []
+        for word in re.findall(r"\w+", text.lower()):
+            if len(word) > 2 and word not in cls.FTS_STOPWORDS and word not in terms:
+                terms.append(word)
+        return terms[:max_terms]
+
+    @classmethod
+    def fts_query(cls, text: str, max_terms: int = 12) -> str | None:
+        """Turn free text into a safe FTS5 OR query of quoted content words."""
+        terms = cls.fts_terms(text, max_terms)
+        if not terms:
+            return None
+        return " OR ".join(f'"{t}"' for t in terms[:max_terms])
 
-            return top_results
-        except Exception as e:
-            self.logger.error("semantic_search_failed %s", json.dumps({"error": str(e)}))
+    def _rank_fts(self, query: str, limit: int) -> list[tuple[int, str]]:
+        """BM25-ordered (id, content) matches for free-text ``query``."""
+        match = self.fts_query(query)
+        if not match:
+            return []
+        conn = self.pool.reader()
+        hits = conn.execute("""
+            SELECT rowid, content FROM conversations_fts
+            WHERE conversations_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (match, limit)).fetchall()
+        # Hot shard first; cold months only when recall is short
+        if len(hits) < limit:
+            hits.extend(self.shards.fts(conn, match, limit - len(hits)))
+        return hits
+
+    def _admit_fts(self, query: str, fts_hits: list[tuple[int, str]],
+                   semantic_ids: set[int]) -> list[tuple[int, str]]:
+        """Drop weak FTS-only OR matches before fusion.
+
+        A hit outside the semantic list must match at least
+        ``hybrid_fts_min_coverage`` of the query's content terms, or clear
+        ``semantic_threshold`` on its own vector; otherwise a single shared
+        word would earn it an RRF score.
+        """
+        terms = set(self.fts_terms(query))
+        if not terms:
+            return fts_hits
+        weak = [row_id for row_id, content in fts_hits if row_id not in semantic_ids
+                and len(terms.intersection(re.findall(r"\w+", content.lower())))
+                < self.hybrid_fts_min_coverage * len(terms)]
+        if not weak:
+            return fts_hits
+        close: set[int] = set()
+        query_emb = self._encode_batch([query])[0]
+        if query_emb is not None and query_emb.shape[0] == self.embeddings.dim:
+            ids, scores = self.embeddings.score(query_emb, time.time(), self.embeddings.positions_for(weak))
+            close = {int(i) for i in ids[(scores >= self.semantic_threshold) & (scores <= 0.95)]}
+        dropped = set(weak) - close
+        return [hit for hit in fts_hits if hit[0] not in dropped]
+
+    def _timed(self, fn, *args):
+        t0 = time.time()
+        result = fn(*args)
+        return result, round((time.time() - t0) * 1000, 2)
+
+    def search_hybrid(self, query: str, limit: int = 3,
+                      timings: dict[str, Any] | None = None) -> list[tuple[str, float]]:
+        """FTS5 + semantic retrieval merged with reciprocal-rank fusion.
+
+        Both searches run concurrently on a small thread pool, so latency is
+        bounded by the slower one. On very large histories with the flat
+        index, FTS runs first and only its shortlist is vector-scored.
+        Stage timings (ms) are written into ``timings`` when given.
+        """
+        if not self.enabled:
             return []
+        self._sync_reads()
+        timings = timings if timings is not None else {}
+        t0 = time.time()
+        query_norm = " ".join(query.lower().split())
+        semantic_depth = max(limit, self.hybrid_fts_limit)
+
+        try:
+            use_prefilter = (self.index.kind == "flat"
+                             and self.embeddings.count >= self.prefilter_min_rows)
+            if use_prefilter:
+                timings["mode"] = "prefilter"
+                fts_hits, timings["fts_ms"] = self._timed(
+                    self._rank_fts, query, self.prefilter_candidates)
+                shortlist = [row_id for row_id, _ in fts_hits]
+                if len(shortlist) >= limit:
+                    (semantic_hits, echo_ids), timings["semantic_ms"] = self._timed(
+                        self._rank_semantic, query, semantic_depth, shortlist)
+                else:
+                    (semantic_hits, echo_ids), timings["semantic_ms"] = self._timed(
+                        self._rank_semantic, query, semantic_depth)
+                fts_hits = fts_hits[:self.hybrid_fts_limit]
+            else:
+                timings["mode"] = "parallel"
+                if self._search_pool is None:
+                    self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-search")
+                fts_future = self._search_pool.submit(self._timed, self._rank_fts, query, self.hybrid_fts_limit)
+                sem_future = self._search_pool.submit(self._timed, self._rank_semantic, query, semantic_depth)
+                fts_hits, timings["fts_ms"] = fts_future.result()
+                (semantic_hits, echo_ids), timings["semantic_ms"] = sem_future.result()
+
+            t_fuse = time.time()
+            fts_matched = len(fts_hits)
+            fts_hits = self._admit_fts(query, fts_hits, {row_id for row_id, _, _ in semantic_hits})
+            fused: dict[int, float] = {}
+            contents: dict[int, str] = {}
+            for rank, (row_id, content, _) in enumerate(semantic_hits):
+                fused[row_id] = fused.get(row_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+                contents[row_id] = content
+            fts_rank = 0
+            for row_id, content in fts_hits:
+                # Drop the query's own turn (stored just before retrieval)
+                if row_id in echo_ids or " ".join(content.lower().split()) == query_norm:
+                    continue
+                fused[row_id] = fused.get(row_id, 0.0) + 1.0 / (self.rrf_k + fts_rank + 1)
+                contents[row_id] = content
+                fts_rank += 1
+
+            ranked = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            results = [(contents[row_id], score) for row_id, score in ranked]
+            timings["fusion_ms"] = round((time.time() - t_fuse) * 1000, 2)
+            timings["total_ms"] = round((time.time() - t0) * 1000, 2)
 
-    def search_fts(self, query: str, limit: int = 5) -> List[str]:
+            self.logger.info("hybrid_search %s", json.dumps({
+                "query_chars": len(query),
+                "fts_hits": len(fts_hits),
+                "fts_dropped": fts_matched - len(fts_hits),
+                "semantic_hits": len(semantic_hits),
+                "returned": len(results),
+                **timings
+            }))
+            return results
+        except (sqlite3.Error, RuntimeError, ValueError) as e:
+            self.logger.error("hybrid_search_failed %s", json.dumps({"error": str(e)}))
+            return []
+
+    def search_fts(self, query: str, limit: int = 5) -> list[str]:
         """Full-text search."""
         if not self.enabled:
             return []
+        self._sync_reads()
 
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.pool.reader()
             cursor = conn.execute("""
                 SELECT content FROM conversations_fts
                 WHERE conversations_fts MATCH ?
@@ -471,7 +2341,8 @@ class MemoryStore:
             """, (query, limit))
 
             results = [row[0] for row in cursor.fetchall()]
-            conn.close()
+            if len(results) < limit:
+                results.extend(content for _, content in self.shards.fts(conn, query, limit - len(results)))
 
             return results
         except Exception as e:
@@ -483,23 +2354,21 @@ class MemoryStore:
 # Audio Capture with VAD
 # =========================
 
-    def get_latest_session(self, max_age_hours: int = 24) -> Optional[str]:
+    def get_latest_session(self, max_age_hours: int = 24) -> str | None:
         """Get most recent session if within age limit."""
         if not self.enabled:
             return None
+        self._sync_reads()
 
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.pool.reader()
             cursor = conn.execute("""
-                SELECT session_id, MAX(timestamp) as last_activity
-                FROM conversations
-                GROUP BY session_id
-                ORDER BY last_activity DESC
+                SELECT session_id, last_ts FROM sessions
+                ORDER BY last_ts DESC, rowid DESC
                 LIMIT 1
             """)
 
             row = cursor.fetchone()
-            conn.close()
 
             if row:
                 session_id, last_activity = row
@@ -519,39 +2388,971 @@ class MemoryStore:
             return None
 
 
-    def get_session_info(self, session_id: str) -> Dict[str, Any]:
+    def get_session_info(self, session_id: str) -> dict[str, Any]:
         """Get session metadata."""
         if not self.enabled:
             return {}
+        self._sync_reads()
 
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.pool.reader()
             cursor = conn.execute("""
-                SELECT
-                    COUNT(*) as turn_count,
-                    MIN(timestamp) as started,
-                    MAX(timestamp) as last_activity
-                FROM conversations
+                SELECT turn_count, first_ts, last_ts, last_turn_num
+                FROM sessions
                 WHERE session_id = ?
             """, (session_id,))
 
-            row = cursor.fetchone()
-            conn.close()
+            row = cursor.fetchone() or (0, None, None, 0)
 
-            if row:
-                return {
-                    "turn_count": row[0],
-                    "started": row[1],
-                    "last_activity": row[2]
-                }
-            return {}
-        except Exception as e:
+            return {
+                "turn_count": row[0],
+                "started": row[1],
+                "last_activity": row[2],
+                "last_turn_num": row[3]
+            }
+        except (sqlite3.Error, RuntimeError) as e:
             self.logger.error("get_session_info_failed %s", json.dumps({"error": str(e)}))
             return {}
+
+    def get_turns(self, session_id: str, after_turn: int = 0,
+                  through_turn: int | None = None) -> list[tuple[int, str, str]]:
+        """(turn_num, role, content) with after_turn < turn_num <= through_turn, oldest first."""
+        if not self.enabled:
+            return []
+        self._sync_reads()
+
+        try:
+            conn = self.pool.reader()
+            cursor = conn.execute("""
+                SELECT turn_num, role, content FROM conversations
+                WHERE session_id = ? AND turn_num > ? AND turn_num <= ?
+                ORDER BY turn_num, id
+            """, (session_id, after_turn, through_turn if through_turn is not None else 2 ** 62))
+            return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+        except (sqlite3.Error, RuntimeError) as e:
+            self.logger.error("memory_get_failed %s", json.dumps({"error": str(e)}))
+            return []
+
+    def get_summary(self, session_id: str) -> tuple[str, int]:
+        """Rolling summary of a session and the last turn_num it covers ("", 0 if none)."""
+        if not self.enabled:
+            return "", 0
+
+        try:
+            row = self.pool.reader().execute(
+                "SELECT summary, through_turn FROM session_summaries WHERE session_id = ?",
+                (session_id,)).fetchone()
+            return (row[0], row[1]) if row else ("", 0)
+        except (sqlite3.Error, RuntimeError) as e:
+            self.logger.error("memory_get_failed %s", json.dumps({"error": str(e)}))
+            return "", 0
+
+    def save_summary(self, session_id: str, summary: str, through_turn: int,
+                     model: str | None = None):
+        """Replace the rolling summary of a session."""
+        if not self.enabled:
+            return
+        with self.pool.write() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO session_summaries (session_id, summary, through_turn, model, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (session_id, summary, through_turn, model))
+
+    # -- retention / compaction --
+
+    @contextmanager
+    def active_turn(self):
+        """Mark a voice turn in flight so background maintenance backs off."""
+        self.turn_active.set()
+        try:
+            yield
+        finally:
+            self.turn_active.clear()
+
+    def _wait_idle(self) -> bool:
+        """Wait until no turn is active; False if the store is shutting down."""
+        while self.turn_active.is_set():
+            if self._stop.wait(0.1):
+                return False
+        return not self._stop.is_set()
+
+    def _compactor_loop(self):
+        """Run archiving and compaction at startup and then every cleanup_interval_s."""
+        while not self._stop.is_set():
+            if self.shard_hot_months > 0:
+                self.archive_shards()
+            self.compact()
+            if self._stop.wait(self.cleanup_interval_s):
+                return
+
+    def _history_cutoffs(self, conn: sqlite3.Connection) -> list[tuple[str, int, int]]:
+        """(session_id, turn_num, id) of the newest row each over-long session must lose.
+
+        One index seek per session over (session_id, turn_num); rows at or
+        before the cutoff stay expired however many turns arrive later.
+        """
+        cutoffs = []
+        sessions = conn.execute(
+            "SELECT session_id FROM sessions WHERE turn_count > ?", (self.max_history,)).fetchall()
+        for (session_id,) in sessions:
+            row = conn.execute("""
+                SELECT turn_num, id FROM conversations WHERE session_id = ?
+                ORDER BY turn_num DESC, id DESC LIMIT 1 OFFSET ?
+            """, (session_id, self.max_history)).fetchone()
+            if row:
+                cutoffs.append((session_id, row[0], row[1]))
+        return cutoffs
+
+    def _expired_ids(self, conn: sqlite3.Connection, rule: str, limit: int,
+                     cutoffs: list[tuple[str, int, int]] | None = None) -> list[int]:
+        """Next batch of row ids violating a retention rule.
+
+        The history rule works through ``cutoffs`` (from _history_cutoffs),
+        dropping each session once nothing before its cutoff is left.
+        """
+        if rule == "age":
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=self.cleanup_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+            rows = conn.execute(
+                "SELECT id FROM conversations WHERE timestamp < ? ORDER BY id LIMIT ?", (cutoff, limit))
+        elif rule == "sessions":
+            rows = conn.execute("""
+                SELECT id FROM conversations WHERE session_id IN (
+                    SELECT session_id FROM sessions
+                    ORDER BY last_ts DESC, rowid DESC
+                    LIMIT -1 OFFSET ?
+                ) ORDER BY id LIMIT ?
+            """, (self.max_sessions, limit))
+        else:  # history
+            while cutoffs:
+                session_id, turn_num, row_id = cutoffs[0]
+                ids = [r[0] for r in conn.execute("""
+                    SELECT id FROM conversations
+                    WHERE session_id = ? AND (turn_num < ? OR (turn_num = ? AND id <= ?))
+                    LIMIT ?
+                """, (session_id, turn_num, turn_num, row_id, limit))]
+                if ids:
+                    return ids
+                cutoffs.pop(0)
+            return []
+        return [r[0] for r in rows.fetchall()]
+
+    def compact(self, max_batches: int | None = None) -> dict[str, Any]:
+        """Enforce cleanup_age_days, max_sessions and max_history (turns per session).
+
+        Rows are deleted in small batches, each in its own short write
+        transaction, and the loop pauses whenever a voice turn is active.
+        Deleted rows are tombstoned in the embedding matrix. Afterwards FTS
+        segments are merged, free pages are returned to the OS (when the DB
+        uses incremental auto-vacuum) and the WAL is checkpointed.
+        """
+        stats: dict[str, Any] = {"age": 0, "sessions": 0, "history": 0, "batches": 0}
+        if not self.enabled or not self.cleanup_enabled:
+            return stats
+        self._sync_reads()
+        t0 = time.time()
+
+        try:
+            rules = []
+            if self.cleanup_age_days and self.cleanup_age_days > 0:
+                rules.append("age")
+            if self.max_sessions and self.max_sessions > 0:
+                rules.append("sessions")
+            if self.max_history and self.max_history > 0:
+                rules.append("history")
+
+            for rule in rules:
+                # Per-session cutoffs are found once per run, outside the writer lock
+                cutoffs = self._history_cutoffs(self.pool.reader()) if rule == "history" else None
+                while max_batches is None or stats["batches"] < max_batches:
+                    if not self._wait_idle():
+                        return stats
+                    with self.pool.write() as conn:
+                        ids = self._expired_ids(conn, rule, self.cleanup_batch_size, cutoffs)
+                        if not ids:
+                            break
+                        conn.executemany("DELETE FROM conversations WHERE id = ?", [(i,) for i in ids])
+                    self.embeddings.remove(ids)
+                    stats[rule] += len(ids)
+                    stats["batches"] += 1
+
+            deleted = stats["age"] + stats["sessions"] + stats["history"]
+            if deleted and self._wait_idle():
+                with self.pool.write() as conn:
+                    conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES('optimize')")
+                if self._wait_idle():
+                    with self.pool.write() as conn:
+                        freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                        conn.execute(f"PRAGMA incremental_vacuum({int(freed)})").fetchall()
+                    stats["pages_freed"] = freed
+                if self._wait_idle():
+                    with self.pool.write() as conn:
+                        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+
+            stats["ms"] = int((time.time() - t0) * 1000)
+            self.logger.info("memory_compaction %s", json.dumps(stats))
+            return stats
+        except Exception:
+            self.logger.exception("memory_compaction_failed")
+            return stats
+
+    # -- cold shards --
+
+    def archive_shards(self, hot_months: int | None = None) -> dict[str, Any]:
+        """Move whole months older than ``hot_months`` into read-only shard files.
+
+        Each month is copied into its shard first, then deleted from the hot
+        DB in small batches (the delete triggers keep FTS and sessions in
+        step). The copy is idempotent, so an interrupted run is simply
+        repeated.
+        """
+        hot_months = self.shard_hot_months if hot_months is None else hot_months
+        stats: dict[str, Any] = {"months": [], "archived": 0}
+        if not self.enabled or hot_months <= 0:
+            return stats
+        self._sync_reads()
+        t0 = time.time()
+
+        now = datetime.now(timezone.utc)
+        y, m = divmod(now.year * 12 + now.month - 1 - hot_months + 1, 12)
+        cutoff = f"{y:04d}-{m + 1:02d}"
+        try:
+            months = [r[0] for r in self.pool.reader().execute("""
+                SELECT DISTINCT substr(timestamp, 1, 7) FROM conversations
+                WHERE substr(timestamp, 1, 7) < ? ORDER BY 1
+            """, (cutoff,))]
+            fmt = self.get_meta("embedding_format") or self.codec.fmt
+            for month in months:
+                if not self._wait_idle():
+                    break
+                self.flush()
+                path, copied, max_id = self.shards.write_month(self.db_path, month, fmt)
+                moved = 0
+                while self._wait_idle():
+                    with self.pool.write() as conn:
+                        # Only drop rows the shard actually holds
+                        ids = [r[0] for r in conn.execute("""
+                            SELECT id FROM conversations WHERE substr(timestamp, 1, 7) = ? AND id <= ?
+                            ORDER BY id LIMIT ?
+                        """, (month, max_id, self.cleanup_batch_size))]
+                        if not ids:
+                            break
+                        conn.executemany("DELETE FROM conversations WHERE id = ?", [(i,) for i in ids])
+                    self.embeddings.remove(ids)
+                    moved += len(ids)
+                stats["months"].append({"month": month, "path": str(path), "copied": copied, "moved": moved})
+                stats["archived"] += moved
+            if stats["archived"]:
+                with self.pool.write() as conn:
+                    conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES('optimize')")
+            stats["ms"] = int((time.time() - t0) * 1000)
+            self.logger.info("memory_shards_archived %s", json.dumps(stats))
+        except Exception:
+            self.logger.exception("memory_shard_archive_failed")
+        return stats
+
+    # -- re-embedding / backfill --
+
+    def reembed(self, max_chunks: int | None = None) -> dict[str, Any]:
+        """Embed rows whose vector is NULL or came from another model, in id order.
+
+        Progress is checkpointed in memory_meta with every chunk, so an
+        interrupted run resumes where it stopped (a model change restarts
+        it). The job yields while a voice turn is active. When it finishes,
+        the in-memory matrix and ANN index are reloaded from the DB.
+        """
+        stats: dict[str, Any] = {"model": self.embedding_model, "embedded": 0, "failed": 0, "chunks": 0}
+        if not self.enabled or not self.embedder:
+            return stats
+        self._sync_reads()
+        t0 = time.time()
+
+        checkpoint = json.loads(self.get_meta("reembed_checkpoint") or "{}")
+        last_id = checkpoint.get("last_id", 0) if checkpoint.get("model") == self.embedding_model else 0
+        stats["resumed_from"] = last_id
+
+        try:
+            complete = False
+            while max_chunks is None or stats["chunks"] < max_chunks:
+                if not self._wait_idle():
+                    return stats
+                rows = self.pool.reader().execute("""
+                    SELECT id, content FROM conversations
+                    WHERE id > ? AND ref_count > 0 AND (embedding IS NULL OR embedding_model IS NOT ?)
+                    ORDER BY id LIMIT ?
+                """, (last_id, self.embedding_model, self.reembed_batch_size)).fetchall()
+                if not rows:
+                    complete = True
+                    break
+                vecs = self._encode_batch([content for _, content in rows], use_cache=False)
+                updates = [(*self._embedding_columns(vec), row_id)
+                           for (row_id, _), vec in zip(rows, vecs) if vec is not None]
+                if not updates:
+                    # Embedder is failing; keep the checkpoint and retry on the next run
+                    stats["failed"] += len(rows)
+                    break
+                last_id = rows[-1][0]
+                with self.pool.write() as conn:
+                    conn.executemany("""
+                        UPDATE conversations SET embedding = ?, embedding_model = ?, embedding_dim = ?
+                        WHERE id = ?
+                    """, updates)
+                    self._set_meta(conn, "reembed_checkpoint", json.dumps({
+                        "model": self.embedding_model, "last_id": last_id}))
+                stats["embedded"] += len(updates)
+                stats["failed"] += len(rows) - len(updates)
+                stats["chunks"] += 1
+                if self.reembed_pause_s and self._stop.wait(self.reembed_pause_s):
+                    return stats
+
+            if complete and not stats["failed"]:
+                self.set_meta("reembed_checkpoint", None)
+            if stats["embedded"]:
+                self._reload_embeddings()
+            stats["ms"] = int((time.time() - t0) * 1000)
+            self.logger.info("memory_reembed %s", json.dumps(stats))
+            return stats
+        except Exception:
+            self.logger.exception("memory_reembed_failed")
+            return stats
+
+    def _reload_embeddings(self):
+        """Rebuild the in-memory matrix (and sidecar) and the ANN index from the DB."""
+        self.flush()
+        # Holding the writer lock keeps new turns from landing in the matrix being replaced
+        with self.pool.write_lock:
+            self.db_path.with_suffix(".ivf.npz").unlink(missing_ok=True)
+            self.index = self._make_index()
+            if self.sidecar is not None:
+                self.rebuild_sidecar()
+            else:
+                self.embeddings = EmbeddingMatrix(sidecar=None, codec=self.codec)
+                self._load_embedding_rows()
+            self.index.sync(self.embeddings)
+
+    # -- bulk import / export --
+
+    def iter_export(self, session_id: str | None = None, chunk: int = 2048) -> Iterator[dict[str, Any]]:
+        """Stream turns in id order as plain dicts, one keyset-paginated chunk at a time."""
+        self._sync_reads()
+        conn = self.pool.reader()
+        last_id = 0
+        where = "id > ?" + (" AND session_id = ?" if session_id else "")
+        while True:
+            args = (last_id, session_id, chunk) if session_id else (last_id, chunk)
+            rows = conn.execute(f"""
+                SELECT id, session_id, turn_num, role, content, timestamp, ref_count, metadata
+                FROM conversations WHERE {where} ORDER BY id LIMIT ?
+            """, args).fetchall()
+            if not rows:
+                return
+            for row_id, sid, turn_num, role, content, ts, ref_count, metadata in rows:
+                yield {
+                    "session_id": sid, "turn_num": turn_num, "role": role, "content": content,
+                    "timestamp": ts, "ref_count": ref_count,
+                    "metadata": json.loads(metadata) if metadata else {}
+                }
+            last_id = rows[-1][0]
+
+    def import_turns(self, records: Iterable[dict[str, Any]], batch_size: int | None = None) -> dict[str, Any]:
+        """Bulk-insert turns from an iterable of export-format dicts.
+
+        Records are consumed lazily, embedded ``batch_size`` at a time in one
+        ``encode`` call and inserted in one transaction per batch. The FTS
+        and session triggers are dropped for the duration; the FTS index and
+        session summaries are rebuilt once at the end. A marker in
+        memory_meta makes the next startup finish the rebuild if the import
+        is interrupted.
+        """
+        batch_size = batch_size or self.cfg.get("import_batch_size", 1024)
+        stats: dict[str, Any] = {"imported": 0, "skipped": 0, "embedded": 0, "batches": 0}
+        self.flush()
+        t0 = time.time()
+
+        with self.pool.write() as conn:
+            self._set_meta(conn, "import_in_progress", "1")
+            conn.execute("DROP TRIGGER IF EXISTS conversations_ai")
+            conn.execute("DROP TRIGGER IF EXISTS conversations_ai_sessions")
+
+        try:
+            batch: list[tuple[str, int, str, str, str, str, int]] = []
+            for record in records:
+                turn = self._import_row(record)
+                if turn is None:
+                    stats["skipped"] += 1
+                    continue
+                batch.append(turn)
+                if len(batch) >= batch_size:
+                    stats["embedded"] += self._import_batch(batch)
+                    stats["imported"] += len(batch)
+                    stats["batches"] += 1
+                    batch = []
+            if batch:
+                stats["embedded"] += self._import_batch(batch)
+                stats["imported"] += len(batch)
+                stats["batches"] += 1
+        finally:
+            self._finish_import()
+
+        stats["ms"] = int((time.time() - t0) * 1000)
+        self.logger.info("memory_import %s", json.dumps(stats))
+        return stats
+
+    @staticmethod
+    def _import_row(record: dict[str, Any]) -> tuple[str, int, str, str, str, str, int] | None:
+        """Normalise one export-format record; None if it is unusable (counted as skipped)."""
+        if not isinstance(record, dict) or not isinstance(record.get("content"), str) or not record["content"]:
+            return None
+        try:
+            turn_num = int(record.get("turn_num") or 0)
+            ref_count = max(1, int(record.get("ref_count") or 1))
+        except (TypeError, ValueError):
+            return None
+        ts = record.get("timestamp")
+        ts = normalize_sqlite_ts(ts) if ts else sqlite_utc_now()
+        if ts is None:
+            return None
+        metadata = record.get("metadata") or {}
+        return (
+            str(record.get("session_id") or "imported"),
+            turn_num,
+            str(record.get("role") or "user"),
+            record["content"],
+            ts,
+            metadata if isinstance(metadata, str) else json.dumps(metadata),
+            ref_count,
+        )
+
+    def _import_batch(self, turns: list[tuple[str, int, str, str, str, str, int]]) -> int:
+        """Embed and insert one import batch; returns how many rows got embeddings."""
+        vecs = self._encode_batch([t[3] for t in turns], use_cache=False)
+        rows = [
+            (session_id, turn_num, role, content, ts, *self._embedding_columns(vec),
+             self.content_hash(role, content), ref_count, metadata)
+            for (session_id, turn_num, role, content, ts, metadata, ref_count), vec in zip(turns, vecs)
+        ]
+        with self.pool.write_lock:
+            with self.pool.write() as conn:
+                conn.executemany("""
+                    INSERT INTO conversations (session_id, turn_num, role, content, timestamp,
+                                               embedding, embedding_model, embedding_dim,
+                                               content_hash, ref_count, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+            first_id = last_id - len(turns) + 1
+            embedded = 0
+            for i, (turn, vec) in enumerate(zip(turns, vecs)):
+                if vec is not None:
+                    self.embeddings.append(first_id + i, vec, sqlite_ts_to_epoch(turn[4]))
+                    embedded += 1
+            self.index.sync(self.embeddings)
+        return embedded
+
+    def _finish_import(self):
+        """Restore the deferred triggers and rebuild FTS and session summaries."""
+        t0 = time.time()
+        with self.pool.write() as conn:
+            self._create_schema(conn)
+            conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES('rebuild')")
+            # Upsert rather than DELETE + INSERT: deleting a session row drops its
+            # rolling summary (sessions_ad_summaries), and imports must keep those
+            conn.execute("""
+                INSERT INTO sessions (session_id, first_ts, last_ts, turn_count, last_turn_num)
+                SELECT session_id, MIN(timestamp), MAX(timestamp), COUNT(*), MAX(turn_num)
+                FROM conversations WHERE true GROUP BY session_id
+                ON CONFLICT(session_id) DO UPDATE SET
+                    first_ts = excluded.first_ts,
+                    last_ts = excluded.last_ts,
+                    turn_count = excluded.turn_count,
+                    last_turn_num = excluded.last_turn_num
+            """)
+            conn.execute("""
+                DELETE FROM sessions WHERE NOT EXISTS
+                    (SELECT 1 FROM conversations c WHERE c.session_id = sessions.session_id)
+            """)
+            self._set_meta(conn, "import_in_progress", None)
+        self.logger.info("memory_import_indexes_rebuilt %s", json.dumps({"ms": int((time.time() - t0) * 1000)}))
+
+
+def as_mono_float32(audio: np.ndarray) -> np.ndarray:
+    """Canonical audio buffer: 1-D C-contiguous float32 in [-1, 1].
+
+    Capture already produces this, so consumers get the very same array back;
+    int16 PCM or (N, 1) device arrays are converted once.
+    """
+    if audio.ndim > 1:
+        audio = audio.reshape(-1)
+    if audio.dtype == np.int16:
+        return np.multiply(audio, np.float32(1 / 32768), dtype=np.float32)
+    if audio.dtype != np.float32 or not audio.flags.c_contiguous:
+        return np.ascontiguousarray(audio, dtype=np.float32)
+    return audio
+
+
+class AudioRing:
+    """Preallocated int16 ring buffer written by the capture callback, read through cursors.
+
+    Positions are absolute sample counts since the stream opened. A cursor that
+    falls more than ``capacity`` samples behind the writer has lost audio: it
+    skips to the oldest retained sample and the gap is counted as an overrun.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = int(capacity)
+        self.buf = np.zeros(self.capacity, dtype=np.int16)
+        self.written = 0
+        self.device_overflows = 0  # blocks the driver flagged as dropped
+        self.overruns = 0          # times a cursor was lapped by the writer
+        self.lost_samples = 0
+        self.closed = False
+        self.readers_waiting = 0
+        self.demand = 0  # furthest position a blocked reader has asked for
+        self._cond = threading.Condition()
+
+    def write(self, block: np.ndarray, overflow: bool = False):
+        """Append a block (any shape, int16); called from the audio callback thread."""
+        data = block.reshape(-1)
+        n = len(data)
+        if n > self.capacity:
+            data = data[-self.capacity:]
+        with self._cond:
+            start = (self.written + n - len(data)) % self.capacity
+            first = min(len(data), self.capacity - start)
+            self.buf[start:start + first] = data[:first]
+            self.buf[:len(data) - first] = data[first:]
+            self.written += n
+            if overflow:
+                self.device_overflows += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """Wake blocked readers; reads past the end return None from now on."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        with self._cond:
+            self.closed = False
+
+    def wait_for_reader(self, timeout: float | None = None) -> bool:
+        """Block until a cursor is waiting for samples not yet written (lockstep replay)."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: (self.readers_waiting > 0 and self.written < self.demand) or self.closed, timeout)
+
+    def cursor(self, back_samples: int = 0, at: int | None = None) -> RingCursor:
+        """Cursor at the write position minus back_samples, or at absolute position ``at``.
+
+        Either way it is clamped to the audio still retained in the ring.
+        """
+        with self._cond:
+            pos = self.written - int(back_samples) if at is None else min(int(at), self.written)
+            pos = max(0, self.written - self.capacity, pos)
+        return RingCursor(self, pos)
+
+    def _copy_into(self, pos: int, out: np.ndarray):
+        """Copy samples [pos, pos + len(out)) into out; float outputs are scaled to [-1, 1]."""
+        start = pos % self.capacity
+        first = min(len(out), self.capacity - start)
+        for src, dst in ((self.buf[start:start + first], out[:first]),
+                         (self.buf[:len(out) - first], out[first:])):
+            if out.dtype == np.int16:
+                dst[...] = src
+            else:
+                np.multiply(src, np.float32(1 / 32768), out=dst, dtype=np.float32)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "written": self.written,
+            "capacity": self.capacity,
+            "device_overflows": self.device_overflows,
+            "overruns": self.overruns,
+            "lost_samples": self.lost_samples,
+        }
+
+
+class RingCursor:
+    """Independent read position in an AudioRing (wake, command capture, diagnostics)."""
+
+    def __init__(self, ring: AudioRing, pos: int):
+        self.ring = ring
+        self.pos = pos
+        self.lost = 0
+
+    def available(self) -> int:
+        return self.ring.written - self.pos
+
+    def read(self, n: int, timeout: float | None = None) -> np.ndarray | None:
+        """Next n samples (int16 copy), blocking up to timeout; None on timeout or a closed ring."""
+        out = np.empty(n, dtype=np.int16)
+        return out if self.read_into(out, timeout) else None
+
+    def read_into(self, out: np.ndarray, timeout: float | None = None) -> bool:
+        """Fill out (int16, or float32 scaled to [-1, 1]) with the next len(out) samples.
+
+        Blocks up to timeout; False on timeout or a closed ring.
+        """
+        ring = self.ring
+        n = len(out)
+        with ring._cond:
+            if ring.written - self.pos < n:
+                ring.readers_waiting += 1
+                ring.demand = max(ring.demand, self.pos + n)
+                ring._cond.notify_all()
+                try:
+                    if not ring._cond.wait_for(lambda: ring.written - self.pos >= n or ring.closed, timeout):
+                        return False
+                finally:
+                    ring.readers_waiting -= 1
+            if ring.written - self.pos < n:
+                return False
+            oldest = ring.written - ring.capacity
+            if self.pos < oldest:
+                gap = oldest - self.pos
+                self.lost += gap
+                ring.overruns += 1
+                ring.lost_samples += gap
+                self.pos = oldest
+            ring._copy_into(self.pos, out)
+            self.pos += n
+        return True
+
+
+class VADEngine:
+    """Per-block speech decision against a continuously estimated noise floor.
+
+    The floor is the minimum block RMS over the last vad_floor_window_s
+    (minimum statistics: pauses between words expose the background level, so
+    steady fan or TV noise raises it while speech does not). Speech needs
+    vad_noise_margin times the floor, never less than vad_min_threshold. With
+    vad_adaptive off the fixed vad_threshold is used as before.
+    """
+
+    name = "base"
+
+    def __init__(self, cfg: dict[str, Any], sample_rate: int = 16000, block_size: int = 512):
+        self.sample_rate = sample_rate
+        self.fixed_threshold = float(cfg.get("vad_threshold", 0.02))
+        self.adaptive = bool(cfg.get("vad_adaptive", True))
+        self.margin = float(cfg.get("vad_noise_margin", 3.0))
+        self.min_threshold = float(cfg.get("vad_min_threshold", 0.004))
+        window = int(cfg.get("vad_floor_window_s", 5.0) * sample_rate / block_size)
+        self._levels: deque[float] = deque(maxlen=max(1, window))
+        # Until blocks are seen, the floor implied by the fixed threshold
+        self._seed_floor = self.fixed_threshold / self.margin
+        self.last_rms = 0.0
+
+    @property
+    def noise_floor(self) -> float:
+        if not self._levels:
+            return self._seed_floor
+        floor = min(self._levels)
+        # A short history may be all speech; only let the floor rise once half a window is seen
+        if len(self._levels) * 2 < self._levels.maxlen:
+            floor = min(floor, self._seed_floor)
+        return floor
+
+    @property
+    def threshold(self) -> float:
+        if not self.adaptive:
+            return self.fixed_threshold
+        return max(self.min_threshold, self.noise_floor * self.margin)
+
+    def is_speech(self, block: np.ndarray) -> bool:
+        samples = as_mono_float32(block)
+        rms = float(np.sqrt(np.dot(samples, samples) / len(samples))) if len(samples) else 0.0
+        speech = self._decide(samples, rms)
+        self._levels.append(rms)
+        self.last_rms = rms
+        return speech
+
+    def _decide(self, samples: np.ndarray, rms: float) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "vad": self.name,
+            "threshold": round(self.threshold, 5),
+            "noise_floor": round(self.noise_floor, 5),
+        }
+
+
+class RMSVAD(VADEngine):
+    """Block RMS above the (adaptive) threshold."""
+
+    name = "rms"
+
+    def _decide(self, samples: np.ndarray, rms: float) -> bool:
+        return rms >= self.threshold
+
+
+class SpectralVAD(VADEngine):
+    """Energy gate plus zero-crossing rate and spectral flatness, vectorised over sub-frames.
+
+    Broadband noise (fans, hiss) is spectrally flat with a high crossing
+    rate; voiced speech is peaky and crosses zero far less often. A block is
+    speech when most of its sub-frames pass all three tests.
+    """
+
+    name = "spectral"
+
+    def __init__(self, cfg: dict[str, Any], sample_rate: int = 16000, block_size: int = 512):
+        super().__init__(cfg, sample_rate, block_size)
+        self.frame = int(cfg.get("vad_frame", 256))
+        self.flatness_max = float(cfg.get("vad_flatness_max", 0.45))
+        self.zcr_max = float(cfg.get("vad_zcr_max", 0.4))
+        freqs = np.fft.rfftfreq(self.frame, 1.0 / sample_rate)
+        self._band = (freqs >= 100) & (freqs <= 4000)
+        self._window = np.hanning(self.frame).astype(np.float32)
+
+    def features(self, samples: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per-sub-frame (rms, zero-crossing rate, spectral flatness)."""
+        n = len(samples) // self.frame * self.frame
+        frames = samples[:n].reshape(-1, self.frame) if n else samples.reshape(1, -1)
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        if frames.shape[1] == self.frame:
+            power = np.abs(np.fft.rfft(frames * self._window, axis=1))[:, self._band] ** 2 + 1e-12
+            flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        else:
+            flatness = np.ones(len(frames))
+        return rms, zcr, flatness
+
+    def _decide(self, samples: np.ndarray, rms: float) -> bool:
+        if rms < self.threshold:
+            return False
+        frame_rms, zcr, flatness = self.features(samples)
+        votes = (frame_rms >= self.threshold) & (zcr <= self.zcr_max) & (flatness <= self.flatness_max)
+        return int(votes.sum()) * 2 >= len(votes)
+
+
+class WebRTCVAD(VADEngine):
+    """webrtcvad (GMM) over 30 ms frames; samples left over carry into the next block."""
+
+    name = "webrtc"
+
+    def __init__(self, cfg: dict[str, Any], sample_rate: int = 16000, block_size: int = 512):
+        super().__init__(cfg, sample_rate, block_size)
+        self._vad = webrtcvad.Vad(int(cfg.get("vad_webrtc_mode", 2)))
+        self.frame = sample_rate * 30 // 1000
+        self._carry = np.zeros(0, dtype=np.int16)
+        self._last = False
+
+    def _decide(self, samples: np.ndarray, rms: float) -> bool:
+        # Clip before the cast: full-scale (clipped mic) samples would otherwise wrap sign
+        scaled = np.clip(samples * 32768.0, -32768, 32767)
+        pcm = np.concatenate((self._carry, scaled.astype(np.int16)))
+        n = len(pcm) // self.frame * self.frame
+        self._carry = pcm[n:]
+        votes = [self._vad.is_speech(pcm[i:i + self.frame].tobytes(), self.sample_rate)
+                 for i in range(0, n, self.frame)]
+        if votes:
+            self._last = sum(votes) * 2 >= len(votes) and rms >= self.min_threshold
+        return self._last
+
+
+VAD_ENGINES = {"rms": RMSVAD, "spectral": SpectralVAD, "webrtc": WebRTCVAD}
+
+
+def create_vad(cfg: dict[str, Any], logger: logging.Logger, sample_rate: int = 16000,
+               block_size: int = 512) -> VADEngine:
+    """Build the orchestrator.vad_engine VAD (rms | spectral | webrtc)."""
+    engine = cfg.get("vad_engine", "rms")
+    if engine == "webrtc" and not WEBRTCVAD_AVAILABLE:
+        logger.warning("vad_engine_unavailable %s", json.dumps({"engine": engine, "fallback": "spectral"}))
+        engine = "spectral"
+    if engine not in VAD_ENGINES:
+        logger.warning("vad_engine_unknown %s", json.dumps({"engine": engine, "fallback": "rms"}))
+        engine = "rms"
+    return VAD_ENGINES[engine](cfg, sample_rate, block_size)
+
+
+class Endpointer:
+    """Chooses how much trailing silence ends an utterance.
+
+    silence_duration stays the ceiling so speech is never clipped by a pause
+    shorter than before. Utterances long enough to be a phrase end after
+    endpoint_hangover_ms, or after endpoint_min_hangover_ms when the voiced
+    tail has decayed to endpoint_decay_ratio of the utterance peak (a falling
+    phrase end rather than a mid-word stop).
+    """
+
+    def __init__(self, cfg: dict[str, Any]):
+        self.enabled = bool(cfg.get("endpointing", True))
+        self.max_hangover = float(cfg.get("silence_duration", 1.5))
+        self.hangover = min(self.max_hangover, cfg.get("endpoint_hangover_ms", 800) / 1000.0)
+        self.min_hangover = min(self.hangover, cfg.get("endpoint_min_hangover_ms", 600) / 1000.0)
+        self.min_speech = cfg.get("endpoint_min_speech_ms", 400) / 1000.0
+        self.decay_ratio = float(cfg.get("endpoint_decay_ratio", 0.3))
+        self.reset()
+
+    def reset(self):
+        self.voiced_s = 0.0
+        self.peak = 0.0
+        self._tail: deque[float] = deque(maxlen=3)
+
+    def voiced(self, rms: float, seconds: float):
+        """Record a voiced block."""
+        self.voiced_s += seconds
+        self.peak = max(self.peak, rms)
+        self._tail.append(rms)
+
+    def decayed(self) -> bool:
+        return bool(self._tail) and float(np.mean(self._tail)) < self.decay_ratio * self.peak
+
+    def silence_needed(self) -> tuple[float, str]:
+        """(trailing silence in seconds that ends the utterance, reason)."""
+        if not self.enabled or self.voiced_s < self.min_speech:
+            return self.max_hangover, "max_hangover"
+        if self.decayed():
+            return self.min_hangover, "decay"
+        return self.hangover, "hangover"
+
+
+def utterance_complete(text: str) -> bool:
+    """Heuristic: a (partial) transcript that reads as a finished request."""
+    text = text.strip()
+    if not text or text[-1] not in ".?!" or text.endswith("..."):
+        return False
+    last = re.sub(r"[^\w']", "", text.split()[-1].lower())
+    return last not in CONTINUATION_WORDS
+
+
+CONTINUATION_WORDS = {
+    "a", "an", "and", "the", "to", "of", "or", "but", "so", "because", "with", "for",
+    "if", "then", "um", "uh", "like", "my", "your", "is", "what", "about", "in", "on",
+}
+
+
+def load_audio_file(path: Path, sample_rate: int = 16000) -> np.ndarray:
+    """Decode a WAV (stdlib) or FLAC (soundfile) file to int16 mono at sample_rate."""
+    path = Path(path)
+    if path.suffix.lower() == ".wav":
+        with wave.open(str(path), "rb") as wav:
+            width, channels, rate = wav.getsampwidth(), wav.getnchannels(), wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+        if width == 1:
+            data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif width == 2:
+            data = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+        elif width == 4:
+            data = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+        else:
+            raise ValueError(f"unsupported WAV sample width {width} bytes: {path}")
+    elif path.suffix.lower() == ".flac":
+        if not SOUNDFILE_AVAILABLE:
+            raise RuntimeError(f"soundfile is required to read FLAC: {path}")
+        data, rate = soundfile.read(str(path), dtype="float32", always_2d=True)
+        channels = data.shape[1]
+        data = data.reshape(-1)
+    else:
+        raise ValueError(f"unsupported audio file (WAV/FLAC only): {path}")
+
+    if channels > 1:
+        data = data.reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate and len(data):
+        n_out = round(len(data) * sample_rate / rate)
+        data = np.interp(np.arange(n_out) * (rate / sample_rate), np.arange(len(data)), data)
+    return (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class ReplaySource:
+    """WAV/FLAC fixtures, or an .m3u/.txt playlist of them, played into the ring as a microphone.
+
+    Items are separated by replay_gap_ms of silence and followed by
+    replay_tail_ms so the last utterance can endpoint. replay_speed 1.0 is
+    real time, 4.0 four times faster; 0 is lockstep: a block is delivered
+    only while a capture is waiting, so nothing is skipped while the loop is
+    busy with STT/LLM/TTS and runs are fully deterministic.
+    """
+
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger, sample_rate: int = 16000):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.items = self.playlist(cfg.get("replay_input") or [])
+        self.gap = int(cfg.get("replay_gap_ms", 1000) * sample_rate / 1000)
+        self.lead = int(cfg.get("replay_lead_ms", 500) * sample_rate / 1000)
+        self.tail = int(cfg.get("replay_tail_ms", 3000) * sample_rate / 1000)
+        self.speed = float(cfg.get("replay_speed", 1.0))
+        self.loop = bool(cfg.get("replay_loop", False))
+        if not self.items:
+            raise ValueError("orchestrator.replay_input names no audio files")
+
+    @staticmethod
+    def playlist(source: Any) -> list[Path]:
+        """Expand replay_input (file, playlist file, or list of either) into audio file paths."""
+        if isinstance(source, (list, tuple)):
+            return [item for entry in source for item in ReplaySource.playlist(entry)]
+        path = Path(source).expanduser()
+        if path.suffix.lower() not in (".m3u", ".m3u8", ".txt"):
+            return [path]
+        items = []
+        for line in path.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                item = Path(line).expanduser()
+                items.append(item if item.is_absolute() else path.parent / item)
+        return items
+
+    def signal(self) -> Iterator[np.ndarray]:
+        """int16 segments in playback order: lead silence, items with gaps, tail silence."""
+        yield np.zeros(self.lead, dtype=np.int16)
+        while True:
+            for i, item in enumerate(self.items):
+                if i:
+                    yield np.zeros(self.gap, dtype=np.int16)
+                yield load_audio_file(item, self.sample_rate)
+            if not self.loop:
+                break
+            yield np.zeros(self.gap, dtype=np.int16)
+        yield np.zeros(self.tail, dtype=np.int16)
+
+    def play(self, ring: AudioRing, block_size: int, stop: threading.Event):
+        """Feed the ring block by block until the playlist ends (then close it) or stop is set."""
+        t0 = time.time()
+        written = 0
+        pending = np.zeros(0, dtype=np.int16)
+        self.logger.info("replay_start %s", json.dumps({
+            "items": len(self.items), "speed": self.speed, "loop": self.loop
+        }))
+        for segment in self.signal():
+            data = np.concatenate((pending, segment))
+            usable = len(data) // block_size * block_size
+            pending = data[usable:]
+            for start in range(0, usable, block_size):
+                if self.speed <= 0:
+                    while not ring.wait_for_reader(0.2):
+                        if stop.is_set():
+                            return
+                else:
+                    delay = t0 + written / (self.sample_rate * self.speed) - time.time()
+                    if stop.wait(max(0.0, delay)):
+                        return
+                if stop.is_set():
+                    return
+                ring.write(data[start:start + block_size])
+                written += block_size
+        elapsed = time.time() - t0
+        self.logger.info("replay_finished %s", json.dumps({
+            "audio_s": round(written / self.sample_rate, 2),
+            "wall_s": round(elapsed, 2),
+            "realtime_factor": round(written / self.sample_rate / elapsed, 2) if elapsed else None
+        }))
+        ring.close()
+
+
 class AudioCapture:
-    """Real audio capture with voice activity detection."""
+    """Real audio capture with voice activity detection.
+
+    The input device is opened once (lazily) in callback mode and feeds an
+    AudioRing; every capture reads from it through its own cursor, so there is
+    no per-call device open latency and no audio is dropped between calls.
+    """
 
-    def __init__(self, cfg: Dict[str, Any], logger: logging.Logger):
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger):
         self.cfg = cfg.get("orchestrator", {})
         self.logger = logger
         self.sample_rate = 16000
@@ -559,77 +3360,260 @@ class AudioCapture:
         self.chunk_size = 512
         self.vad_threshold = self.cfg.get("vad_threshold", 0.02)
         self.silence_duration = self.cfg.get("silence_duration", 1.5)
-
-        self.backend = AUDIO_BACKEND
+        self.vad = create_vad(self.cfg, logger, self.sample_rate, self.chunk_size)
+        self.endpointer = Endpointer(self.cfg)
+        # Audio kept from before the first voiced block (taken from the ring)
+        self.preroll_ms = self.cfg.get("preroll_ms", 500)
+        # Ring position of the first sample returned by the last capture
+        self.last_capture_start = 0
+        # Wall-clock end of the last voiced block and why the last capture ended
+        self.last_speech_end = 0.0
+        self.last_endpoint = ""
+        # Ring position where our own TTS playback (plus grace) ends; no capture
+        # reads audio from before it, so pre-roll never reaches into playback
+        self.playback_end_pos = 0
+
+        self.ring = AudioRing(int(self.cfg.get("ring_seconds", 30) * self.sample_rate))
+        self._close_device: Callable[[], None] | None = None
+        self._open_lock = threading.Lock()
+        self._reported = {"device_overflows": 0, "overruns": 0}
+
+        # orchestrator.audio_backend: auto (live device) | replay (files, see ReplaySource)
+        self.backend = "replay" if self.cfg.get("audio_backend") == "replay" else AUDIO_BACKEND
+        self.replay_done = threading.Event()
         self.logger.info("audio_backend %s", json.dumps({"backend": self.backend or "none"}))
 
-    def capture_until_silence(self, timeout: float = 10.0) -> Optional[np.ndarray]:
-        """Capture audio until silence detected."""
-        if not self.backend:
-            return None
+    # -- device --
 
-        frames = []
-        silence_chunks = 0
-        chunks_for_silence = int(self.silence_duration * self.sample_rate / self.chunk_size)
-        start_time = time.time()
+    def _open_device(self) -> Callable[[], None]:
+        """Open the input stream in callback mode; returns a function that closes it."""
+        if self.backend == "replay":
+            source = ReplaySource(self.cfg, self.logger, self.sample_rate)
+            stop = threading.Event()
 
-        self.logger.info("capture_begin %s", json.dumps({
-            "timeout_s": timeout, "vad": "rms", "threshold": self.vad_threshold
-        }))
+            def feed():
+                source.play(self.ring, self.chunk_size, stop)
+                if not stop.is_set():
+                    self.replay_done.set()
 
-        try:
-            if self.backend == "sounddevice":
-                with sd.InputStream(samplerate=self.sample_rate, channels=self.channels,
-                                   dtype='int16', blocksize=self.chunk_size) as stream:
-                    while time.time() - start_time < timeout:
-                        data, _ = stream.read(self.chunk_size)
-                        frames.append(data)
-
-                        # Simple RMS-based VAD
-                        rms = np.sqrt(np.mean(data.astype(np.float32) ** 2)) / 32768.0
-
-                        if rms < self.vad_threshold:
-                            silence_chunks += 1
-                            if silence_chunks >= chunks_for_silence:
-                                break
-                        else:
-                            silence_chunks = 0
+            thread = threading.Thread(target=feed, name="audio-replay", daemon=True)
+            thread.start()
 
-            elif self.backend == "pyaudio":
-                p = pyaudio.PyAudio()
-                stream = p.open(format=pyaudio.paInt16, channels=self.channels,
-                              rate=self.sample_rate, input=True,
-                              frames_per_buffer=self.chunk_size)
+            def close():
+                stop.set()
+                thread.join(timeout=1.0)
+            return close
 
-                while time.time() - start_time < timeout:
-                    data = stream.read(self.chunk_size, exception_on_overflow=False)
-                    audio_data = np.frombuffer(data, dtype=np.int16)
-                    frames.append(audio_data)
+        if self.backend == "sounddevice":
+            def callback(indata, frames, time_info, status):
+                self.ring.write(indata, overflow=bool(status.input_overflow))
 
-                    rms = np.sqrt(np.mean(audio_data.astype(np.float32) ** 2)) / 32768.0
+            stream = sd.InputStream(samplerate=self.sample_rate, channels=self.channels,
+                                    dtype='int16', blocksize=self.chunk_size, callback=callback)
+            stream.start()
 
-                    if rms < self.vad_threshold:
-                        silence_chunks += 1
-                        if silence_chunks >= chunks_for_silence:
-                            break
-                    else:
-                        silence_chunks = 0
+            def close():
+                stream.stop()
+                stream.close()
+            return close
+
+        if self.backend == "pyaudio":
+            p = pyaudio.PyAudio()
+
+            def callback(in_data, frame_count, time_info, status):
+                self.ring.write(np.frombuffer(in_data, dtype=np.int16),
+                                overflow=bool(status & pyaudio.paInputOverflow))
+                return None, pyaudio.paContinue
 
+            stream = p.open(format=pyaudio.paInt16, channels=self.channels,
+                            rate=self.sample_rate, input=True,
+                            frames_per_buffer=self.chunk_size, stream_callback=callback)
+            stream.start_stream()
+
+            def close():
                 stream.stop_stream()
                 stream.close()
                 p.terminate()
-        except Exception as e:
-            self.logger.error("capture_failed %s", json.dumps({"error": str(e)}))
+            return close
+
+        raise RuntimeError(f"unsupported audio backend: {self.backend}")
+
+    def start(self) -> bool:
+        """Open the device once; later calls are no-ops while it stays open."""
+        if not self.backend:
+            return False
+        with self._open_lock:
+            if self._close_device is not None:
+                return True
+            t0 = time.time()
+            try:
+                self.ring.reopen()
+                self._close_device = self._open_device()
+            except Exception:
+                self.logger.exception("audio_stream_failed")
+                return False
+            self.logger.info("audio_stream_open %s", json.dumps({
+                "backend": self.backend,
+                "ms": int((time.time() - t0) * 1000),
+                "ring_s": round(self.ring.capacity / self.sample_rate, 1)
+            }))
+            return True
+
+    def stop(self):
+        with self._open_lock:
+            close, self._close_device = self._close_device, None
+        self.ring.close()
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                self.logger.warning("audio_stream_close_failed %s", json.dumps({"error": str(e)}), exc_info=True)
+            self.logger.info("audio_stream_closed %s", json.dumps(self.ring.stats()))
+
+    def cursor(self, back_samples: int = 0, at: int | None = None) -> RingCursor | None:
+        """Reader at "now" minus back_samples (or ring position at); None if the device can't open."""
+        if not self.start():
             return None
+        return self.ring.cursor(back_samples, at=at)
+
+    def stats(self) -> dict[str, Any]:
+        """Ring diagnostics: samples written, driver overflows, cursor overruns, lost samples."""
+        return {"open": self._close_device is not None, **self.ring.stats()}
+
+    @property
+    def finished(self) -> bool:
+        """True once a replay playlist has been fully delivered (live devices never finish)."""
+        return self.replay_done.is_set()
+
+    def _report_losses(self):
+        """Log new driver overflows / cursor overruns since the last report."""
+        stats = self.ring.stats()
+        if any(stats[k] > v for k, v in self._reported.items()):
+            self.logger.warning("audio_samples_lost %s", json.dumps({
+                "device_overflows": stats["device_overflows"] - self._reported["device_overflows"],
+                "overruns": stats["overruns"] - self._reported["overruns"],
+                "lost_samples_total": stats["lost_samples"]
+            }))
+            self._reported = {k: stats[k] for k in self._reported}
+
+    def mark_playback_end(self, grace_s: float = 0.0):
+        """Record that TTS playback just ended; captures start at least grace_s later."""
+        self.playback_end_pos = self.ring.written + int(grace_s * self.sample_rate)
+
+    def capture_until_silence(self, timeout: float = 10.0, start_pos: int | None = None,
+                              endpoint_check: Callable[[np.ndarray], bool] | None = None
+                              ) -> np.ndarray | None:
+        """Capture audio until silence detected.
+
+        Reading starts preroll_ms back in the ring, or at ring position
+        start_pos (e.g. the wake point) when given. Audio older than preroll_ms
+        before the first voiced block is dropped; silence only counts towards
+        the end once past the call time (or start_pos). Nothing before
+        playback_end_pos is used: blocks up to it are read and dropped. After
+        speech the Endpointer picks the hangover; endpoint_check, if given, is
+        asked once per pause (after the minimum hangover) whether the audio so
+        far is a complete utterance.
+
+        Returns the canonical buffer (1-D contiguous float32 in [-1, 1]): ring
+        blocks are converted straight into one buffer allocated per capture,
+        VAD and endpoint_check see views of it, and so do wake detection and
+        STT downstream.
+        """
+        preroll = int(self.preroll_ms * self.sample_rate / 1000)
+        cursor = self.cursor(back_samples=preroll, at=start_pos)
+        if cursor is None:
+            return None
+        floor = self.playback_end_pos
+        cursor.pos = max(cursor.pos, min(floor, self.ring.written))
+        live_from = cursor.pos if start_pos is not None else self.ring.written
+
+        chunk = self.chunk_size
+        # Backlog already in the ring plus everything the device can deliver before the timeout
+        backlog = self.ring.written - cursor.pos
+        max_blocks = (backlog + int((timeout + 1.0) * self.sample_rate)) // chunk + 1
+        buf = np.empty(max_blocks * chunk, dtype=np.float32)
+        blocks = 0
+        positions = []
+        onset = None
+        silence_chunks = 0
+        chunks_for_silence = int(self.silence_duration * self.sample_rate / chunk)
+        block_s = chunk / self.sample_rate
+        preroll_blocks = (preroll + chunk - 1) // chunk
+        checked = False
+        reason = "timeout"
+        self.endpointer.reset()
+        start_time = time.time()
+
+        self.logger.info("capture_begin %s", json.dumps({
+            "timeout_s": timeout, **self.vad.stats(),
+            "preroll_ms": self.preroll_ms, "from_wake": start_pos is not None
+        }))
+
+        while time.time() - start_time < timeout:
+            if blocks == max_blocks:
+                reason = "buffer_full"
+                break
+            data = buf[blocks * chunk:(blocks + 1) * chunk]
+            if not cursor.read_into(data, timeout=1.0):
+                self.logger.warning("capture_stalled %s", json.dumps({
+                    "closed": self.ring.closed, "blocks": blocks
+                }))
+                reason = "stalled"
+                break
+            if cursor.pos <= floor:
+                continue  # still inside our own playback's grace period
+            blocks += 1
+            positions.append(cursor.pos - chunk)
+
+            if not self.vad.is_speech(data):
+                if cursor.pos > live_from:
+                    silence_chunks += 1
+                    if onset is None:
+                        if silence_chunks >= chunks_for_silence:
+                            reason = "no_speech"
+                            break
+                        continue
+                    needed, why = self.endpointer.silence_needed()
+                    if silence_chunks * block_s >= needed:
+                        reason = why
+                        break
+                    if (endpoint_check is not None and not checked
+                            and silence_chunks * block_s >= self.endpointer.min_hangover):
+                        checked = True
+                        if endpoint_check(buf[max(0, onset - preroll_blocks) * chunk:blocks * chunk]):
+                            reason = "partial"
+                            break
+            else:
+                silence_chunks = 0
+                checked = False
+                self.endpointer.voiced(self.vad.last_rms, block_s)
+                # Wall-clock time this block ended (the reader may lag the device)
+                self.last_speech_end = time.time() - (self.ring.written - cursor.pos) / self.sample_rate
+                if onset is None:
+                    onset = blocks - 1
+
+        # Keep at most preroll_ms before the onset
+        first = 0
+        if onset is not None:
+            first = max(0, onset - preroll_blocks)
+        self.last_endpoint = reason
 
         duration = time.time() - start_time
         self.logger.info("capture_end %s", json.dumps({
-            "sec": round(duration, 2), "blocks": len(frames)
+            "sec": round(duration, 2), "blocks": blocks - first, "lost_samples": cursor.lost,
+            "onset_ms": int((onset - first) * chunk * 1000 / self.sample_rate)
+            if onset is not None else None,
+            "endpoint": reason,
+            "hangover_ms": int(silence_chunks * block_s * 1000),
+            "noise_floor": round(self.vad.noise_floor, 5)
         }))
+        self._report_losses()
 
-        if frames:
-            return np.concatenate(frames)
-        return None
+        # No voiced block at all: nothing worth a wake check or a Whisper call
+        if onset is None:
+            return None
+        self.last_capture_start = positions[first]
+        return buf[first * chunk:blocks * chunk]
 
 
 # =========================
@@ -640,14 +3624,16 @@ class AudioCapture:
 class WakeDetector:
     """Enhanced wake detection with OpenWakeWord support."""
 
-    cfg: Dict[str, Any]
+    cfg: dict[str, Any]
     logger: logging.Logger
     mode: str = "text"
-    phrases: List[str] = field(default_factory=list)
+    phrases: list[str] = field(default_factory=list)
     stop_phrase: str = "sleep nova"
     sensitivity: float = 0.5
-    oww_model: Optional[Any] = None
-    model_path: Optional[Path] = None
+    oww_model: Any | None = None
+    model_path: Path | None = None
+    # Sample offset (in the last scanned buffer) where the detecting frame ended
+    last_detection_end: int = 0
 
     def __post_init__(self):
         wake = self.cfg.get("wake", {})
@@ -710,19 +3696,14 @@ class WakeDetector:
                 self.logger.warning("oww_init_failed %s", json.dumps({"error": str(e)}))
 
 
-    def detect_in_audio_stream(self, audio: np.ndarray, threshold_override: Optional[float] = None) -> bool:
+    def detect_in_audio_stream(self, audio: np.ndarray, threshold_override: float | None = None) -> bool:
         """Detect wake word in audio buffer using proper streaming chunks."""
         if not self.oww_model or audio is None or len(audio) == 0:
             return False
 
         try:
-            # Flatten audio if needed (sounddevice returns [N,1] even with channels=1)
-            if audio.ndim > 1:
-                audio = audio.flatten()
-            # Normalize int16 to float32 range [-1.0, 1.0] for OWW
-            if audio.dtype == np.int16:
-                audio = audio.astype(np.float32) / 32768.0
-            audio = audio - np.mean(audio)  # Remove DC offset for OWW
+            # Canonical float32 mono buffer from capture: used as-is, no copy
+            audio = as_mono_float32(audio)
 
             # Diagnostic: log processed audio characteristics
             self.logger.info("oww_audio_input %s", json.dumps({
@@ -737,19 +3718,22 @@ class WakeDetector:
 
             frame_size = 1280
             hop_size = 640  # 50% overlap for better detection
+            # One scratch frame reused across windows
+            frame = np.empty(frame_size, dtype=np.float32)
 
             # Process audio in sliding windows
             for start in range(0, len(audio) - frame_size + 1, hop_size):
-                frame = audio[start:start + frame_size]
-                frame = frame - np.mean(frame)  # Remove DC offset per frame
+                window = audio[start:start + frame_size]
+                # Remove DC offset per frame (this also covers a whole-buffer offset)
+                np.subtract(window, window.mean(), out=frame)
 
                 # Get prediction from OWW
 
                 prediction = self.oww_model.predict(frame)
 
-                frame_rms = float(np.sqrt(np.mean(frame**2)))
+                frame_rms = float(np.sqrt(np.dot(frame, frame) / frame_size))
                 # Verify frame is changing
-                frame_hash = hash(frame.tobytes())
+                frame_hash = zlib.crc32(frame)
                 self.logger.info("oww_frame_hash %s", json.dumps({"offset": start, "hash": frame_hash}))
 
                 self.logger.info("oww_frame_debug %s", json.dumps({
@@ -780,6 +3764,7 @@ class WakeDetector:
 
                         threshold = threshold_override if threshold_override is not None else self.sensitivity
                         if buffer_max >= threshold:
+                            self.last_detection_end = start + frame_size
                             self.logger.info("wake_detected %s", json.dumps({
                                 "word": word,
                                 "score": float(buffer_max),
@@ -797,7 +3782,7 @@ class WakeDetector:
             return False
 
 class STT:
-    def __init__(self, cfg: Dict[str, Any], logger: logging.Logger):
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger):
         self.cfg = cfg
         self.logger = logger
         self._whisper = None
@@ -850,8 +3835,8 @@ class STT:
             return ""
 
         try:
-            # Normalize audio to float32 [-1, 1]
-            audio_float = audio.astype(np.float32) / 32768.0
+            # Canonical float32 [-1, 1] buffer from capture is passed through without a copy
+            audio_float = as_mono_float32(audio)
 
             # Transcribe
             segments, info = self._whisper.transcribe(
@@ -883,7 +3868,7 @@ class STT:
 class TTS:
     """Enhanced TTS with real Piper and interrupt support."""
 
-    def __init__(self, cfg: Dict[str, Any], logger: logging.Logger, interrupt_event=None):
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger, interrupt_event=None):
         self.cfg = cfg.get("tts", {})
         self.logger = logger
         self.interrupt_event = interrupt_event  # P1.1 spacebar interrupt
@@ -901,7 +3886,7 @@ class TTS:
         self.max_queue = self.cfg.get("max_queue", 3)
         self.earcon_if_ttfa_ms = self.cfg.get("earcon_if_ttfa_ms", 450)
 
-        self.current_process: Optional[subprocess.Popen] = None
+        self.current_process: subprocess.Popen | None = None
         self.last_dur_ms = 0
         self.last_ttfa_ms = 0
 
@@ -950,6 +3935,11 @@ class TTS:
         except Exception as e:
             self.logger.warning("earcon_failed %s", json.dumps({"error": str(e)}))
 
+    def play_earcon(self, duration_ms: int = 100, frequency: int = 800) -> float:
+        """Play the listening earcon (blocks until done); returns its length in seconds."""
+        self._play_earcon(duration_ms, frequency)
+        return duration_ms / 1000.0
+
     def _strip_markdown(self, text: str) -> str:
         """Remove markdown formatting for TTS."""
         import re
@@ -965,7 +3955,7 @@ class TTS:
         # Remove links [text](url)
         text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
         return text.strip()
-    def _chunk_text(self, text: str, max_chars: int) -> List[str]:
+    def _chunk_text(self, text: str, max_chars: int) -> list[str]:
         """Chunk text at sentence boundaries for natural pauses."""
         import re
 
@@ -1221,9 +4211,12 @@ class ConversationState:
 
     session_id: str
     turn_num: int = 0
-    context_window: Deque[Tuple[str, str]] = field(default_factory=lambda: deque(maxlen=10))
+    context_window: deque[tuple[str, str]] = field(default_factory=lambda: deque(maxlen=10))
     last_activity: float = field(default_factory=time.time)
-    metadata: Dict[str, Any] = field(default_factory=dict)
+    metadata: dict[str, Any] = field(default_factory=dict)
+    # Rolling summary of turns 1..summary_through (ConversationSummarizer)
+    summary: str = ""
+    summary_through: int = 0
 
     def add_turn(self, role: str, content: str):
         """Add a conversation turn."""
@@ -1244,19 +4237,61 @@ class ConversationState:
 
         return "\n".join(lines)
 
+    def get_recent(self, max_turns: int = 5, summarized: bool = False) -> list[tuple[str, str]]:
+        """Last max_turns turns; with summarized, also older window turns the summary lacks."""
+        window = list(self.context_window)
+        cutoff = self.turn_num - max_turns
+        if summarized:
+            cutoff = min(cutoff, self.summary_through)
+        first = self.turn_num - len(window) + 1  # turn_num of window[0]
+        return [turn for i, turn in enumerate(window) if first + i > cutoff]
+
     def is_expired(self, timeout_minutes: int = 30) -> bool:
         """Check if conversation has expired."""
         return (time.time() - self.last_activity) > (timeout_minutes * 60)
 
 
+@dataclass
+class PromptContext:
+    """Structured prompt context; LLMClient fits it to the intent's token budget."""
+
+    recent: list[tuple[str, str]] = field(default_factory=list)
+    memories: list[tuple[str, float]] = field(default_factory=list)
+    summary: str = ""
+
+
 # =========================
 # Enhanced LLM Client
 # =========================
 
+def estimate_tokens(text: str) -> int:
+    """Cheap BPE-ish token estimate: ~4 chars or ~0.75 words per token, whichever is larger."""
+    if not text:
+        return 0
+    return max(len(text) // 4, (len(text.split()) * 4 + 2) // 3) + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text at a word boundary so estimate_tokens(result) <= max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    words = text.split()[:max(0, ((max_tokens - 2) * 3) // 4)]
+    out = " ".join(words)[:(max_tokens - 2) * 4]
+    if " " in out and len(out) < len(" ".join(words)):
+        out = out.rsplit(" ", 1)[0]
+    return out.rstrip() + "…" if out else ""
+
+
+def _norm_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
 class LLMClient:
     """Enhanced LLM client with context management."""
 
-    def __init__(self, cfg: Dict[str, Any], logger: logging.Logger):
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger):
         self.cfg = cfg.get("llm", {})
         self.logger = logger
 
@@ -1269,6 +4304,15 @@ class LLMClient:
         self.timeout = self.cfg.get("timeout_s", 20.0)
         self.max_context_turns = self.cfg.get("max_context_turns", 5)
 
+        # Prompt budget: context_tokens should match the model's num_ctx;
+        # response_tokens is held back for generation
+        self.context_tokens = int(self.cfg.get("context_tokens", 4096))
+        self.response_tokens = int(self.cfg.get("response_tokens", 512))
+        self.prompt_budgets = dict(self.cfg.get("prompt_budget_tokens") or {})
+        self.recent_share = min(1.0, max(0.0, float(self.cfg.get("recent_share", 0.6))))
+        self.memory_item_tokens = int(self.cfg.get("memory_item_tokens", 60))
+        self.last_prompt_stats: dict[str, Any] = {}
+
         # Dev mode
         dev_cfg = cfg.get("dev", {})
         self.dev_enabled = dev_cfg.get("enabled", False)
@@ -1295,14 +4339,15 @@ class LLMClient:
         text = re.sub(r'\n\s*\n', '\n', text)
         return text.strip()
 
-    def generate(self, prompt: str, context: Optional[str] = None,
-                 model: Optional[str] = None, system: Optional[str] = None) -> str:
+    def generate(self, prompt: str, context: Any | None = None,
+                 model: str | None = None, system: str | None = None,
+                 intent: str | None = None) -> str:
         """Generate response with context and fallback."""
         t0 = time.time()
         selected = model or self.model_general
 
         # Build full prompt
-        full_prompt = self._build_prompt(prompt, context, system)
+        full_prompt = self._build_prompt(prompt, context, system, intent=intent)
 
         # Try selected model
         try:
@@ -1346,21 +4391,113 @@ class LLMClient:
 
             return "I'm having trouble processing that right now. Please try again."
 
-    def _build_prompt(self, prompt: str, context: Optional[str] = None,
-                      system: Optional[str] = None) -> str:
-        """Build prompt with context and system message."""
+    def prompt_budget(self, intent: str | None = None) -> int:
+        """Token budget for the assembled prompt of an intent (capped by the model window)."""
+        ceiling = max(0, self.context_tokens - self.response_tokens)
+        budget = self.prompt_budgets.get(intent, self.prompt_budgets.get("default", ceiling))
+        return min(int(budget), ceiling)
+
+    @staticmethod
+    def _fit(costs: list[int], budget: int) -> int:
+        """Number of leading items (highest value first) that fit in budget."""
+        used = 0
+        for n, cost in enumerate(costs):
+            if used + cost > budget:
+                return n
+            used += cost
+        return len(costs)
+
+    def _build_prompt(self, prompt: str, context: Any | None = None,
+                      system: str | None = None, intent: str | None = None) -> str:
+        """Build prompt with context and system message, fitted to the intent's token budget.
+
+        The system prompt (capped at half the budget) and the user prompt are
+        always kept, then the rolling session summary (capped at half of what
+        is left). The remainder is split between the recent window and
+        retrieved memories (recent_share); whatever one section leaves unused
+        flows to the other. Within a section the lowest-value items go first:
+        oldest turns, lowest-ranked memories. Memories already present in the
+        recent window or the prompt are dropped before anything is counted.
+        """
+        budget = self.prompt_budget(intent)
         parts = []
 
+        system_tokens = 0
         if system:
+            system = truncate_tokens(system, budget // 2)
+            system_tokens = estimate_tokens(system)
             parts.append(f"System: {system}")
 
-        if context:
-            parts.append(f"Context:\n{context}")
+        # Label lines ("Context:", "User:", "Assistant:", section headers)
+        available = max(0, budget - system_tokens - estimate_tokens(prompt) - 16)
+        stats: dict[str, Any] = {"intent": intent or "general", "budget": budget}
+
+        if isinstance(context, PromptContext):
+            summary = truncate_tokens(context.summary, available // 2) if context.summary else ""
+            summary_tokens = estimate_tokens(summary)
+            available -= summary_tokens
+            recent = list(context.recent)
+            # The current utterance is usually already in the window; it is sent once, below
+            if recent and recent[-1][0] == "user" and _norm_text(recent[-1][1]) == _norm_text(prompt):
+                recent.pop()
+            seen = [_norm_text(c) for _, c in recent] + [_norm_text(prompt)]
+            memories, duplicates = [], 0
+            for content, _score in context.memories:
+                key = _norm_text(content)
+                if not key or any(key in known for known in seen):
+                    duplicates += 1
+                    continue
+                seen.append(key)
+                memories.append(truncate_tokens(content, self.memory_item_tokens))
+
+            recent_lines = [f"{'User' if role == 'user' else 'Assistant'}: {content}"
+                            for role, content in reversed(recent)]  # newest first
+            memory_lines = [f"- {content}" for content in memories]
+            recent_costs = [estimate_tokens(line) for line in recent_lines]
+            memory_costs = [estimate_tokens(line) for line in memory_lines]
+
+            n_recent = self._fit(recent_costs, int(available * self.recent_share))
+            n_memory = self._fit(memory_costs, available - sum(recent_costs[:n_recent]))
+            n_recent = self._fit(recent_costs, available - sum(memory_costs[:n_memory]))
+
+            lines = []
+            if summary:
+                lines.append("Conversation so far:")
+                lines.append(summary)
+            if n_recent:
+                lines.append("Recent conversation:")
+                lines.extend(reversed(recent_lines[:n_recent]))
+            if n_memory:
+                lines.append("Relevant context:")
+                lines.extend(memory_lines[:n_memory])
+            if lines:
+                parts.append("Context:\n" + "\n".join(lines))
+            stats.update({
+                "summary_tokens": summary_tokens,
+                "recent_tokens": sum(recent_costs[:n_recent]),
+                "recent_kept": n_recent,
+                "recent_dropped": len(recent_lines) - n_recent,
+                "memory_tokens": sum(memory_costs[:n_memory]),
+                "memory_kept": n_memory,
+                "memory_dropped": len(memory_lines) - n_memory,
+                "memory_duplicates": duplicates,
+            })
+        elif context:
+            context = truncate_tokens(context, available)
+            if context:
+                parts.append(f"Context:\n{context}")
+            stats["context_tokens"] = estimate_tokens(context)
 
         parts.append(f"User: {prompt}")
         parts.append("Assistant:")
 
-        return "\n\n".join(parts)
+        full_prompt = "\n\n".join(parts)
+        stats["system_tokens"] = system_tokens
+        stats["est_tokens"] = estimate_tokens(full_prompt)
+        stats["over_budget"] = stats["est_tokens"] > budget
+        self.last_prompt_stats = stats
+        self.logger.info("prompt_budget %s", json.dumps(stats))
+        return full_prompt
 
     def _call_ollama(self, model: str, prompt: str) -> str:
         """Call Ollama API."""
@@ -1386,6 +4523,128 @@ class LLMClient:
         return data.get("response", "").strip()
 
 
+# =========================
+# Conversation Summarizer
+# =========================
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a voice conversation between a user and an assistant. "
+    "Merge the new turns into the current summary. Keep names, facts, preferences, decisions "
+    "and open questions; drop greetings and small talk. Reply with the updated summary only, "
+    "in at most {words} words."
+)
+
+
+class ConversationSummarizer:
+    """Folds turns that leave the prompt window into a rolling per-session summary.
+
+    Runs on a daemon thread and only calls the summary model (fallback_model
+    by default) once the loop has been idle for summary_idle_s, so it never
+    competes with a live turn. Summaries are stored in memory.db and loaded
+    again when a session is resumed.
+    """
+
+    def __init__(self, cfg: dict[str, Any], llm: LLMClient, memory: MemoryStore,
+                 logger: logging.Logger):
+        llm_cfg = cfg.get("llm", {})
+        self.llm = llm
+        self.memory = memory
+        self.logger = logger
+
+        self.enabled = bool(llm_cfg.get("summary_enabled", False)) and memory.enabled
+        self.model = llm_cfg.get("summary_model") or llm.model_fallback
+        self.idle_s = float(llm_cfg.get("summary_idle_s", 5.0))
+        self.min_turns = int(llm_cfg.get("summary_min_turns", 4))
+        self.batch_turns = int(llm_cfg.get("summary_batch_turns", 20))
+        self.max_tokens = int(llm_cfg.get("summary_tokens", 200))
+        self.keep_turns = llm.max_context_turns
+
+        self._last_activity = time.time()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def touch(self):
+        """Record loop activity; summarization waits for idle_s after this."""
+        self._last_activity = time.time()
+
+    def load(self, state: ConversationState):
+        """Restore a resumed session's summary into state."""
+        if not self.enabled:
+            return
+        state.summary, state.summary_through = self.memory.get_summary(state.session_id)
+        if state.summary:
+            self.logger.info("summary_loaded %s", json.dumps({
+                "session": state.session_id,
+                "through_turn": state.summary_through,
+                "tokens": estimate_tokens(state.summary)
+            }))
+
+    def start(self, state: ConversationState):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, args=(state,),
+                                        name="conversation-summarizer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.llm.timeout)
+            self._thread = None
+
+    def _loop(self, state: ConversationState):
+        while not self._stop.wait(1.0):
+            if self.memory.turn_active.is_set() or time.time() - self._last_activity < self.idle_s:
+                continue
+            try:
+                self.summarize(state)
+            except Exception as e:
+                self.logger.warning("summary_failed %s", json.dumps({
+                    "session": state.session_id,
+                    "model": self.model,
+                    "error": str(e)
+                }), exc_info=True)
+                self._stop.wait(30.0)
+
+    def summarize(self, state: ConversationState) -> bool:
+        """Fold the oldest unsummarized turns outside the recent window into the summary."""
+        through = state.turn_num - self.keep_turns
+        if through - state.summary_through < self.min_turns:
+            return False
+
+        through = min(through, state.summary_through + self.batch_turns)
+        turns = self.memory.get_turns(state.session_id, state.summary_through, through)
+        if not turns:
+            return False
+
+        t0 = time.time()
+        lines = [f"{'User' if role == 'user' else 'Assistant'}: {content}" for _, role, content in turns]
+        prompt = "\n\n".join([
+            SUMMARY_INSTRUCTIONS.format(words=self.max_tokens * 3 // 4),
+            f"Current summary:\n{state.summary or '(none)'}",
+            "New turns:\n" + "\n".join(lines),
+            "Updated summary:",
+        ])
+        summary = self.llm._strip_reasoning_tags(self.llm._call_ollama(self.model, prompt))
+        summary = truncate_tokens(summary, self.max_tokens)
+        if not summary:
+            raise RuntimeError("empty summary")
+
+        self.memory.save_summary(state.session_id, summary, through, self.model)
+        # Summary before the turn marker: a concurrent prompt may repeat a turn, never lose one
+        state.summary = summary
+        state.summary_through = through
+        self.logger.info("summary_updated %s", json.dumps({
+            "session": state.session_id,
+            "model": self.model,
+            "through_turn": through,
+            "turns": len(turns),
+            "tokens": estimate_tokens(summary),
+            "ms": int((time.time() - t0) * 1000)
+        }))
+        return True
+
+
 # =========================
 # Enhanced Intent Router
 # =========================
@@ -1393,7 +4652,7 @@ class LLMClient:
 class IntentRouter:
     """Advanced intent routing with pattern matching."""
 
-    def __init__(self, cfg: Dict[str, Any], logger: logging.Logger):
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger):
         self.cfg = cfg
         self.logger = logger
 
@@ -1422,7 +4681,7 @@ class IntentRouter:
             ]
         }
 
-    def route(self, text: str, conversation_state: Optional[ConversationState] = None) -> Tuple[str, str]:
+    def route(self, text: str, conversation_state: ConversationState | None = None) -> tuple[str, str]:
         """Route to appropriate model and intent."""
         lower = text.lower()
 
@@ -1461,11 +4720,11 @@ class IntentRouter:
 class LocalIntentHandler:
     """Handle local intents without LLM."""
 
-    def __init__(self, cfg: Dict[str, Any], logger: logging.Logger):
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger):
         self.cfg = cfg
         self.logger = logger
 
-    def handle(self, text: str, state: ConversationState) -> Optional[str]:
+    def handle(self, text: str, state: ConversationState) -> str | None:
         """Handle local intents."""
         lower = text.lower().strip()
         # Sleep command (fuzzy matching for STT errors)
@@ -1511,10 +4770,21 @@ class LocalIntentHandler:
 # Main Voice Loop
 # =========================
 
+def resolve_wake_ack(orch_cfg: dict[str, Any], logger: logging.Logger) -> str:
+    """orchestrator.wake_ack, forced to "none" when capture_from_wake would record "Yes Sir"."""
+    wake_ack = orch_cfg.get("wake_ack", "speech")
+    if orch_cfg.get("capture_from_wake", False) and wake_ack == "speech":
+        logger.warning("wake_ack_overridden %s", json.dumps({
+            "wake_ack": wake_ack, "now": "none", "reason": "capture_from_wake"
+        }))
+        return "none"
+    return wake_ack
+
+
 class VoiceLoop:
     """Main orchestrator loop with all components integrated."""
 
-    def __init__(self, cfg: Dict[str, Any], logger: logging.Logger):
+    def __init__(self, cfg: dict[str, Any], logger: logging.Logger):
         self.cfg = cfg
         self.logger = logger
 
@@ -1549,7 +4819,14 @@ class VoiceLoop:
                 "session_id": session_id
             }))
 
-        self.state = ConversationState(session_id=session_id)
+        # Resumed sessions continue numbering so recent-turn ordering stays correct
+        next_turn = session_info.get("last_turn_num", 0) if resumed_session else 0
+        self.state = ConversationState(session_id=session_id, turn_num=next_turn)
+
+        # Rolling summary of turns that have left the prompt window
+        self.summarizer = ConversationSummarizer(cfg, self.llm, self.memory, logger)
+        if resumed_session:
+            self.summarizer.load(self.state)
 
         # Mode
         self.mode = cfg.get("orchestrator", {}).get("mode", "text")
@@ -1580,7 +4857,21 @@ class VoiceLoop:
 
         self.conversation_timeout = self.cfg.get("orchestrator", {}).get("conversation_timeout_s", 30)
         self.last_turn_time = 0.0
-    def _wait_for_wake(self) -> Optional[str]:
+
+        # Wake acknowledgement: speech ("Yes Sir") | earcon | none. With
+        # capture_from_wake the command is read from the ring starting at the
+        # wake point, so words said straight after the wake phrase are kept
+        # (a spoken acknowledgement would land in the command and is turned off).
+        self.wake_ack = resolve_wake_ack(self.cfg.get("orchestrator", {}), self.logger)
+        self.capture_from_wake = self.cfg.get("orchestrator", {}).get("capture_from_wake", False)
+        self._wake_pos: int | None = None
+
+        # Endpointing: optionally transcribe at the first pause and stop early if the
+        # request already reads as complete (the transcript is then reused)
+        self.endpoint_partial_stt = self.cfg.get("orchestrator", {}).get("endpoint_partial_stt", False)
+        self._partial: tuple[int, str] | None = None
+        self.last_eos_to_stt_ms: int | None = None
+    def _wait_for_wake(self) -> str | None:
         """Wait for wake trigger."""
         # Check post-TTS grace period
         if time.time() < self.post_tts_until:
@@ -1629,9 +4920,7 @@ class VoiceLoop:
             # Capture small audio buffer for wake detection
             audio = self.audio_capture.capture_until_silence(timeout=5.0)
             if audio is not None and self.wake_detector.detect_in_audio_stream(audio, threshold_override=None):
-                # Flatten if 2D before transcribing wake buffer
-                if audio.ndim > 1:
-                    audio = audio.flatten()
+                self._wake_pos = self.audio_capture.last_capture_start + self.wake_detector.last_detection_end
                 wake_text = self.stt.transcribe_audio(audio)
                 # Reject false wake if STT returns empty
                 if not wake_text or len(wake_text.strip()) == 0:
@@ -1680,26 +4969,58 @@ class VoiceLoop:
 
         return False
 
-    def _capture_user_input(self) -> Optional[str]:
-        """Capture user input after wake."""
+    def _after_tts(self):
+        """Start the post-TTS grace period; no capture reads audio from before it ends."""
+        self.post_tts_until = time.time() + self.grace_after_tts
+        self.audio_capture.mark_playback_end(self.grace_after_tts)
+
+    def _acknowledge_wake(self):
+        """Signal that the assistant is listening (orchestrator.wake_ack)."""
+        if self.wake_ack == "speech":
+            self.tts.speak("Yes Sir")
+            self._after_tts()
+        elif self.wake_ack == "earcon":
+            # Output latency can push the beep into the mic after playback returns,
+            # so its own length is kept as grace before any capture reads audio
+            self.audio_capture.mark_playback_end(self.tts.play_earcon())
+
+    def _capture_user_input(self, start_pos: int | None = None) -> str | None:
+        """Capture user input after wake (from ring position start_pos if given)."""
         if self.mode == "text":
             # Already captured in wake phase for text mode
             return None
         else:
             # Capture audio and transcribe
-            audio = self.audio_capture.capture_until_silence(timeout=10.0)
-            # Flatten if 2D (sounddevice returns [N,1] shape)
-            if audio is not None and audio.ndim > 1:
-                audio = audio.flatten()
-                self.logger.info("audio_post_flatten %s", json.dumps({"shape": list(audio.shape), "ndim": audio.ndim}))
+            self._partial = None
+            audio = self.audio_capture.capture_until_silence(
+                timeout=10.0, start_pos=start_pos,
+                endpoint_check=self._utterance_complete if self.endpoint_partial_stt else None)
             if audio is not None:
-                user_input = self.stt.transcribe_audio(audio)
+                reused = self._partial is not None and self._partial[0] == len(audio)
+                self._log_endpoint_latency(reused)
+                user_input = self._partial[1] if reused else self.stt.transcribe_audio(audio)
                 if self._is_whisper_hallucination(user_input):
                     self.logger.warning("whisper_hallucination_filtered %s", json.dumps({"text": user_input}))
                     return None
                 return user_input
             return None
 
+    def _utterance_complete(self, audio: np.ndarray) -> bool:
+        """Endpoint check: transcribe the audio so far and test it for a finished request."""
+        text = self.stt.transcribe_audio(audio)
+        self._partial = (len(audio), text)
+        return not self._is_whisper_hallucination(text) and utterance_complete(text)
+
+    def _log_endpoint_latency(self, partial_reused: bool = False):
+        """End of speech -> STT start, the dead air the endpointer is responsible for."""
+        eos = self.audio_capture.last_speech_end
+        self.last_eos_to_stt_ms = int((time.time() - eos) * 1000) if eos else None
+        self.logger.info("endpoint_latency %s", json.dumps({
+            "eos_to_stt_ms": self.last_eos_to_stt_ms,
+            "endpoint": self.audio_capture.last_endpoint,
+            "partial_reused": partial_reused
+        }))
+
     def _process_turn(self, user_text: str):
         """Process a conversation turn."""
         t0 = time.time()
@@ -1745,7 +5066,8 @@ class VoiceLoop:
                 prompt=user_text,
                 context=context,
                 model=model,
-                system=self.llm.system_prompt
+                system=self.llm.system_prompt,
+                intent=intent
             )
 
         # Respond
@@ -1754,37 +5076,34 @@ class VoiceLoop:
         # Log timing
         self._log_turn_timing(t0)
 
-    def _prepare_context(self, user_text: str) -> str:
-        """Prepare context for LLM."""
-        parts = []
+    def _prepare_context(self, user_text: str) -> PromptContext:
+        """Gather prompt context for the LLM; LLMClient trims it to the token budget."""
         semantic_hits = []
 
-        # Recent conversation context
-        conv_context = self.state.get_context(self.llm.max_context_turns)
-        if conv_context:
-            parts.append("Recent conversation:")
-            parts.append(conv_context)
+        # Recent conversation context; older turns reach the prompt via the summary
+        recent = self.state.get_recent(self.llm.max_context_turns, summarized=self.summarizer.enabled)
 
         # Memory retrieval
+        search_timings: dict[str, Any] = {}
         if self.memory.enabled:
-            # Semantic search
-            semantic_hits = self.memory.search_semantic(user_text, limit=self.memory.semantic_search_limit)
-            if semantic_hits:
-                parts.append("Relevant context:")
-                for content, score in semantic_hits:
-                    # Threshold already applied in search_semantic()
-                    parts.append(f"- {content[:200]}")
-
-        if parts:
-            context = "\n".join(parts)
+            # Hybrid FTS + semantic search
+            if self.memory.hybrid_search:
+                semantic_hits = self.memory.search_hybrid(
+                    user_text, limit=self.memory.semantic_search_limit, timings=search_timings)
+            else:
+                semantic_hits = self.memory.search_semantic(user_text, limit=self.memory.semantic_search_limit)
+
+        # Threshold already applied in search_semantic(); hits arrive best first
+        context = PromptContext(recent=recent, memories=list(semantic_hits), summary=self.state.summary)
+        if recent or semantic_hits or context.summary:
             self.logger.info("context_prepared %s", json.dumps({
-                "chars": len(context),
-                "has_conv": bool(conv_context),
-                "semantic_hits": len(semantic_hits) if self.memory.enabled else 0
+                "turns": len(recent),
+                "has_conv": bool(recent),
+                "summary_through": self.state.summary_through,
+                "semantic_hits": len(semantic_hits) if self.memory.enabled else 0,
+                "search": search_timings
             }))
-            return context
-
-        return ""
+        return context
 
     def _respond(self, response: str, is_local: bool = False):
         """Generate response with TTS."""
@@ -1805,9 +5124,10 @@ class VoiceLoop:
 
         # Update activity timestamp after TTS completes
         self.last_turn_time = time.time()
+        self.summarizer.touch()
 
         # Set grace period
-        self.post_tts_until = time.time() + self.grace_after_tts
+        self._after_tts()
 
     def _log_turn_timing(self, start_time: float):
         """Log turn timing metrics."""
@@ -1817,6 +5137,7 @@ class VoiceLoop:
         self.logger.info("turn_timing %s", json.dumps({
             "total_ms": total_ms,
             "tts_ms": tts_ms,
+            "eos_to_stt_ms": self.last_eos_to_stt_ms,
             "turn": self.state.turn_num
         }))
 
@@ -1832,9 +5153,13 @@ class VoiceLoop:
                 "coder": self.llm.model_coder if self.llm.dev_enabled else None
             }
         }))
+        self.summarizer.start(self.state)
 
         # Main loop
         while self.running:
+            if self.audio_capture.finished:
+                self.logger.info("replay_exhausted %s", json.dumps(self.audio_capture.stats()))
+                break
             try:
                 # Handle sleep state
                 if self.asleep:
@@ -1845,6 +5170,7 @@ class VoiceLoop:
                         self.logger.info("conversation_active_set %s", json.dumps({"active": True, "reason": "wake_from_sleep"}))
                         self.last_turn_time = time.time()
                         self.tts.speak("Yes Sir, I'm awake")
+                        self._after_tts()
                     continue
 
                 # Check conversation timeout
@@ -1872,11 +5198,12 @@ class VoiceLoop:
                 if user_input == "listening":
                     # Capture actual input
                     if not self.conversation_active:
-                        self.tts.speak("Yes Sir")
-                        self.post_tts_until = time.time() + self.grace_after_tts
+                        self._acknowledge_wake()
                         self.logger.info("conversation_active_set %s", json.dumps({"active": True, "reason": "initial_wake"}))
                         self.conversation_active = True
-                    user_input = self._capture_user_input()
+                    start_pos = self._wake_pos if self.capture_from_wake else None
+                    self._wake_pos = None
+                    user_input = self._capture_user_input(start_pos=start_pos)
                     self.last_turn_time = time.time()
                     if not user_input:
                         continue
@@ -1888,11 +5215,12 @@ class VoiceLoop:
                     self.conversation_active = False
                     self.tts.speak("Going to sleep.")
                     self.logger.info("conversation_active_set %s", json.dumps({"active": False, "reason": "sleep_command"}))
-                    self.post_tts_until = time.time() + self.grace_after_tts
+                    self._after_tts()
                     continue
 
-                # Process turn
-                self._process_turn(user_input)
+                # Process turn (background memory maintenance backs off meanwhile)
+                with self.memory.active_turn():
+                    self._process_turn(user_input)
 
             except KeyboardInterrupt:
                 self.running = False
@@ -1913,20 +5241,182 @@ class VoiceLoop:
 
         # Stop any ongoing TTS
         self.tts.stop()
+        self.summarizer.stop()
+        self.audio_capture.stop()
+
+        # Release pooled memory connections
+        self.memory.close()
 
 
 # =========================
 # Entry Point
 # =========================
 
-def main():
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Parse entry-point subcommands (default: run the voice loop)."""
+    parser = argparse.ArgumentParser(description="VelaNova voice loop")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="Run the voice loop (default)")
+    run.add_argument("--replay", nargs="+", metavar="FILE",
+                     help="Use WAV/FLAC files or .m3u/.txt playlists as the microphone (mic mode)")
+    run.add_argument("--replay-speed", type=float, default=None,
+                     help="1.0 real time, >1 faster, 0 lockstep with the loop")
+    sidecar = sub.add_parser("sidecar", help="Verify or rebuild the memory embedding sidecar")
+    sidecar.add_argument("action", choices=["verify", "rebuild"])
+    export = sub.add_parser("export", help="Stream conversation memory out as JSONL")
+    export.add_argument("output", nargs="?", default="-", help="Output file (default: stdout)")
+    export.add_argument("--session", help="Only export this session_id")
+    imp = sub.add_parser("import", help="Bulk-load conversation memory from JSONL")
+    imp.add_argument("input", nargs="?", default="-", help="Input file (default: stdin)")
+    imp.add_argument("--batch-size", type=int, default=None, help="Turns per encode call and transaction")
+    shards = sub.add_parser("shards", help="List cold monthly shards or archive old months into them")
+    shards.add_argument("action", choices=["list", "archive"])
+    shards.add_argument("--hot-months", type=int, default=None, help="Months kept in memory.db (archive)")
+    reembed = sub.add_parser("reembed", help="Embed turns with NULL or other-model vectors (resumable)")
+    reembed.add_argument("--max-chunks", type=int, default=None, help="Stop after this many chunks")
+    args = parser.parse_args(argv)
+    args.command = args.command or "run"
+    return args
+
+
+def run_sidecar_command(cfg: dict[str, Any], logger: logging.Logger, action: str) -> int:
+    """Verify or rebuild data/memory.emb against memory.db."""
+    cfg = {**cfg, "memory": {**cfg.get("memory", {}), "embedding_sidecar": True}}
+    store = MemoryStore(MEMORY_DB, logger, cfg)
+    try:
+        if not store.enabled:
+            return 1
+        if action == "rebuild":
+            store.rebuild_sidecar()
+            result = store.verify_sidecar(full=True)
+        else:
+            result = store.verify_sidecar(full=True)
+        print(json.dumps(result, indent=2))
+        return 0 if result["ok"] else 1
+    finally:
+        store.close()
+
+
+def _maintenance_store(cfg: dict[str, Any], logger: logging.Logger) -> MemoryStore:
+    """MemoryStore for one-shot CLI jobs: direct writes, no background threads."""
+    overrides = {"write_behind": False, "cleanup_enabled": False, "integrity_check": "off"}
+    return MemoryStore(MEMORY_DB, logger, {**cfg, "memory": {**cfg.get("memory", {}), **overrides}})
+
+
+def read_jsonl(fh, logger: logging.Logger) -> Iterator[dict[str, Any]]:
+    """Yield JSON objects from a line stream, skipping blank and malformed lines."""
+    for lineno, line in enumerate(fh, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning("import_line_invalid %s", json.dumps({"line": lineno, "error": str(e)}))
+
+
+def run_export_command(cfg: dict[str, Any], logger: logging.Logger, output: str,
+                       session_id: str | None = None) -> int:
+    """Write memory.db turns as JSONL without materialising the table."""
+    if output == "-":
+        # Keep stdout clean for the JSONL stream
+        for handler in logger.handlers:
+            if type(handler) is logging.StreamHandler and handler.stream is sys.stdout:
+                handler.setStream(sys.stderr)
+    store = _maintenance_store(cfg, logger)
+    try:
+        if not store.enabled:
+            return 1
+        with ExitStack() as stack:
+            fh = sys.stdout if output == "-" else stack.enter_context(open(output, "w", encoding="utf-8"))
+            count = 0
+            for record in store.iter_export(session_id=session_id):
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        logger.info("memory_export %s", json.dumps({"output": output, "turns": count}))
+        return 0
+    finally:
+        store.close()
+
+
+def run_import_command(cfg: dict[str, Any], logger: logging.Logger, source: str,
+                       batch_size: int | None = None) -> int:
+    """Stream a JSONL file into memory.db."""
+    store = _maintenance_store(cfg, logger)
+    try:
+        if not store.enabled:
+            return 1
+        with ExitStack() as stack:
+            fh = sys.stdin if source == "-" else stack.enter_context(open(source, encoding="utf-8"))
+            stats = store.import_turns(read_jsonl(fh, logger), batch_size=batch_size)
+        print(json.dumps(stats, indent=2))
+        return 0
+    finally:
+        store.close()
+
+
+def run_shards_command(cfg: dict[str, Any], logger: logging.Logger, action: str,
+                       hot_months: int | None = None) -> int:
+    """List shard files or archive months older than memory.shard_hot_months."""
+    store = _maintenance_store(cfg, logger)
+    try:
+        if not store.enabled:
+            return 1
+        if action == "archive":
+            months = hot_months if hot_months is not None else store.shard_hot_months
+            if months <= 0:
+                logger.error("shard_archive_disabled %s", json.dumps({"hot_months": months}))
+                return 1
+            print(json.dumps(store.archive_shards(months), indent=2))
+        else:
+            print(json.dumps(store.shards.stats(), indent=2))
+        return 0
+    finally:
+        store.close()
+
+
+def run_reembed_command(cfg: dict[str, Any], logger: logging.Logger, max_chunks: int | None = None) -> int:
+    """Backfill/re-embed memory.db with the configured embedding model."""
+    store = _maintenance_store(cfg, logger)
+    try:
+        if not store.enabled or not store.embedder:
+            logger.error("reembed_unavailable %s", json.dumps({"embedder": bool(store.embedder)}))
+            return 1
+        stats = store.reembed(max_chunks=max_chunks)
+        print(json.dumps(stats, indent=2))
+        return 0 if not stats["failed"] else 1
+    finally:
+        store.close()
+
+
+def main(argv: list[str] | None = None):
     """Main entry point."""
+    args = parse_args(argv)
+
     # Load config
     cfg = load_config()
 
     # Setup logging
     logger, log_path = ensure_logger(cfg.get("logging", {}))
 
+    if args.command == "sidecar":
+        sys.exit(run_sidecar_command(cfg, logger, args.action))
+    if args.command == "export":
+        sys.exit(run_export_command(cfg, logger, args.output, args.session))
+    if args.command == "import":
+        sys.exit(run_import_command(cfg, logger, args.input, args.batch_size))
+    if args.command == "shards":
+        sys.exit(run_shards_command(cfg, logger, args.action, args.hot_months))
+    if args.command == "reembed":
+        sys.exit(run_reembed_command(cfg, logger, args.max_chunks))
+
+    if getattr(args, "replay", None):
+        orch = {**cfg.get("orchestrator", {}), "mode": "mic", "audio_backend": "replay",
+                "replay_input": args.replay}
+        if args.replay_speed is not None:
+            orch["replay_speed"] = args.replay_speed
+        cfg = {**cfg, "orchestrator": orch, "wake": {**cfg.get("wake", {}), "mode": "mic"}}
+
     # Log boot
     log_event(logger, "boot", {
         "log_file": log_path,
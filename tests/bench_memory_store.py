@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Benchmark MemoryStore on synthetic histories (CPU only, no model download).
+
+Seeds 10k / 100k / 1M-turn databases through the bulk import path with a
+deterministic bag-of-words embedder, then times the hot operations and a
+cold start. Output is JSON so runs can be diffed between commits:
+
+    python tests/bench_memory_store.py --output bench-before.json
+    python tests/bench_memory_store.py --sizes 10000 100000 --set ann_index=ivf
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from orchestrator.voice_loop import MemoryStore  # noqa: E402
+
+TURNS_PER_SESSION = 20
+HISTORY_DAYS = 180
+
+
+class BenchEmbedder:
+    """Deterministic embedder: sum of fixed random word vectors (like FakeEmbedder, vectorised)."""
+
+    def __init__(self, dim: int = 384, vocab: int = 4000, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.dim = dim
+        self.words = [f"w{i}" for i in range(vocab)]
+        self.table = rng.standard_normal((vocab, dim)).astype(np.float32)
+        self.index = {w: i for i, w in enumerate(self.words)}
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        rows = [self.index[w] for w in text.split() if w in self.index]
+        if not rows:
+            return np.full(self.dim, 1e-3, dtype=np.float32)
+        return self.table[rows].sum(axis=0)
+
+    def encode(self, text, **kwargs):
+        if isinstance(text, (list, tuple)):
+            return np.stack([self._encode_one(t) for t in text])
+        return self._encode_one(text)
+
+
+def synthetic_turns(count: int, embedder: BenchEmbedder, seed: int = 1) -> Iterator[Dict[str, Any]]:
+    """Export-format records: sessions of TURNS_PER_SESSION turns spread over HISTORY_DAYS."""
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    span = HISTORY_DAYS * 86400
+    for i in range(count):
+        session, turn = divmod(i, TURNS_PER_SESSION)
+        ts = now - span + span * i / max(count, 1)
+        words = rng.integers(0, len(embedder.words), size=int(rng.integers(6, 16)))
+        yield {
+            "session_id": f"bench_{session}",
+            "turn_num": turn + 1,
+            "role": "user" if turn % 2 == 0 else "assistant",
+            "content": " ".join(embedder.words[w] for w in words),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts)),
+        }
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "n": int(len(arr)),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+    }
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentiles(samples)
+
+
+def rss_mb() -> Dict[str, float]:
+    current = 0.0
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                current = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    return {"rss_mb": round(current, 1), "peak_rss_mb": round(peak, 1)}
+
+
+def bench_size(size: int, args: argparse.Namespace, embedder: BenchEmbedder,
+               logger: logging.Logger) -> Dict[str, Any]:
+    overrides: Dict[str, Any] = {"enabled": True, "semantic_threshold": 0.3, "integrity_check": "off"}
+    overrides.update(args.overrides)
+    cfg = {"memory": overrides}
+    rng = np.random.default_rng(2)
+    result: Dict[str, Any] = {"turns": size}
+
+    with tempfile.TemporaryDirectory(prefix="velanova-bench-") as tmp:
+        db_path = Path(tmp) / "memory.db"
+        store = MemoryStore(db_path, logger, cfg, embedder=embedder)
+
+        t0 = time.perf_counter()
+        store.import_turns(synthetic_turns(size, embedder), batch_size=4096)
+        seed_s = time.perf_counter() - t0
+        result["seed"] = {"seconds": round(seed_s, 2), "turns_per_s": round(size / seed_s, 1)}
+
+        # add_turn: enqueue cost per call and end-to-end throughput incl. flush
+        live = list(synthetic_turns(args.add_turns, embedder, seed=3))
+        samples = []
+        t0 = time.perf_counter()
+        for n, rec in enumerate(live):
+            t1 = time.perf_counter()
+            store.add_turn("bench_live", n + 1, rec["role"], rec["content"])
+            samples.append((time.perf_counter() - t1) * 1000)
+        store.flush()
+        total_s = time.perf_counter() - t0
+        result["add_turn"] = {**percentiles(samples), "turns_per_s": round(len(live) / total_s, 1)}
+
+        sessions = max(1, size // TURNS_PER_SESSION)
+        queries = [" ".join(embedder.words[w] for w in rng.integers(0, len(embedder.words), size=5))
+                   for _ in range(args.queries)]
+        query_iter = iter(queries * 2)
+
+        result["get_recent_turns"] = timed(
+            lambda: store.get_recent_turns(f"bench_{int(rng.integers(0, sessions))}", limit=10), args.queries)
+        result["get_latest_session"] = timed(lambda: store.get_latest_session(24 * HISTORY_DAYS), args.queries)
+        result["search_fts"] = timed(lambda: store.search_fts(next(query_iter).split()[0], limit=5), args.queries)
+        result["search_semantic"] = timed(lambda: store.search_semantic(next(query_iter), limit=5), args.queries)
+        store.close()
+
+        def cold_start():
+            MemoryStore(db_path, logger, cfg, embedder=embedder).close()
+
+        result["cold_start"] = timed(cold_start, args.cold_starts)
+        result["db_mb"] = round(db_path.stat().st_size / 1e6, 1)
+        result.update(rss_mb())
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).resolve().parent,
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def parse_override(text: str):
+    key, _, value = text.partition("=")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200, help="Samples per read operation")
+    parser.add_argument("--add-turns", type=int, default=1000, help="Live add_turn calls per size")
+    parser.add_argument("--cold-starts", type=int, default=3)
+    parser.add_argument("--set", dest="overrides", action="append", default=[], type=parse_override,
+                        metavar="KEY=VALUE", help="memory.* config override (JSON value), repeatable")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+    args.overrides = dict(args.overrides)
+
+    logger = logging.getLogger("velanova.bench")
+    logger.setLevel(logging.WARNING)
+    embedder = BenchEmbedder(dim=args.dim)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "dim": args.dim,
+        "config": args.overrides,
+        "results": [bench_size(size, args, embedder, logger) for size in args.sizes],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+"""Tests for the always-open AudioCapture ring buffer (no audio device needed)."""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import tracemalloc
+import wave
+from pathlib import Path
+from collections import deque
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from orchestrator.voice_loop import (
+    STT,
+    AudioCapture,
+    AudioRing,
+    Endpointer,
+    ReplaySource,
+    VoiceLoop,
+    WakeDetector,
+    as_mono_float32,
+    create_vad,
+    load_audio_file,
+    parse_args,
+    resolve_wake_ack,
+    utterance_complete,
+)
+
+RATE = 16000
+BLOCK = 512
+
+
+@pytest.fixture()
+def logger():
+    return logging.getLogger("test_audio")
+
+
+def tone(seconds, amplitude=0.3, freq=220.0):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (np.sin(2 * np.pi * freq * t) * amplitude * 32767).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+
+class FakeDevice:
+    """Stands in for the driver: pushes blocks into the ring from its own thread."""
+
+    def __init__(self, capture, signal, realtime=True):
+        self.capture = capture
+        self.signal = signal
+        self.realtime = realtime
+        self.opens = 0
+        self._stop = threading.Event()
+
+    def open(self):
+        self.opens += 1
+        self._stop.clear()
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        return self._stop.set
+
+    def _run(self):
+        for start in range(0, len(self.signal) - BLOCK + 1, BLOCK):
+            if self._stop.is_set():
+                return
+            self.capture.ring.write(self.signal[start:start + BLOCK].reshape(-1, 1))
+            time.sleep(BLOCK / RATE if self.realtime else 0.0005)
+
+
+def make_capture(logger, signal, realtime=True, **orch):
+    capture = AudioCapture({"orchestrator": {"vad_threshold": 0.02, "silence_duration": 0.3, **orch}}, logger)
+    capture.backend = "fake"
+    device = FakeDevice(capture, signal, realtime=realtime)
+    capture._open_device = device.open
+    return capture, device
+
+
+class TestAudioRing:
+    def test_wraparound_preserves_order(self):
+        ring = AudioRing(1000)
+        cursor = ring.cursor()
+        data = np.arange(2500, dtype=np.int16)
+        out = []
+        for start in range(0, 2500, 300):
+            ring.write(data[start:start + 300])
+            while cursor.available() >= 100:
+                out.append(cursor.read(100, timeout=0))
+        assert np.array_equal(np.concatenate(out), data[:len(out) * 100])
+        assert cursor.lost == 0
+
+    def test_independent_cursors(self):
+        ring = AudioRing(1000)
+        a = ring.cursor()
+        ring.write(np.arange(100, dtype=np.int16))
+        b = ring.cursor(back_samples=50)
+        assert np.array_equal(a.read(100, timeout=0), np.arange(100))
+        assert np.array_equal(b.read(50, timeout=0), np.arange(50, 100))
+
+    def test_lapped_cursor_reports_overrun(self):
+        ring = AudioRing(1000)
+        cursor = ring.cursor()
+        ring.write(np.arange(1500, dtype=np.int16))
+        chunk = cursor.read(100, timeout=0)
+        assert cursor.lost == 500
+        assert np.array_equal(chunk, np.arange(500, 600))
+        stats = ring.stats()
+        assert stats["overruns"] == 1 and stats["lost_samples"] == 500
+
+    def test_device_overflow_counted(self):
+        ring = AudioRing(1000)
+        ring.write(np.zeros(10, dtype=np.int16), overflow=True)
+        assert ring.stats()["device_overflows"] == 1
+
+    def test_read_times_out_and_close_wakes_readers(self):
+        ring = AudioRing(1000)
+        cursor = ring.cursor()
+        assert cursor.read(10, timeout=0.01) is None
+        threading.Timer(0.05, ring.close).start()
+        t0 = time.time()
+        assert cursor.read(10, timeout=5) is None
+        assert time.time() - t0 < 1
+
+
+class TestAudioCapture:
+    def test_device_opened_once_across_captures(self, logger):
+        signal = np.concatenate([tone(0.3), silence(0.5), tone(0.3), silence(0.5)])
+        capture, device = make_capture(logger, signal)
+        try:
+            first = capture.capture_until_silence(timeout=5)
+            second = capture.capture_until_silence(timeout=5)
+        finally:
+            capture.stop()
+        assert device.opens == 1
+        assert first is not None and second is not None
+        assert first.ndim == 1 and first.dtype == np.float32 and first.flags.c_contiguous
+
+    def test_stops_on_silence(self, logger):
+        signal = np.concatenate([tone(0.5), silence(1.5)])
+        capture, _ = make_capture(logger, signal)
+        try:
+            audio = capture.capture_until_silence(timeout=5)
+        finally:
+            capture.stop()
+        # speech plus ~silence_duration of trailing blocks, not the whole 1.5 s of silence
+        assert len(audio) < int(1.2 * RATE)
+
+    def test_stalled_stream_returns_what_was_read(self, logger):
+        capture, _ = make_capture(logger, tone(0.2))
+        try:
+            audio = capture.capture_until_silence(timeout=5)
+        finally:
+            capture.stop()
+        assert audio is not None and len(audio) <= int(0.2 * RATE)
+
+    def test_no_backend(self, logger):
+        capture = AudioCapture({}, logger)
+        capture.backend = None
+        assert capture.capture_until_silence(timeout=0.1) is None
+        assert capture.stats()["open"] is False
+
+
+class TestPreroll:
+    def run_capture(self, logger, signal, delay, **kwargs):
+        preroll_ms = kwargs.pop("preroll_ms", 500)
+        capture, _ = make_capture(logger, signal, preroll_ms=preroll_ms)
+        try:
+            capture.start()
+            time.sleep(delay)
+            audio = capture.capture_until_silence(timeout=5, **kwargs)
+        finally:
+            capture.stop()
+        return capture, audio
+
+    def test_speech_before_call_is_kept(self, logger):
+        # speech starts ~0.2 s before capture is called
+        signal = np.concatenate([silence(0.3), tone(0.5), silence(1.0)])
+        _, audio = self.run_capture(logger, signal, delay=0.5, preroll_ms=1000)
+        voiced = np.abs(audio) > 0.09
+        assert voiced.sum() > int(0.4 * RATE)
+
+    def test_without_preroll_start_is_lost(self, logger):
+        signal = np.concatenate([silence(0.3), tone(0.5), silence(1.0)])
+        _, audio = self.run_capture(logger, signal, delay=0.5, preroll_ms=0)
+        voiced = np.abs(audio) > 0.09
+        assert voiced.sum() < int(0.4 * RATE)
+
+    def test_leading_audio_trimmed_to_preroll_before_onset(self, logger):
+        signal = np.concatenate([silence(0.25), tone(0.3), silence(1.0)])
+        _, audio = self.run_capture(logger, signal, delay=0.0, preroll_ms=100)
+        onset = int(np.argmax(np.abs(audio) > 0.09))
+        # ceil(100 ms / block) pre-roll blocks plus the part of the onset block before the tone
+        assert onset <= 5 * BLOCK < int(0.25 * RATE)
+
+    def test_capture_from_wake_point(self, logger):
+        wake, command = tone(0.4, amplitude=0.2), tone(0.4, amplitude=0.6, freq=440.0)
+        signal = np.concatenate([silence(0.2), wake, command, silence(1.5)])
+        wake_end = int(0.6 * RATE)  # ring position where the command starts
+        capture, audio = self.run_capture(logger, signal, delay=1.2, start_pos=wake_end, preroll_ms=0)
+        assert capture.last_capture_start == wake_end
+        assert np.abs(audio[:int(0.3 * RATE)]).max() > 0.5
+
+    def test_preroll_stops_at_playback_end(self, logger):
+        # Loud TTS playback, then the user answers shortly after it ends
+        tts, answer = tone(0.6, amplitude=0.6, freq=440.0), tone(0.4, amplitude=0.2)
+        signal = np.concatenate([tts, silence(0.3), answer, silence(1.5)])
+        capture, _ = make_capture(logger, signal, preroll_ms=500)
+        try:
+            capture.start()
+            time.sleep(0.4)
+            # Playback "ends" with 0.2 s still to come; the grace covers that tail
+            capture.mark_playback_end(grace_s=0.3)
+            audio = capture.capture_until_silence(timeout=5)
+        finally:
+            capture.stop()
+        assert audio is not None
+        assert capture.last_capture_start >= int(0.65 * RATE)
+        assert 0.15 < np.abs(audio).max() < 0.4
+
+    @pytest.mark.parametrize("wake_ack, played", [("speech", "Yes Sir"), ("earcon", "earcon"), ("none", None)])
+    def test_wake_ack_marks_playback_end(self, logger, wake_ack, played):
+        capture, _ = make_capture(logger, silence(1.0))
+        capture.ring.write(silence(0.5).reshape(-1, 1))
+        heard = []
+        tts = SimpleNamespace(speak=heard.append, play_earcon=lambda: heard.append("earcon") or 0.1)
+        loop = SimpleNamespace(wake_ack=wake_ack, tts=tts, audio_capture=capture,
+                               grace_after_tts=0.2, post_tts_until=0.0)
+        loop._after_tts = lambda: VoiceLoop._after_tts(loop)
+        VoiceLoop._acknowledge_wake(loop)
+        assert heard == ([played] if played else [])
+        grace = {"speech": 0.2, "earcon": 0.1, "none": None}[wake_ack]
+        expected = 0 if grace is None else int(0.5 * RATE) + int(grace * RATE)
+        assert capture.playback_end_pos == expected
+
+    def test_capture_from_wake_turns_spoken_ack_off(self, logger):
+        assert resolve_wake_ack({"capture_from_wake": True}, logger) == "none"
+        assert resolve_wake_ack({"capture_from_wake": True, "wake_ack": "earcon"}, logger) == "earcon"
+        assert resolve_wake_ack({}, logger) == "speech"
+
+
+class TestVAD:
+    def make(self, logger, engine, **cfg):
+        return create_vad({"vad_engine": engine, "vad_threshold": 0.02, **cfg}, logger)
+
+    def blocks(self, signal):
+        return [signal[i:i + BLOCK] for i in range(0, len(signal) - BLOCK + 1, BLOCK)]
+
+    def noise(self, seconds, amplitude, seed=0):
+        rng = np.random.default_rng(seed)
+        return (rng.standard_normal(int(seconds * RATE)) * amplitude * 32767).astype(np.int16)
+
+    def test_fixed_threshold_when_not_adaptive(self, logger):
+        vad = self.make(logger, "rms", vad_adaptive=False)
+        assert vad.threshold == 0.02
+        assert vad.is_speech(tone(0.032, amplitude=0.05)[:BLOCK])
+        assert not vad.is_speech(tone(0.032, amplitude=0.01)[:BLOCK])
+
+    def test_noise_floor_tracks_steady_noise(self, logger):
+        vad = self.make(logger, "rms", vad_floor_window_s=1.0)
+        fan = self.noise(3.0, amplitude=0.03)
+        decisions = [vad.is_speech(b) for b in self.blocks(fan)]
+        # a fixed 0.02 threshold would call all of this speech
+        assert not any(decisions[-30:])
+        assert 0.02 < vad.noise_floor < 0.04
+        assert vad.is_speech(tone(0.032, amplitude=0.4)[:BLOCK] + fan[:BLOCK])
+
+    def test_quiet_room_lowers_threshold(self, logger):
+        vad = self.make(logger, "rms", vad_floor_window_s=1.0)
+        for block in self.blocks(self.noise(2.0, amplitude=0.001)):
+            vad.is_speech(block)
+        assert vad.threshold < 0.02
+        assert vad.is_speech(tone(0.032, amplitude=0.02)[:BLOCK])
+
+    def test_spectral_rejects_loud_broadband_noise(self, logger):
+        vad = self.make(logger, "spectral")
+        assert not vad.is_speech(self.noise(0.032, amplitude=0.2)[:BLOCK])
+        assert vad.is_speech(tone(0.032, amplitude=0.2)[:BLOCK])
+
+    def test_spectral_features_vectorised(self, logger):
+        vad = self.make(logger, "spectral")
+        rms, zcr, flatness = vad.features(tone(0.032)[:BLOCK].astype(np.float32) / 32768)
+        assert rms.shape == zcr.shape == flatness.shape == (BLOCK // vad.frame,)
+
+    def test_unknown_engine_falls_back(self, logger):
+        assert create_vad({"vad_engine": "nope"}, logger).name == "rms"
+
+    def test_webrtc_falls_back_when_missing(self, logger, monkeypatch):
+        monkeypatch.setattr("orchestrator.voice_loop.WEBRTCVAD_AVAILABLE", False)
+        assert create_vad({"vad_engine": "webrtc"}, logger).name == "spectral"
+
+    def test_webrtc_full_scale_samples_do_not_wrap(self, logger, monkeypatch):
+        frames = []
+
+        class FakeVad:
+            def __init__(self, mode):
+                pass
+
+            def is_speech(self, frame, rate):
+                frames.append(np.frombuffer(frame, dtype=np.int16))
+                return True
+
+        monkeypatch.setattr("orchestrator.voice_loop.webrtcvad", SimpleNamespace(Vad=FakeVad), raising=False)
+        monkeypatch.setattr("orchestrator.voice_loop.WEBRTCVAD_AVAILABLE", True)
+        vad = create_vad({"vad_engine": "webrtc"}, logger)
+        block = np.tile(np.array([1.0, -1.0, 0.99999], dtype=np.float32), BLOCK // 3 + 1)[:BLOCK]
+        vad._decide(block, 1.0)
+        assert frames[0][:3].tolist() == [32767, -32768, 32767]
+
+    def test_silent_capture_skips_stt(self, logger):
+        capture, _ = make_capture(logger, silence(1.0))
+        try:
+            assert capture.capture_until_silence(timeout=5) is None
+        finally:
+            capture.stop()
+
+
+class TestEndpointing:
+    ORCH = {"silence_duration": 2.5, "endpoint_hangover_ms": 800, "endpoint_min_hangover_ms": 300}
+
+    def capture(self, logger, signal, realtime=False, **kwargs):
+        # Hangovers are counted in blocks, so most cases can run faster than real time
+        capture, _ = make_capture(logger, signal, realtime=realtime, **self.ORCH)
+        try:
+            audio = capture.capture_until_silence(timeout=10, **kwargs)
+        finally:
+            capture.stop()
+        return capture, audio
+
+    def trailing_ms(self, audio, speech_s):
+        return (len(audio) - int(speech_s * RATE)) * 1000 / RATE
+
+    def test_endpointer_hangover_choice(self):
+        ep = Endpointer({"silence_duration": 2.5})
+        assert ep.silence_needed() == (2.5, "max_hangover")
+        for _ in range(20):
+            ep.voiced(0.3, 0.032)
+        assert ep.silence_needed() == (0.8, "hangover")
+        for _ in range(3):
+            ep.voiced(0.02, 0.032)
+        assert ep.silence_needed() == (0.6, "decay")
+
+    def test_disabled_uses_silence_duration(self):
+        ep = Endpointer({"silence_duration": 2.5, "endpointing": False})
+        for _ in range(20):
+            ep.voiced(0.3, 0.032)
+        assert ep.silence_needed() == (2.5, "max_hangover")
+
+    def test_abrupt_phrase_end_uses_hangover(self, logger):
+        capture, audio = self.capture(logger, np.concatenate([tone(0.8), silence(3.0)]))
+        assert capture.last_endpoint == "hangover"
+        assert 700 <= self.trailing_ms(audio, 0.8) <= 1000
+
+    def test_decaying_phrase_end_uses_min_hangover(self, logger):
+        speech = tone(0.8)
+        speech[-int(0.3 * RATE):] = (speech[-int(0.3 * RATE):] * np.linspace(1, 0, int(0.3 * RATE))).astype(np.int16)
+        capture, audio = self.capture(logger, np.concatenate([speech, silence(3.0)]))
+        assert capture.last_endpoint == "decay"
+        assert self.trailing_ms(audio, 0.8) <= 500
+
+    def test_decaying_tail_then_more_speech_not_split(self, logger):
+        # Default endpoint settings: a soft phrase ending, a 400 ms breath, then more words
+        speech = tone(0.8)
+        speech[-int(0.3 * RATE):] = (speech[-int(0.3 * RATE):] * np.linspace(1, 0, int(0.3 * RATE))).astype(np.int16)
+        signal = np.concatenate([speech, silence(0.4), tone(0.6), silence(3.0)])
+        capture, _ = make_capture(logger, signal, realtime=False, silence_duration=2.5)
+        try:
+            audio = capture.capture_until_silence(timeout=10)
+        finally:
+            capture.stop()
+        assert capture.last_endpoint == "hangover"
+        assert len(audio) >= int(1.8 * RATE)
+
+    def test_short_blip_waits_full_silence(self, logger):
+        capture, audio = self.capture(logger, np.concatenate([tone(0.15), silence(3.0)]))
+        assert capture.last_endpoint == "max_hangover"
+        assert self.trailing_ms(audio, 0.15) >= 2400
+
+    def test_partial_check_ends_early_once_per_pause(self, logger):
+        calls = []
+
+        def check(audio):
+            calls.append(len(audio))
+            return True
+
+        capture, audio = self.capture(logger, np.concatenate([tone(0.8), silence(3.0)]), endpoint_check=check)
+        assert capture.last_endpoint == "partial"
+        assert calls == [len(audio)]
+        assert self.trailing_ms(audio, 0.8) <= 450
+
+    def test_speech_end_timestamp(self, logger):
+        t0 = time.time()
+        capture, _ = self.capture(logger, np.concatenate([silence(0.1), tone(0.5), silence(3.0)]), realtime=True)
+        # speech ended ~0.6 s after the device started, not when capture returned
+        assert 0.4 <= capture.last_speech_end - t0 <= 0.9
+
+    def test_utterance_complete(self):
+        assert utterance_complete("What time is it?")
+        assert utterance_complete("Turn off the lights.")
+        assert not utterance_complete("Tell me about the")
+        assert not utterance_complete("Remind me to call and...")
+        assert not utterance_complete("What is the weather and.")
+        assert not utterance_complete("")
+
+
+class FakeOWW:
+    def __init__(self):
+        self.prediction_buffer = {"hey_jarvis": deque([0.0], maxlen=30)}
+        self.frames = []
+
+    def predict(self, frame):
+        self.frames.append(frame)
+        return {"hey_jarvis": 0.0}
+
+
+class FakeWhisper:
+    def __init__(self):
+        self.seen = None
+
+    def transcribe(self, audio, **kwargs):
+        self.seen = audio
+        return [SimpleNamespace(text="hello there")], SimpleNamespace(language="en")
+
+
+def peak_allocation(fn):
+    """(result, peak bytes allocated by fn beyond what was live before)."""
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    return result, tracemalloc.get_traced_memory()[1] - base
+
+
+class TestZeroCopyPath:
+    @pytest.fixture()
+    def pipeline(self, logger):
+        capture, _ = make_capture(logger, np.concatenate([tone(2.0), silence(1.0)]), realtime=False)
+        wake = WakeDetector({"wake": {"mode": "text", "phrases": ["hey jarvis"]}}, logger)
+        wake.oww_model = FakeOWW()
+        stt = STT({"stt": {"device": "cpu"}}, logger)
+        stt._whisper = FakeWhisper()
+        yield capture, wake, stt
+        capture.stop()
+
+    def test_canonical_buffer_passes_through(self):
+        audio = np.zeros(100, dtype=np.float32)
+        assert as_mono_float32(audio) is audio
+        pcm = np.full((100, 1), 16384, dtype=np.int16)
+        converted = as_mono_float32(pcm)
+        assert converted.shape == (100,) and converted.dtype == np.float32 and converted[0] == 0.5
+
+    def test_consumers_get_views_of_the_capture_buffer(self, pipeline):
+        capture, wake, stt = pipeline
+        audio = capture.capture_until_silence(timeout=5)
+        assert audio.dtype == np.float32 and audio.ndim == 1 and audio.flags.c_contiguous
+
+        wake.detect_in_audio_stream(audio)
+        assert stt.transcribe_audio(audio) == "hello there"
+        assert stt._whisper.seen is audio
+        # Wake frames are DC-corrected into one reused scratch frame
+        assert len({id(f) for f in wake.oww_model.frames}) == 1
+
+    def test_allocations_per_turn(self, pipeline):
+        capture, wake, stt = pipeline
+        capture.start()
+        tracemalloc.start()
+        try:
+            audio, capture_bytes = peak_allocation(lambda: capture.capture_until_silence(timeout=5))
+            _, wake_bytes = peak_allocation(lambda: wake.detect_in_audio_stream(audio))
+            _, stt_bytes = peak_allocation(lambda: stt.transcribe_audio(audio))
+        finally:
+            tracemalloc.stop()
+
+        # Capture allocates exactly one audio-sized buffer; wake and STT allocate none
+        buffer_bytes = audio.base.nbytes
+        assert audio.nbytes > 2 * RATE * 4 * 0.9
+        assert capture_bytes // buffer_bytes == 1
+        assert wake_bytes < audio.nbytes // 10
+        assert stt_bytes < audio.nbytes // 10
+
+
+def write_wav(path, samples, rate=RATE, channels=1):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    return path
+
+
+class TestReplayBackend:
+    ORCH = {"audio_backend": "replay", "silence_duration": 0.5, "preroll_ms": 200,
+            "replay_gap_ms": 1000, "replay_lead_ms": 200, "replay_tail_ms": 1000}
+
+    def make(self, logger, replay_input, **orch):
+        return AudioCapture({"orchestrator": {**self.ORCH, "replay_input": replay_input, **orch}}, logger)
+
+    def test_load_resamples_and_downmixes(self, tmp_path):
+        stereo = np.repeat(tone(0.5, freq=200.0)[::2], 2)  # 8 kHz, both channels equal
+        audio = load_audio_file(write_wav(tmp_path / "a.wav", stereo, rate=8000, channels=2))
+        assert audio.dtype == np.int16
+        assert abs(len(audio) - RATE // 2) <= 2
+
+    def test_rejects_unknown_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            load_audio_file(tmp_path / "a.mp3")
+
+    def test_playlist_relative_paths_and_comments(self, tmp_path):
+        (tmp_path / "fixtures").mkdir()
+        playlist = tmp_path / "fixtures" / "run.m3u"
+        playlist.write_text("# wake + command\none.wav\n\n/abs/two.flac\n")
+        assert ReplaySource.playlist([str(playlist), "three.wav"]) == [
+            tmp_path / "fixtures" / "one.wav", Path("/abs/two.flac"), Path("three.wav")]
+
+    def test_lockstep_replay_delivers_every_utterance(self, tmp_path, logger):
+        first = write_wav(tmp_path / "one.wav", tone(0.6))
+        second = write_wav(tmp_path / "two.wav", tone(0.6, freq=440.0))
+        capture = self.make(logger, [str(first), str(second)], replay_speed=0)
+        try:
+            captured = []
+            while not capture.finished:
+                audio = capture.capture_until_silence(timeout=10)
+                if audio is not None:
+                    captured.append(audio)
+                    time.sleep(0.3)  # a slow turn: lockstep replay waits for it
+        finally:
+            capture.stop()
+        assert len(captured) == 2
+        for audio in captured:
+            # |sin| > 0.3 for ~80% of each 0.6 s tone: the whole utterance arrived
+            voiced = np.abs(audio) > 0.09
+            assert voiced.sum() > int(0.45 * RATE)
+
+    def test_faster_than_real_time(self, tmp_path, logger):
+        clip = write_wav(tmp_path / "one.wav", tone(2.0))
+        capture = self.make(logger, str(clip), replay_speed=8.0, replay_tail_ms=200)
+        t0 = time.time()
+        try:
+            capture.start()
+            assert capture.replay_done.wait(timeout=5)
+        finally:
+            capture.stop()
+        # 2.4 s of audio at 8x
+        assert time.time() - t0 < 1.0
+        assert capture.ring.written >= int(2.3 * RATE)
+
+    def test_missing_input_fails_cleanly(self, logger):
+        capture = self.make(logger, [])
+        assert capture.capture_until_silence(timeout=0.1) is None
+        assert not capture.finished
+
+    def test_run_cli_replay_flags(self):
+        args = parse_args(["run", "--replay", "a.wav", "b.m3u", "--replay-speed", "0"])
+        assert args.replay == ["a.wav", "b.m3u"] and args.replay_speed == 0.0
+        assert parse_args([]).command == "run"
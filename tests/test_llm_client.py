@@ -0,0 +1,211 @@
+"""Tests for LLMClient prompt assembly and the token-budget governor."""
+
+from __future__ import annotations
+
+import json
+import logging
+
+import pytest
+
+from orchestrator.voice_loop import (
+    ConversationState,
+    ConversationSummarizer,
+    LLMClient,
+    MemoryStore,
+    PromptContext,
+    estimate_tokens,
+    truncate_tokens,
+)
+
+
+@pytest.fixture()
+def logger():
+    return logging.getLogger("test_llm")
+
+
+def make_client(logger, **llm):
+    cfg = {"llm": {"model": "deepseek-r1:7b", **llm}, "assistant": {"identity": "You are Nova."}}
+    return LLMClient(cfg, logger)
+
+
+class TestTokenEstimate:
+    def test_empty_is_zero(self):
+        assert estimate_tokens("") == 0
+
+    def test_scales_with_length(self):
+        short = estimate_tokens("hello there")
+        long = estimate_tokens("hello there " * 50)
+        assert 0 < short < long
+        # ~4 chars per token for English prose
+        assert 120 <= long <= 200
+
+    def test_truncate_respects_budget(self):
+        text = "word " * 500
+        for budget in (1, 5, 40, 200):
+            assert estimate_tokens(truncate_tokens(text, budget)) <= budget
+
+    def test_truncate_keeps_short_text(self):
+        assert truncate_tokens("short text", 50) == "short text"
+
+
+class TestPromptBudget:
+    def test_legacy_string_context_format(self, logger):
+        client = make_client(logger)
+        prompt = client._build_prompt("hi", "Recent conversation:\nUser: yo", "sys")
+        assert prompt == "System: sys\n\nContext:\nRecent conversation:\nUser: yo\n\nUser: hi\n\nAssistant:"
+
+    def test_budget_per_intent_capped_by_window(self, logger):
+        client = make_client(logger, context_tokens=2048, response_tokens=512,
+                             prompt_budget_tokens={"default": 1000, "code": 4000})
+        assert client.prompt_budget("general") == 1000
+        assert client.prompt_budget("code") == 1536
+
+    def test_drops_hits_already_in_recent_window(self, logger):
+        client = make_client(logger)
+        ctx = PromptContext(
+            recent=[("user", "my dog is called Rex"), ("assistant", "Nice name!"),
+                    ("user", "what is my dog called")],
+            memories=[("my dog is called Rex", 0.9), ("what is my dog called", 0.8),
+                      ("Rex likes the beach", 0.5)])
+        prompt = client._build_prompt("what is my dog called", ctx, "sys", intent="general")
+        assert prompt.count("my dog is called Rex") == 1
+        assert prompt.count("what is my dog called") == 1  # only the user line at the end
+        assert "- Rex likes the beach" in prompt
+        assert client.last_prompt_stats["memory_duplicates"] == 2
+
+    def test_trims_oldest_turns_and_lowest_hits_first(self, logger, caplog):
+        client = make_client(logger, prompt_budget_tokens={"general": 160}, memory_item_tokens=30)
+        recent = []
+        for i in range(10):
+            recent.append(("user", f"question {i} " + "filler " * 10))
+            recent.append(("assistant", f"answer {i} " + "filler " * 10))
+        memories = [(f"memory {i} " + "detail " * 10, 1.0 - i / 10) for i in range(5)]
+        with caplog.at_level(logging.INFO, logger="test_llm"):
+            prompt = client._build_prompt("next?", PromptContext(recent, memories), "sys", intent="general")
+
+        stats = client.last_prompt_stats
+        assert stats["est_tokens"] <= 160
+        assert not stats["over_budget"]
+        assert stats["recent_dropped"] > 0 and stats["memory_dropped"] > 0
+        # Newest turns and best hits survive
+        assert "answer 9" in prompt and "question 0" not in prompt
+        assert "memory 0" in prompt and "memory 4" not in prompt
+        # Kept turns stay in chronological order
+        assert prompt.index("question 9") < prompt.index("answer 9")
+
+        records = [r.getMessage() for r in caplog.records if r.getMessage().startswith("prompt_budget")]
+        logged = json.loads(records[-1].split(" ", 1)[1])
+        assert logged["intent"] == "general" and logged["est_tokens"] == stats["est_tokens"]
+
+    def test_unused_section_budget_flows_to_other(self, logger):
+        client = make_client(logger, prompt_budget_tokens={"general": 300}, recent_share=0.2)
+        recent = [("user", f"turn {i} " + "filler " * 10) for i in range(8)]
+        prompt = client._build_prompt("next?", PromptContext(recent, []), None, intent="general")
+        # No memories, so the recent window may use far more than its 20% share
+        assert client.last_prompt_stats["recent_tokens"] > 0.2 * 300
+        assert "Relevant context:" not in prompt
+
+    def test_long_system_prompt_capped(self, logger):
+        client = make_client(logger, prompt_budget_tokens={"default": 100})
+        prompt = client._build_prompt("hi", None, "rule " * 400)
+        assert client.last_prompt_stats["system_tokens"] <= 50
+        assert prompt.endswith("User: hi\n\nAssistant:")
+
+    def test_summary_section_precedes_recent(self, logger):
+        client = make_client(logger)
+        ctx = PromptContext(recent=[("user", "and tomorrow?")], summary="User lives in Durban.")
+        prompt = client._build_prompt("thanks", ctx, "sys")
+        assert "Conversation so far:\nUser lives in Durban.\nRecent conversation:\nUser: and tomorrow?" in prompt
+        assert client.last_prompt_stats["summary_tokens"] > 0
+
+
+class FakeLLM(LLMClient):
+    """LLMClient whose Ollama call records prompts and returns a canned summary."""
+
+    def __init__(self, cfg, logger):
+        super().__init__(cfg, logger)
+        self.calls = []
+
+    def _call_ollama(self, model, prompt):
+        self.calls.append((model, prompt))
+        return f"<think>hmm</think>Summary {len(self.calls)}"
+
+
+@pytest.fixture()
+def summary_setup(tmp_path, logger):
+    cfg = {
+        "llm": {"model": "big", "fallback_model": "small", "max_context_turns": 4,
+                "summary_enabled": True, "summary_min_turns": 2},
+        "memory": {"enabled": True, "write_behind": False, "integrity_check": "off"},
+    }
+    memory = MemoryStore(tmp_path / "memory.db", logger, cfg)
+    llm = FakeLLM(cfg, logger)
+    state = ConversationState(session_id="s1")
+    for i in range(10):
+        role = "user" if i % 2 == 0 else "assistant"
+        state.add_turn(role, f"turn {state.turn_num + 1}")
+        memory.add_turn("s1", state.turn_num, role, f"turn {state.turn_num}")
+    yield cfg, memory, llm, state
+    memory.close()
+
+
+class TestConversationSummarizer:
+    def test_summarizes_turns_outside_window_with_fallback_model(self, summary_setup, logger):
+        cfg, memory, llm, state = summary_setup
+        summarizer = ConversationSummarizer(cfg, llm, memory, logger)
+        assert summarizer.summarize(state)
+
+        model, prompt = llm.calls[0]
+        assert model == "small"
+        assert "User: turn 1" in prompt and "Assistant: turn 6" in prompt
+        assert "turn 7" not in prompt
+        assert state.summary == "Summary 1" and state.summary_through == 6
+        assert memory.get_summary("s1") == ("Summary 1", 6)
+
+    def test_waits_for_min_turns(self, summary_setup, logger):
+        cfg, memory, llm, state = summary_setup
+        summarizer = ConversationSummarizer(cfg, llm, memory, logger)
+        summarizer.summarize(state)
+        state.add_turn("user", "turn 11")
+        assert not summarizer.summarize(state)
+        state.add_turn("assistant", "turn 12")
+        memory.add_turn("s1", 11, "user", "turn 11")
+        memory.add_turn("s1", 12, "assistant", "turn 12")
+        assert summarizer.summarize(state)
+        _, prompt = llm.calls[1]
+        assert "Current summary:\nSummary 1" in prompt
+        assert "turn 7" in prompt and "turn 6" not in prompt
+        assert state.summary_through == 8
+
+    def test_resume_loads_summary(self, summary_setup, logger):
+        cfg, memory, llm, state = summary_setup
+        ConversationSummarizer(cfg, llm, memory, logger).summarize(state)
+
+        resumed = ConversationState(session_id="s1", turn_num=10)
+        ConversationSummarizer(cfg, llm, memory, logger).load(resumed)
+        assert (resumed.summary, resumed.summary_through) == ("Summary 1", 6)
+
+    def test_disabled_without_memory(self, tmp_path, logger):
+        cfg = {"llm": {"summary_enabled": True}, "memory": {"enabled": False}}
+        memory = MemoryStore(tmp_path / "memory.db", logger, cfg)
+        assert not ConversationSummarizer(cfg, make_client(logger), memory, logger).enabled
+
+
+class TestRecentWindow:
+    def make_state(self, turns):
+        state = ConversationState(session_id="s")
+        for i in range(turns):
+            state.add_turn("user" if i % 2 == 0 else "assistant", f"turn {i + 1}")
+        return state
+
+    def test_plain_window(self):
+        state = self.make_state(10)
+        assert [c for _, c in state.get_recent(4)] == ["turn 7", "turn 8", "turn 9", "turn 10"]
+
+    def test_unsummarized_turns_stay_until_summary_catches_up(self):
+        state = self.make_state(10)
+        assert len(state.get_recent(4, summarized=True)) == 10
+        state.summary_through = 5
+        assert [c for _, c in state.get_recent(4, summarized=True)][0] == "turn 6"
+        state.summary_through = 8
+        assert len(state.get_recent(4, summarized=True)) == 4
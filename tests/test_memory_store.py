@@ -2,15 +2,37 @@
 
 from __future__ import annotations
 
+import json
 import logging
 import sqlite3
 import tempfile
+import time
+import zlib
 from pathlib import Path
 
+import numpy as np
 import pytest
 
 # Import directly from the orchestrator module
-from orchestrator.voice_loop import MemoryStore
+from orchestrator.voice_loop import FlatIndex, MemoryStore, OnnxEmbedder
+
+
+class FakeEmbedder:
+    """Deterministic bag-of-words embedder so tests need no model download."""
+
+    dim = 64
+
+    def encode(self, text, **kwargs):
+        if isinstance(text, (list, tuple)):
+            return np.stack([self._encode_one(t) for t in text])
+        return self._encode_one(text)
+
+    def _encode_one(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            rng = np.random.default_rng(zlib.crc32(word.encode()))
+            vec += rng.standard_normal(self.dim).astype(np.float32)
+        return vec
 
 
 @pytest.fixture()
@@ -31,6 +53,13 @@ def store(tmp_db, logger):
     return MemoryStore(tmp_db, logger, cfg)
 
 
+@pytest.fixture()
+def semantic_store(tmp_db, logger):
+    """Create a MemoryStore backed by the fake embedder."""
+    cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3}}
+    return MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+
+
 class TestMemoryStoreInit:
     def test_creates_database_file(self, store, tmp_db):
         assert tmp_db.exists()
@@ -132,3 +161,1014 @@ class TestSessionManagement:
 
         info = store.get_session_info("sess1")
         assert info["turn_count"] == 3
+        assert info["last_turn_num"] == 3
+
+    def test_unknown_session_info(self, store):
+        assert store.get_session_info("missing")["turn_count"] == 0
+
+    def test_sessions_table_backfilled_for_existing_db(self, tmp_db, logger):
+        conn = sqlite3.connect(tmp_db)
+        conn.execute("""CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, turn_num INTEGER NOT NULL,
+            role TEXT NOT NULL, content TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            embedding BLOB, metadata TEXT)""")
+        conn.executemany(
+            "INSERT INTO conversations (session_id, turn_num, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+            [("old", 1, "user", "a", "2024-01-01 10:00:00"), ("old", 2, "assistant", "b", "2024-01-01 10:01:00"),
+             ("newer", 1, "user", "c", "2024-02-01 09:00:00")])
+        conn.commit()
+        conn.close()
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True}})
+        info = store.get_session_info("old")
+        assert info == {"turn_count": 2, "started": "2024-01-01 10:00:00",
+                        "last_activity": "2024-01-01 10:01:00", "last_turn_num": 2}
+        assert store.get_latest_session(max_age_hours=10 ** 6) == "newer"
+
+    def test_session_lookups_use_indexes(self, store):
+        conn = store.pool.reader()
+        plans = [
+            " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, args))
+            for sql, args in [
+                ("SELECT session_id FROM sessions ORDER BY last_ts DESC, rowid DESC LIMIT 1", ()),
+                ("SELECT role, content FROM conversations WHERE session_id = ? "
+                 "ORDER BY turn_num DESC, id DESC LIMIT 5", ("s",)),
+            ]
+        ]
+        assert "idx_sessions_last_ts" in plans[0]
+        assert "idx_conversations_session_turn" in plans[1]
+        assert all("TEMP B-TREE" not in p for p in plans)
+
+
+class TestConnectionPool:
+    def test_reader_connection_is_reused(self, store):
+        assert store.pool.reader() is store.pool.reader()
+
+    def test_readers_are_per_thread(self, store):
+        import threading
+
+        seen = []
+        t = threading.Thread(target=lambda: seen.append(store.pool.reader()))
+        t.start()
+        t.join()
+        assert seen[0] is not store.pool.reader()
+
+    def test_tuned_pragmas_applied(self, store):
+        conn = store.pool.reader()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+
+    def test_close_releases_connections(self, store):
+        store.add_turn("sess1", 1, "user", "Hello")
+        store.close()
+        with pytest.raises(RuntimeError):
+            store.pool.reader()
+        # Reads after shutdown degrade to empty instead of raising
+        assert store.get_recent_turns("sess1") == []
+
+
+class TestSemanticSearch:
+    def _reference_scores(self, store, query):
+        """Original per-row scoring loop, used as the oracle."""
+        from datetime import datetime
+
+        q = store.embedder.encode(query)
+        conn = sqlite3.connect(store.db_path)
+        out = {}
+        for content, emb_bytes, ts in conn.execute(
+            "SELECT content, embedding, timestamp FROM conversations WHERE embedding IS NOT NULL"
+        ):
+            emb = np.frombuffer(emb_bytes, dtype=np.float32)
+            sim = np.dot(q, emb) / (np.linalg.norm(q) * np.linalg.norm(emb))
+            age_hours = (datetime.now() - datetime.fromisoformat(ts)).total_seconds() / 3600
+            out[content] = float(sim * (0.7 + 0.3 * max(0.0, 1.0 - age_hours / 720)))
+        conn.close()
+        return out
+
+    def test_matches_reference_scoring(self, semantic_store):
+        texts = ["the cat sat on the mat", "dogs like the park", "the cat likes fish",
+                 "weather in london", "my cat is asleep on the mat"]
+        for i, t in enumerate(texts):
+            semantic_store.add_turn("s", i, "user", t)
+
+        semantic_store.flush()
+        query = "where is the cat"
+        ref = self._reference_scores(semantic_store, query)
+        expected = sorted(
+            [(c, sc) for c, sc in ref.items() if semantic_store.semantic_threshold <= sc <= 0.95],
+            key=lambda x: x[1], reverse=True,
+        )[:3]
+
+        results = semantic_store.search_semantic(query, limit=3)
+        assert [c for c, _ in results] == [c for c, _ in expected]
+        for (_, got), (_, want) in zip(results, expected):
+            assert got == pytest.approx(want, abs=1e-3)
+
+    def test_echo_is_filtered(self, semantic_store):
+        semantic_store.add_turn("s", 1, "user", "tell me about the moon")
+        assert semantic_store.search_semantic("tell me about the moon") == []
+
+    def test_scores_whole_history(self, semantic_store):
+        semantic_store.add_turn("s", 0, "user", "alpha beta gamma delta")
+        for i in range(1, 150):
+            semantic_store.add_turn("s", i, "user", f"filler number {i}")
+        results = semantic_store.search_semantic("alpha beta gamma", limit=1)
+        assert results and results[0][0] == "alpha beta gamma delta"
+
+    def test_matrix_reloaded_on_restart(self, semantic_store, tmp_db, logger):
+        semantic_store.add_turn("s", 1, "user", "first")
+        semantic_store.add_turn("s", 2, "user", "second")
+        semantic_store.close()
+
+        cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3}}
+        reopened = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        assert reopened.embeddings.count == 2
+        assert reopened.embeddings.dim == FakeEmbedder.dim
+
+
+class TestEmbeddingSidecar:
+    @pytest.fixture()
+    def sidecar_cfg(self):
+        return {"memory": {"enabled": True, "semantic_threshold": 0.3, "embedding_sidecar": True}}
+
+    def test_vectors_written_by_row_id(self, tmp_db, logger, sidecar_cfg):
+        store = MemoryStore(tmp_db, logger, sidecar_cfg, embedder=FakeEmbedder())
+        store.add_turn("s", 1, "user", "hello world")
+        store.add_turn("s", 2, "user", "goodbye moon")
+        store.flush()
+        assert store.sidecar.rows() == 2
+        assert isinstance(store.embeddings.vecs, np.memmap)
+        assert store.verify_sidecar(full=True)["ok"]
+
+    def test_restart_maps_sidecar(self, tmp_db, logger, sidecar_cfg):
+        store = MemoryStore(tmp_db, logger, sidecar_cfg, embedder=FakeEmbedder())
+        store.add_turn("s", 1, "user", "the cat sat on the mat")
+        store.add_turn("s", 2, "user", "dogs in the park")
+        store.close()
+
+        reopened = MemoryStore(tmp_db, logger, sidecar_cfg, embedder=FakeEmbedder())
+        assert isinstance(reopened.embeddings.vecs, np.memmap)
+        results = reopened.search_semantic("cat on a mat", limit=1)
+        assert results[0][0] == "the cat sat on the mat"
+
+    def test_drift_detected_and_rebuilt(self, tmp_db, logger, sidecar_cfg):
+        store = MemoryStore(tmp_db, logger, sidecar_cfg, embedder=FakeEmbedder())
+        store.add_turn("s", 1, "user", "hello world")
+        store.add_turn("s", 2, "user", "goodbye moon")
+        store.flush()
+        store.sidecar.close()
+        with open(store.sidecar.path, "r+b") as fh:
+            fh.write(b"\x00" * 8)
+        assert not store.verify_sidecar(full=True)["ok"]
+
+        assert store.rebuild_sidecar() == 2
+        assert store.verify_sidecar(full=True)["ok"]
+
+    def test_existing_db_migrates_on_enable(self, tmp_db, logger, sidecar_cfg):
+        cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3}}
+        plain = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        plain.add_turn("s", 1, "user", "hello world")
+        plain.close()
+
+        store = MemoryStore(tmp_db, logger, sidecar_cfg, embedder=FakeEmbedder())
+        assert store.sidecar.rows() == 1
+        assert store.embeddings.count == 1
+
+
+class TestWriteBehind:
+    def test_turns_are_batched_into_one_encode(self, tmp_db, logger):
+        class CountingEmbedder(FakeEmbedder):
+            calls = []
+
+            def encode(self, text, **kwargs):
+                if isinstance(text, list):
+                    self.calls.append(len(text))
+                return super().encode(text)
+
+        embedder = CountingEmbedder()
+        cfg = {"memory": {"enabled": True, "write_batch_size": 64}}
+        store = MemoryStore(tmp_db, logger, cfg, embedder=embedder)
+        # Hold the writer lock so turns pile up in the queue
+        with store.pool.write_lock:
+            for i in range(10):
+                store.add_turn("s", i, "user", f"message {i}")
+            time.sleep(0.05)
+        store.flush()
+        assert sum(embedder.calls) == 10
+        assert len(embedder.calls) <= 2
+        assert store.embeddings.count == 10
+
+    def test_reads_see_pending_turns(self, store):
+        store.add_turn("s", 1, "user", "queued")
+        assert store.get_recent_turns("s") == [("user", "queued")]
+
+    def test_close_flushes_queue(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True}}
+        store = MemoryStore(tmp_db, logger, cfg)
+        for i in range(5):
+            store.add_turn("s", i, "user", f"message {i}")
+        store.close()
+        conn = sqlite3.connect(tmp_db)
+        assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 5
+        conn.close()
+
+    def test_synchronous_mode(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True, "write_behind": False}}
+        store = MemoryStore(tmp_db, logger, cfg)
+        assert store._writer_thread is None
+        store.add_turn("s", 1, "user", "direct")
+        conn = sqlite3.connect(tmp_db)
+        assert conn.execute("SELECT content FROM conversations").fetchone()[0] == "direct"
+        conn.close()
+
+
+class TestIVFIndex:
+    @pytest.fixture()
+    def ivf_cfg(self):
+        return {"memory": {"enabled": True, "semantic_threshold": 0.3, "write_behind": False,
+                           "ann_index": "ivf", "ann_nlist": 8, "ann_nprobe": 8, "ann_train_min": 64}}
+
+    def _fill(self, store, n=120):
+        for i in range(n):
+            store.add_turn("s", i, "user", f"topic{i % 17} detail{i} note{i % 5}")
+
+    def test_untrained_index_is_exact(self, tmp_db, logger, ivf_cfg):
+        ivf_cfg["memory"]["ann_train_min"] = 10_000
+        store = MemoryStore(tmp_db, logger, ivf_cfg, embedder=FakeEmbedder())
+        self._fill(store, 20)
+        assert store.index.candidates(np.ones(FakeEmbedder.dim), store.embeddings.count) is None
+
+    def test_full_probe_matches_flat(self, tmp_db, logger, ivf_cfg):
+        store = MemoryStore(tmp_db, logger, ivf_cfg, embedder=FakeEmbedder())
+        self._fill(store)
+        store.index.wait_trained(10)
+        assert store.index.stats()["trained"]
+        assert store.index.indexed == store.embeddings.count
+
+        query = "topic3 note2"
+        ivf_results = store.search_semantic(query, limit=5)
+        store.index = FlatIndex()
+        assert store.search_semantic(query, limit=5) == ivf_results
+
+    def test_probe_limits_candidates(self, tmp_db, logger, ivf_cfg):
+        ivf_cfg["memory"]["ann_nprobe"] = 1
+        store = MemoryStore(tmp_db, logger, ivf_cfg, embedder=FakeEmbedder())
+        self._fill(store)
+        store.index.wait_trained(10)
+        cands = store.index.candidates(FakeEmbedder().encode("topic3"), store.embeddings.count)
+        assert 0 < len(cands) < store.embeddings.count
+
+    def test_failed_training_retried_on_next_append(self, tmp_db, logger, ivf_cfg):
+        store = MemoryStore(tmp_db, logger, ivf_cfg, embedder=FakeEmbedder())
+        nearest = store.index._nearest
+
+        def fail_once(*args):
+            store.index._nearest = nearest
+            raise RuntimeError("k-means blew up")
+
+        store.index._nearest = fail_once
+        self._fill(store, 64)
+        store.index.wait_trained(10)
+        assert not store.index.stats()["trained"]
+
+        store.add_turn("s", 64, "user", "one more note")
+        store.index.wait_trained(10)
+        assert store.index.stats()["trained"]
+        assert store.index.indexed == store.embeddings.count
+
+    def test_index_persisted_and_reloaded(self, tmp_db, logger, ivf_cfg):
+        store = MemoryStore(tmp_db, logger, ivf_cfg, embedder=FakeEmbedder())
+        self._fill(store)
+        store.index.wait_trained(10)
+        store.add_turn("s", 999, "user", "late arrival")
+        store.close()
+        assert tmp_db.with_suffix(".ivf.npz").exists()
+
+        reopened = MemoryStore(tmp_db, logger, ivf_cfg, embedder=FakeEmbedder())
+        assert reopened.index.stats()["trained"]
+        assert reopened.index.indexed == reopened.embeddings.count == 121
+
+
+class TestEmbeddingCache:
+    class CountingEmbedder(FakeEmbedder):
+        def __init__(self):
+            self.encoded = []
+
+        def encode(self, text, **kwargs):
+            if isinstance(text, list):
+                self.encoded.extend(text)
+            else:
+                self.encoded.append(text)
+            return super().encode(text)
+
+    def test_search_reuses_turn_embedding(self, tmp_db, logger):
+        embedder = self.CountingEmbedder()
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True}}, embedder=embedder)
+        store.add_turn("s", 1, "user", "what is the capital of france")
+        store.search_semantic("what is the capital of france")
+        assert embedder.encoded == ["what is the capital of france"]
+        assert store.embedding_cache.stats()["hits"] == 1
+
+    def test_repeated_replies_not_reembedded(self, tmp_db, logger):
+        embedder = self.CountingEmbedder()
+        cfg = {"memory": {"enabled": True, "dedupe_enabled": False}}
+        store = MemoryStore(tmp_db, logger, cfg, embedder=embedder)
+        for i in range(3):
+            store.add_turn("s", i, "assistant", "Going to sleep mode.")
+            store.flush()
+        assert embedder.encoded == ["Going to sleep mode."]
+        assert store.embeddings.count == 3
+
+    def test_whitespace_normalised_key(self):
+        from orchestrator.voice_loop import EmbeddingCache
+
+        assert EmbeddingCache.key("  Yes   Sir ") == EmbeddingCache.key("Yes Sir")
+
+    def test_lru_eviction(self):
+        from orchestrator.voice_loop import EmbeddingCache
+
+        cache = EmbeddingCache(max_entries=2)
+        cache.put("a", np.zeros(2, dtype=np.float32))
+        cache.put("b", np.zeros(2, dtype=np.float32))
+        assert cache.get("a") is not None  # a becomes most recent
+        cache.put("c", np.zeros(2, dtype=np.float32))
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats() == {"hits": 2, "misses": 1, "size": 2}
+
+
+class TestCompactEmbeddings:
+    def _cfg(self, dtype):
+        return {"memory": {"enabled": True, "semantic_threshold": 0.3, "embedding_dtype": dtype}}
+
+    @pytest.mark.parametrize("dtype,nbytes", [("float32", 256), ("float16", 128), ("int8", 68)])
+    def test_blob_size(self, tmp_db, logger, dtype, nbytes):
+        store = MemoryStore(tmp_db, logger, self._cfg(dtype), embedder=FakeEmbedder())
+        store.add_turn("s", 1, "user", "hello there")
+        store.flush()
+        conn = sqlite3.connect(tmp_db)
+        blob = conn.execute("SELECT embedding FROM conversations").fetchone()[0]
+        conn.close()
+        assert len(blob) == nbytes
+        assert store.embeddings.vecs.dtype.itemsize == nbytes // FakeEmbedder.dim
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_compact_scores_track_float32(self, tmp_path, logger, dtype):
+        texts = ["the cat sat on the mat", "dogs like the park", "the cat likes fish",
+                 "weather in london", "my cat is asleep on the mat"]
+        results = {}
+        for fmt in ("float32", dtype):
+            store = MemoryStore(tmp_path / f"{fmt}.db", logger, self._cfg(fmt), embedder=FakeEmbedder())
+            for i, t in enumerate(texts):
+                store.add_turn("s", i, "user", t)
+            results[fmt] = store.search_semantic("where is the cat", limit=5)
+        assert [c for c, _ in results[dtype]] == [c for c, _ in results["float32"]]
+        for (_, a), (_, b) in zip(results[dtype], results["float32"]):
+            assert a == pytest.approx(b, abs=0.01)
+
+    def test_legacy_raw_float32_migrated(self, tmp_db, logger):
+        # A pre-format database: un-normalised float32 BLOBs and no memory_meta table
+        conn = sqlite3.connect(tmp_db)
+        conn.execute("""
+            CREATE TABLE conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+                turn_num INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, embedding BLOB, metadata TEXT)
+        """)
+        raw = FakeEmbedder().encode("legacy cat note") * 7.0
+        conn.execute("INSERT INTO conversations (session_id, turn_num, role, content, embedding) "
+                     "VALUES ('s', 1, 'user', 'legacy cat note', ?)", (raw.tobytes(),))
+        conn.commit()
+        conn.close()
+
+        store = MemoryStore(tmp_db, logger, self._cfg("float16"), embedder=FakeEmbedder())
+        assert store.get_meta("embedding_format") == "float16"
+        blob = store.pool.reader().execute("SELECT embedding FROM conversations").fetchone()[0]
+        assert len(blob) == FakeEmbedder.dim * 2
+        stored = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        assert np.linalg.norm(stored) == pytest.approx(1.0, abs=1e-3)
+        # Same dimension as the active embedder: labelled and searchable straight away
+        assert store.pool.reader().execute(
+            "SELECT embedding_model, embedding_dim FROM conversations").fetchone() == ("all-MiniLM-L6-v2", 64)
+        assert store.search_semantic("legacy cat", limit=1)[0][0] == "legacy cat note"
+        assert store.search_hybrid("legacy cat", limit=1)[0][0] == "legacy cat note"
+
+    def test_legacy_vectors_of_other_dimension_reembedded_in_background(self, tmp_db, logger):
+        conn = sqlite3.connect(tmp_db)
+        conn.execute("""
+            CREATE TABLE conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+                turn_num INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, embedding BLOB, metadata TEXT)
+        """)
+        conn.executemany("INSERT INTO conversations (session_id, turn_num, role, content, embedding) "
+                         "VALUES ('s', ?, 'user', ?, ?)",
+                         [(1, "legacy cat note", FakeEmbedder().encode("legacy cat note").tobytes()),
+                          (2, "old model locker zebra42", np.ones(32, dtype=np.float32).tobytes())])
+        conn.commit()
+        conn.close()
+
+        store = MemoryStore(tmp_db, logger, self._cfg("float32"), embedder=FakeEmbedder())
+        assert store.search_semantic("legacy cat", limit=1)[0][0] == "legacy cat note"
+        store._reembed_thread.join(10)
+        assert store.pool.reader().execute(
+            "SELECT COUNT(*) FROM conversations WHERE embedding_model IS NULL").fetchone()[0] == 0
+        assert store.search_semantic("locker zebra42", limit=1)[0][0] == "old model locker zebra42"
+
+    def test_format_change_rebuilds_sidecar(self, tmp_db, logger):
+        cfg = self._cfg("float32")
+        cfg["memory"]["embedding_sidecar"] = True
+        store = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        store.add_turn("s", 1, "user", "hello world")
+        store.close()
+
+        cfg["memory"]["embedding_dtype"] = "int8"
+        store = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        assert store.sidecar.row_bytes == FakeEmbedder.dim + 4
+        assert store.verify_sidecar(full=True)["ok"]
+        assert store.embeddings.vecs.dtype == np.int8
+
+
+class TestHybridSearch:
+    def test_fts_query_is_sanitised(self):
+        assert MemoryStore.fts_query("What's the weather in London?") == '"weather" OR "london"'
+        assert MemoryStore.fts_query("is it?") is None
+
+    def test_lexical_match_recalled(self, semantic_store):
+        semantic_store.add_turn("s", 1, "user", "my locker code is zebra42")
+        semantic_store.add_turn("s", 2, "user", "the cat sat on the mat")
+        timings = {}
+        results = semantic_store.search_hybrid("what was zebra42 again", limit=3, timings=timings)
+        assert results[0][0] == "my locker code is zebra42"
+        assert timings["mode"] == "parallel"
+        assert {"fts_ms", "semantic_ms", "fusion_ms", "total_ms"} <= set(timings)
+
+    def test_query_echo_excluded(self, semantic_store):
+        semantic_store.add_turn("s", 1, "user", "remind me about the dentist")
+        results = semantic_store.search_hybrid("remind me about the dentist", limit=3)
+        assert all(c != "remind me about the dentist" for c, _ in results)
+
+    def test_both_lists_fused(self, semantic_store):
+        semantic_store.add_turn("s", 1, "user", "the cat sat on the mat")
+        semantic_store.add_turn("s", 2, "user", "cat food brand is purrfect")
+        semantic_store.add_turn("s", 3, "user", "weather in london")
+        results = semantic_store.search_hybrid("cat sat mat today", limit=3)
+        assert results[0][0] == "the cat sat on the mat"
+        assert all(score > 0 for _, score in results)
+
+    def test_unrelated_single_token_match_excluded(self, semantic_store):
+        semantic_store.add_turn("s", 1, "user", "the dentist moved my appointment to friday")
+        semantic_store.add_turn("s", 2, "user", "we booked the italian restaurant for friday dinner")
+        query = "which restaurant did we book for friday dinner"
+        semantic_store.flush()
+        assert len(semantic_store._rank_fts(query, 10)) == 2
+        results = [c for c, _ in semantic_store.search_hybrid(query, limit=3)]
+        assert results == ["we booked the italian restaurant for friday dinner"]
+
+    def test_prefilter_mode_scores_shortlist(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3,
+                          "hybrid_prefilter_min_rows": 1, "hybrid_prefilter_candidates": 10}}
+        store = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        store.add_turn("s", 1, "user", "the cat sat on the mat")
+        store.add_turn("s", 2, "user", "cat naps in the sun")
+        store.add_turn("s", 3, "user", "parking ticket at the mall")
+        timings = {}
+        results = store.search_hybrid("cat mat", limit=2, timings=timings)
+        assert timings["mode"] == "prefilter"
+        assert "parking ticket at the mall" not in [c for c, _ in results]
+
+    def test_works_without_embedder(self, store):
+        store.add_turn("s", 1, "user", "the weather in London is rainy")
+        results = store.search_hybrid("London weather", limit=3)
+        assert results[0][0] == "the weather in London is rainy"
+
+
+class TestCompaction:
+    def _store(self, tmp_db, logger, embedder=None, **overrides):
+        mem = {"enabled": True, "semantic_threshold": 0.3, "cleanup_enabled": True,
+               "cleanup_interval_s": 0, "cleanup_batch_size": 3}
+        mem.update(overrides)
+        return MemoryStore(tmp_db, logger, {"memory": mem}, embedder=embedder)
+
+    def _fts_count(self, store, term):
+        conn = store.pool.reader()
+        return conn.execute(
+            "SELECT COUNT(*) FROM conversations_fts WHERE conversations_fts MATCH ?", (term,)).fetchone()[0]
+
+    def test_disabled_by_default(self, store):
+        store.add_turn("s", 1, "user", "hello")
+        assert store.compact()["batches"] == 0
+
+    def test_age_limit_deletes_old_rows_and_fts(self, tmp_db, logger):
+        store = self._store(tmp_db, logger, cleanup_age_days=30)
+        for i in range(5):
+            store.add_turn("old", i, "user", f"ancient note {i}")
+        store.add_turn("new", 1, "user", "fresh note")
+        store.flush()
+        with store.pool.write() as conn:
+            conn.execute("UPDATE conversations SET timestamp = '2000-01-01 00:00:00' WHERE session_id = 'old'")
+        stats = store.compact()
+        assert stats["age"] == 5
+        assert stats["batches"] == 2
+        assert self._fts_count(store, "ancient") == 0
+        assert self._fts_count(store, "fresh") == 1
+
+    def test_max_sessions_keeps_newest(self, tmp_db, logger):
+        store = self._store(tmp_db, logger, max_sessions=2)
+        for sid in ["a", "b", "c"]:
+            store.add_turn(sid, 1, "user", f"session {sid} text")
+            store.add_turn(sid, 2, "assistant", f"reply {sid}")
+        store.compact()
+        conn = store.pool.reader()
+        sessions = {r[0] for r in conn.execute("SELECT DISTINCT session_id FROM conversations")}
+        assert sessions == {"b", "c"}
+        assert store.get_session_info("a")["turn_count"] == 0
+        assert store.get_session_info("b")["turn_count"] == 2
+
+    def test_max_history_caps_turns_per_session(self, tmp_db, logger):
+        store = self._store(tmp_db, logger, max_history=4)
+        for i in range(10):
+            store.add_turn("s", i, "user", f"turn {i}")
+        store.add_turn("t", 0, "user", "other session")
+        assert store.compact()["history"] == 6
+        assert [t for _, t in store.get_recent_turns("s", limit=10)] == [f"turn {i}" for i in range(6, 10)]
+        assert store.get_session_info("t")["turn_count"] == 1
+
+    def test_max_history_cutoff_with_shared_turn_numbers(self, tmp_db, logger):
+        store = self._store(tmp_db, logger, max_history=3)
+        for i in range(4):
+            store.add_turn("s", i, "user", f"question {i}")
+            store.add_turn("s", i, "assistant", f"answer {i}")
+        assert store.compact()["history"] == 5
+        assert store.get_recent_turns("s", limit=10) == [
+            ("assistant", "answer 2"), ("user", "question 3"), ("assistant", "answer 3")]
+
+    def test_max_history_cutoffs_use_session_index(self, tmp_db, logger):
+        store = self._store(tmp_db, logger, max_history=2)
+        for i in range(5):
+            store.add_turn("s", i, "user", f"turn {i}")
+        store.flush()
+        conn = store.pool.reader()
+        assert store._history_cutoffs(conn) == [("s", 2, 3)]
+        plan = " ".join(r[-1] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT turn_num, id FROM conversations WHERE session_id = ? "
+            "ORDER BY turn_num DESC, id DESC LIMIT 1 OFFSET 2", ("s",)))
+        assert "idx_conversations_session_turn" in plan and "TEMP B-TREE" not in plan
+
+    def test_deleted_rows_not_recalled(self, tmp_db, logger):
+        store = self._store(tmp_db, logger, embedder=FakeEmbedder(), max_history=1)
+        store.add_turn("s", 1, "user", "my locker code is zebra42")
+        store.add_turn("s", 2, "user", "the cat sat on the mat")
+        store.compact()
+        assert store.search_semantic("locker code zebra42", limit=3) == []
+        assert all("zebra42" not in c for c, _ in store.search_hybrid("locker zebra42", limit=3))
+
+    def test_waits_for_active_turn(self, tmp_db, logger):
+        store = self._store(tmp_db, logger, max_history=1)
+        store.add_turn("s", 1, "user", "one")
+        store.add_turn("s", 2, "user", "two")
+        store.flush()
+        with store.active_turn():
+            store._stop.set()
+            assert store.compact()["batches"] == 0
+        assert store.get_session_info("s")["turn_count"] == 2
+
+
+class TestIntegrityCheck:
+    def _wait_meta(self, store, key, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            value = store.get_meta(key)
+            if value is not None:
+                return value
+            time.sleep(0.02)
+        return None
+
+    def test_background_full_check_recorded(self, store):
+        assert self._wait_meta(store, "integrity_result") == "ok"
+        assert float(store.get_meta("integrity_checked_at")) <= time.time()
+
+    def test_recently_verified_db_not_rescanned(self, tmp_db, logger, caplog):
+        first = MemoryStore(tmp_db, logger, {"memory": {"enabled": True}})
+        checked_at = self._wait_meta(first, "integrity_checked_at")
+        first.close()
+        with caplog.at_level(logging.INFO, logger="test_memory"):
+            second = MemoryStore(tmp_db, logger, {"memory": {"enabled": True}})
+            time.sleep(0.2)
+        assert second.get_meta("integrity_checked_at") == checked_at
+        assert any("db_integrity_check_skipped" in r.getMessage() for r in caplog.records)
+        second.close()
+
+    def test_corruption_goes_through_backup_and_reinit(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True, "integrity_check": "off", "write_behind": False}}
+        store = MemoryStore(tmp_db, logger, cfg)
+        for i in range(300):
+            store.add_turn("s", i, "user", f"filler turn number {i} " * 20)
+        store.close()
+        # Scribble over one interior page's b-tree header; the schema page stays readable
+        raw = bytearray(tmp_db.read_bytes())
+        page = 4096
+        offset = (len(raw) // page // 2) * page
+        raw[offset:offset + 16] = b"\xff" * 16
+        tmp_db.write_bytes(bytes(raw))
+
+        store = MemoryStore(tmp_db, logger, cfg)
+        assert store.verify_integrity() != "ok"
+        assert tmp_db.with_suffix(".db.backup").exists()
+        store.add_turn("fresh", 1, "user", "after recovery")
+        assert store.get_recent_turns("fresh") == [("user", "after recovery")]
+        assert store.get_meta("integrity_result") != "ok"
+
+
+class TestBulkImportExport:
+    def test_export_streams_in_id_order(self, store):
+        for i in range(5):
+            store.add_turn("s", i, "user", f"turn {i}", metadata={"n": i})
+        store.add_turn("t", 1, "assistant", "other")
+        records = list(store.iter_export(chunk=2))
+        assert [r["content"] for r in records] == [f"turn {i}" for i in range(5)] + ["other"]
+        assert records[0]["metadata"] == {"n": 0}
+        assert [r["content"] for r in store.iter_export(session_id="t")] == ["other"]
+
+    def test_round_trip_rebuilds_fts_sessions_and_vectors(self, tmp_path, logger):
+        cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3}}
+        src = MemoryStore(tmp_path / "src.db", logger, cfg, embedder=FakeEmbedder())
+        src.add_turn("a", 1, "user", "my locker code is zebra42")
+        src.add_turn("a", 2, "assistant", "noted")
+        src.add_turn("b", 1, "user", "the cat sat on the mat")
+        exported = list(src.iter_export())
+
+        embedder = TestEmbeddingCache.CountingEmbedder()
+        dst = MemoryStore(tmp_path / "dst.db", logger, cfg, embedder=embedder)
+        stats = dst.import_turns(iter(exported + [{"role": "user"}]), batch_size=2)
+        assert stats["imported"] == 3 and stats["skipped"] == 1 and stats["embedded"] == 3
+        assert len(embedder.encoded) == 3
+        assert dst.embedding_cache.stats()["size"] == 0
+        assert dst.search_fts("zebra42") == ["my locker code is zebra42"]
+        assert dst.get_session_info("a")["turn_count"] == 2
+        assert dst.search_semantic("locker code zebra42", limit=1)[0][0] == "my locker code is zebra42"
+        assert dst.get_meta("import_in_progress") is None
+
+        # Triggers are back after the import
+        dst.add_turn("c", 1, "user", "fresh penguin fact")
+        assert dst.search_fts("penguin") == ["fresh penguin fact"]
+        assert dst.get_session_info("c")["turn_count"] == 1
+
+    def test_import_validates_records(self, tmp_db, logger):
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True}}, embedder=FakeEmbedder())
+        stats = store.import_turns(iter([
+            {"session_id": "s", "turn_num": 1, "role": "user", "content": "good", "timestamp": "2024-03-01 10:00:00"},
+            {"session_id": "s", "turn_num": 2, "role": "user", "content": "bad ts", "timestamp": "yesterday"},
+            {"session_id": "s", "turn_num": "two", "role": "user", "content": "bad turn"},
+            {"session_id": "s", "turn_num": 3, "role": "assistant", "content": "zulu",
+             "timestamp": "2024-03-01T09:30:00Z"},
+            {"session_id": "s", "turn_num": 4, "role": "user", "content": "offset",
+             "timestamp": "2024-03-01T12:00:00+02:00"},
+        ]))
+        assert stats["imported"] == 3 and stats["skipped"] == 2 and stats["embedded"] == 3
+        rows = store.pool.reader().execute("SELECT content, timestamp FROM conversations ORDER BY id").fetchall()
+        assert rows == [("good", "2024-03-01 10:00:00"), ("zulu", "2024-03-01 09:30:00"),
+                        ("offset", "2024-03-01 10:00:00")]
+        assert store.embeddings.count == 3
+
+    def test_import_keeps_existing_session_summaries(self, tmp_db, logger):
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True, "write_behind": False}})
+        store.add_turn("s", 1, "user", "first")
+        store.add_turn("s", 2, "assistant", "second")
+        store.save_summary("s", "User said first.", 2)
+
+        store.import_turns(iter([{"session_id": "s", "turn_num": 3, "role": "user", "content": "third"},
+                                 {"session_id": "t", "turn_num": 1, "role": "user", "content": "other"}]))
+        assert store.get_summary("s") == ("User said first.", 2)
+        assert store.get_session_info("s")["turn_count"] == 3
+        assert store.get_session_info("t")["turn_count"] == 1
+
+    def test_interrupted_import_finished_on_startup(self, tmp_db, logger):
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True, "write_behind": False}})
+
+        def records():
+            yield {"session_id": "s", "turn_num": 1, "role": "user", "content": "walrus migration"}
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            store.import_turns(records(), batch_size=1)
+        with store.pool.write() as conn:
+            # Simulate a crash before the finally block ran
+            conn.execute("DROP TRIGGER conversations_ai")
+            conn.execute("INSERT OR REPLACE INTO memory_meta VALUES ('import_in_progress', '1')")
+            conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES('delete-all')")
+        store.close()
+
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True}})
+        assert store.search_fts("walrus") == ["walrus migration"]
+        assert store.get_meta("import_in_progress") is None
+
+
+class TestReembed:
+    class FailingEmbedder:
+        def encode(self, text, **kwargs):
+            raise RuntimeError("model unavailable")
+
+    class SmallEmbedder(FakeEmbedder):
+        dim = 32
+
+    def _columns(self, store):
+        conn = store.pool.reader()
+        return conn.execute(
+            "SELECT embedding IS NOT NULL, embedding_model, embedding_dim FROM conversations ORDER BY id").fetchall()
+
+    def test_backfills_null_embeddings(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3, "write_behind": False}}
+        broken = MemoryStore(tmp_db, logger, cfg, embedder=self.FailingEmbedder())
+        broken.add_turn("s", 1, "user", "my locker code is zebra42")
+        broken.add_turn("s", 2, "user", "the cat sat on the mat")
+        assert self._columns(broken) == [(0, None, None), (0, None, None)]
+        broken.close()
+
+        store = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        assert store.search_semantic("locker code zebra42") == []
+        stats = store.reembed()
+        assert stats["embedded"] == 2 and stats["failed"] == 0
+        assert self._columns(store) == [(1, "all-MiniLM-L6-v2", 64)] * 2
+        assert store.search_semantic("locker code zebra42", limit=1)[0][0] == "my locker code is zebra42"
+        assert store.get_meta("reembed_checkpoint") is None
+
+    def test_model_change_skips_stale_vectors_until_reembedded(self, tmp_db, logger):
+        old_cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3, "embedding_model": "old"}}
+        old = MemoryStore(tmp_db, logger, old_cfg, embedder=FakeEmbedder())
+        old.add_turn("s", 1, "user", "my locker code is zebra42")
+        old.close()
+
+        new_cfg = {"memory": {"enabled": True, "semantic_threshold": 0.3, "embedding_model": "new"}}
+        store = MemoryStore(tmp_db, logger, new_cfg, embedder=self.SmallEmbedder())
+        assert store.embeddings.count == 0
+        store.add_turn("s", 2, "user", "the cat sat on the mat")
+        assert store.search_semantic("cat sat mat", limit=1)[0][0] == "the cat sat on the mat"
+        assert store.search_semantic("locker code zebra42") == []
+
+        store.reembed()
+        assert self._columns(store) == [(1, "new", 32)] * 2
+        assert store.search_semantic("locker code zebra42", limit=1)[0][0] == "my locker code is zebra42"
+
+    def test_reload_racing_a_write_keeps_ids_unique(self, tmp_db, logger):
+        import threading
+        from contextlib import contextmanager
+
+        cfg = {"memory": {"enabled": True, "write_behind": False}}
+        store = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        store.add_turn("s", 1, "user", "first note")
+        write = store.pool.write
+        reloads = []
+
+        @contextmanager
+        def write_then_reload():
+            with write() as conn:
+                yield conn
+            if not reloads:
+                # Reload between the commit and the matrix append
+                reloads.append(threading.Thread(target=store._reload_embeddings))
+                reloads[0].start()
+                reloads[0].join(0.2)
+
+        store.pool.write = write_then_reload
+        store.add_turn("s", 2, "user", "second note")
+        reloads[0].join()
+        ids = store.embeddings.snapshot()[0]
+        assert sorted(ids.tolist()) == [1, 2]
+
+    def test_resumes_from_checkpoint(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True, "write_behind": False, "reembed_batch_size": 2}}
+        broken = MemoryStore(tmp_db, logger, cfg, embedder=self.FailingEmbedder())
+        for i in range(5):
+            broken.add_turn("s", i, "user", f"turn {i}")
+        broken.close()
+
+        store = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        first = store.reembed(max_chunks=1)
+        assert first["embedded"] == 2
+        store.close()
+
+        store = MemoryStore(tmp_db, logger, cfg, embedder=FakeEmbedder())
+        second = store.reembed()
+        assert second["resumed_from"] == 2 and second["embedded"] == 3
+        assert all(row[0] for row in self._columns(store))
+
+    def test_waits_for_active_turn(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True, "write_behind": False}}
+        store = MemoryStore(tmp_db, logger, cfg, embedder=self.FailingEmbedder())
+        store.add_turn("s", 1, "user", "hello")
+        store.embedder = FakeEmbedder()
+        with store.active_turn():
+            store._stop.set()
+            assert store.reembed()["embedded"] == 0
+
+
+class TestDedupe:
+    def _rows(self, store):
+        store.flush()
+        return store.pool.reader().execute(
+            "SELECT content, ref_count FROM conversations ORDER BY id").fetchall()
+
+    def test_exact_repeat_bumps_existing_row(self, semantic_store):
+        semantic_store.add_turn("s", 1, "user", "What time is it?")
+        semantic_store.add_turn("s", 2, "assistant", "It is 3 PM.")
+        semantic_store.add_turn("s", 3, "user", "what time  is it?")
+        assert self._rows(semantic_store) == [("What time is it?", 2), ("It is 3 PM.", 1),
+                                              ("what time  is it?", 0)]
+        assert semantic_store.embeddings.count == 2
+        assert semantic_store.get_session_info("s")["last_turn_num"] == 3
+        assert semantic_store.get_session_info("s")["turn_count"] == 3
+
+    def test_repeated_turn_stays_in_session_transcript(self, store):
+        store.add_turn("a", 1, "user", "yes")
+        store.add_turn("b", 1, "user", "thanks")
+        store.add_turn("b", 2, "assistant", "You're welcome.")
+        store.add_turn("b", 3, "user", "yes")
+        store.add_turn("b", 4, "user", "thanks")
+        assert store.get_recent_turns("b", limit=10) == [
+            ("user", "thanks"), ("assistant", "You're welcome."), ("user", "yes"), ("user", "thanks")]
+        assert store.get_recent_turns("a") == [("user", "yes")]
+
+    def test_repeats_within_one_batch(self, tmp_db, logger):
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True}})
+        with store.pool.write_lock:
+            for i in range(4):
+                store.add_turn("s", i, "assistant", "Going to sleep.")
+        assert self._rows(store) == [("Going to sleep.", 4)] + [("Going to sleep.", 0)] * 3
+
+    def test_same_text_different_role_kept(self, store):
+        store.add_turn("s", 1, "user", "hello")
+        store.add_turn("s", 2, "assistant", "hello")
+        assert len(self._rows(store)) == 2
+
+    def test_near_duplicate_by_similarity(self, tmp_db, logger):
+        for write_behind in (False, True):
+            cfg = {"memory": {"enabled": True, "dedupe_similarity": 0.9, "write_behind": write_behind}}
+            store = MemoryStore(tmp_db.with_name(f"wb{write_behind}.db"), logger, cfg, embedder=FakeEmbedder())
+            with store.pool.write_lock:
+                store.add_turn("s", 1, "user", "what is the weather in london today")
+                store.add_turn("s", 2, "user", "what is the weather in london today please")
+                store.add_turn("s", 3, "user", "book a table for two")
+            assert [r for _, r in self._rows(store)] == [2, 0, 1]
+            assert store.embeddings.count == 2
+
+    def test_outside_window_inserted_again(self, tmp_db, logger):
+        cfg = {"memory": {"enabled": True, "dedupe_window": 2, "write_behind": False}}
+        store = MemoryStore(tmp_db, logger, cfg)
+        store.add_turn("s", 1, "user", "ping")
+        store.add_turn("s", 2, "user", "one")
+        store.add_turn("s", 3, "user", "two")
+        store.add_turn("s", 4, "user", "ping")
+        assert [c for c, _ in self._rows(store)].count("ping") == 2
+
+    def test_bump_leaves_other_rows_history_alone(self, semantic_store):
+        semantic_store.add_turn("a", 1, "user", "my locker code is zebra42")
+        semantic_store.flush()
+        before = semantic_store.pool.reader().execute(
+            "SELECT timestamp FROM conversations WHERE session_id = 'a'").fetchone()[0]
+        semantic_store.add_turn("b", 1, "user", "my locker code is zebra42")
+        semantic_store.flush()
+        after = semantic_store.pool.reader().execute(
+            "SELECT timestamp FROM conversations WHERE session_id = 'a'").fetchone()[0]
+        assert after == before
+        assert semantic_store.get_session_info("a")["turn_count"] == 1
+        assert semantic_store.get_recent_turns("b") == [("user", "my locker code is zebra42")]
+
+
+class TestShards:
+    def _store(self, tmp_db, logger, **overrides):
+        mem = {"enabled": True, "semantic_threshold": 0.3, "write_behind": False, "dedupe_enabled": False}
+        mem.update(overrides)
+        return MemoryStore(tmp_db, logger, {"memory": mem}, embedder=FakeEmbedder())
+
+    def _age(self, store, content, ts):
+        with store.pool.write() as conn:
+            conn.execute("UPDATE conversations SET timestamp = ? WHERE content = ?", (ts, content))
+
+    def test_archive_moves_old_months_to_read_only_shards(self, tmp_db, logger):
+        store = self._store(tmp_db, logger)
+        store.add_turn("old", 1, "user", "my locker code is zebra42")
+        store.add_turn("old", 2, "user", "the penguin enclosure opens at nine")
+        store.add_turn("new", 1, "user", "the cat sat on the mat")
+        self._age(store, "my locker code is zebra42", "2024-01-05 10:00:00")
+        self._age(store, "the penguin enclosure opens at nine", "2024-02-05 10:00:00")
+
+        stats = store.archive_shards(hot_months=1)
+        assert [m["month"] for m in stats["months"]] == ["2024-01", "2024-02"]
+        assert stats["archived"] == 2
+        assert [s["month"] for s in store.shards.stats()] == ["2024-02", "2024-01"]
+        shard = store.shards.paths()[-1]
+        assert shard.stat().st_mode & 0o222 == 0
+        conn = store.pool.reader()
+        assert conn.execute("SELECT COUNT(*) FROM main.conversations").fetchone()[0] == 1
+        assert store.get_session_info("old")["turn_count"] == 0
+
+        # Archiving again is a no-op
+        assert store.archive_shards(hot_months=1)["archived"] == 0
+
+    def test_searches_fan_out_only_when_hot_recall_short(self, tmp_db, logger):
+        store = self._store(tmp_db, logger)
+        store.add_turn("old", 1, "user", "my locker code is zebra42")
+        store.add_turn("new", 1, "user", "the cat sat on the mat")
+        self._age(store, "my locker code is zebra42", "2024-01-05 10:00:00")
+        store.archive_shards(hot_months=1)
+
+        assert store.search_fts("zebra42") == ["my locker code is zebra42"]
+        assert store.search_semantic("locker code zebra42", limit=1)[0][0] == "my locker code is zebra42"
+        assert store.search_hybrid("what was zebra42", limit=3)[0][0] == "my locker code is zebra42"
+        # Enough hot hits: cold shards are not consulted
+        assert store.search_fts("cat", limit=1) == ["the cat sat on the mat"]
+
+    def test_dropping_a_month_is_a_file_delete(self, tmp_db, logger):
+        store = self._store(tmp_db, logger)
+        store.add_turn("old", 1, "user", "my locker code is zebra42")
+        self._age(store, "my locker code is zebra42", "2024-01-05 10:00:00")
+        store.archive_shards(hot_months=1)
+        assert store.search_fts("zebra42") == ["my locker code is zebra42"]
+        for path in store.shards.paths():
+            path.unlink()
+        assert store.search_fts("zebra42") == []
+
+
+class TestOnnxEmbedder:
+    """Pooling/batching logic with a stand-in session and tokenizer (no model files)."""
+
+    class Encoding:
+        def __init__(self, ids, length):
+            self.ids = ids + [0] * (length - len(ids))
+            self.attention_mask = [1] * len(ids) + [0] * (length - len(ids))
+            self.type_ids = [0] * length
+
+    class Tokenizer:
+        def enable_truncation(self, max_length):
+            self.max_length = max_length
+
+        def enable_padding(self, **kwargs):
+            pass
+
+        def encode_batch(self, texts):
+            ids = [[zlib.crc32(w.encode()) % 997 + 1 for w in t.split()][:self.max_length] for t in texts]
+            length = max(len(i) for i in ids)
+            return [TestOnnxEmbedder.Encoding(i, length) for i in ids]
+
+    class Session:
+        def __init__(self):
+            self.table = np.random.default_rng(0).standard_normal((1000, 16)).astype(np.float32)
+            self.table[0] = 100.0  # padding rows must not leak into the pooled vector
+            self.batches = []
+
+        def get_inputs(self):
+            return [type("Input", (), {"name": n})() for n in ("input_ids", "attention_mask", "token_type_ids")]
+
+        def run(self, outputs, feeds):
+            self.batches.append(len(feeds["input_ids"]))
+            return [self.table[feeds["input_ids"]]]
+
+    def _embedder(self):
+        return OnnxEmbedder(self.Session(), self.Tokenizer(), max_length=8)
+
+    def test_single_text_is_unit_mean_of_tokens(self):
+        emb = self._embedder()
+        vec = emb.encode("hello there world")
+        ids = [zlib.crc32(w.encode()) % 997 + 1 for w in "hello there world".split()]
+        expected = emb.session.table[ids].mean(axis=0)
+        np.testing.assert_allclose(vec, expected / np.linalg.norm(expected), rtol=1e-5)
+        assert vec.dtype == np.float32 and vec.shape == (16,)
+
+    def test_batch_matches_single_and_keeps_order(self):
+        emb = self._embedder()
+        texts = ["a much longer sentence with many words", "short", "medium length text"]
+        batch = emb.encode(texts, batch_size=2)
+        assert emb.session.batches == [2, 1]
+        for text, vec in zip(texts, batch):
+            np.testing.assert_allclose(vec, emb.encode(text), rtol=1e-5, atol=1e-6)
+
+    def test_plugs_into_memory_store(self, tmp_db, logger):
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True, "semantic_threshold": 0.3}},
+                            embedder=self._embedder())
+        store.add_turn("s", 1, "user", "my locker code is zebra42")
+        store.add_turn("s", 2, "user", "the cat sat on the mat")
+        assert store.search_semantic("locker code zebra42", limit=1)[0][0] == "my locker code is zebra42"
+
+    def test_missing_runtime_disables_semantic_search(self, tmp_db, logger, monkeypatch):
+        import orchestrator.voice_loop as vl
+        monkeypatch.setattr(vl, "ONNX_EMBEDDINGS_AVAILABLE", False)
+        store = MemoryStore(tmp_db, logger, {"memory": {"enabled": True, "embedding_backend": "onnx"}})
+        assert store.embedder is None
+        assert store.search_semantic("anything") == []
+
+
+class TestBenchmark:
+    def test_bench_smoke(self, tmp_path):
+        from tests.bench_memory_store import main as bench_main
+
+        out = tmp_path / "bench.json"
+        report = bench_main(["--sizes", "200", "--dim", "16", "--queries", "5", "--add-turns", "10",
+                             "--cold-starts", "1", "--output", str(out)])
+        result = report["results"][0]
+        assert result["turns"] == 200
+        for op in ("add_turn", "get_recent_turns", "search_semantic", "search_fts",
+                   "get_latest_session", "cold_start"):
+            assert {"p50_ms", "p95_ms", "p99_ms"} <= set(result[op])
+        assert result["rss_mb"] > 0
+        assert json.loads(out.read_text())["results"][0]["turns"] == 200